@@ -0,0 +1,104 @@
+"""
+A local stand-in for the web services the plugins talk to, so handler
+latency can be measured without the network.
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from contextlib import contextmanager
+import json
+import re
+from SocketServer import ThreadingMixIn
+import threading
+import time
+import urlparse
+
+from mock import patch
+import requests
+
+WOLFRAM_ANSWER = """<queryresult success="true">
+<pod id="Input" title="Input interpretation"><subpod>
+<plaintext>{0}</plaintext></subpod></pod>
+<pod id="Result" title="Result"><subpod><plaintext>42</plaintext></subpod></pod>
+</queryresult>"""
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    """
+    Answers like GitHub, JIRA, Jenkins, Wolfram|Alpha and Google image
+    search would, after `server.latency` seconds
+    """
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse.urlsplit(self.path)
+        query = urlparse.parse_qs(url.query)
+        if '/issues/' in url.path:
+            issue = url.path.rsplit('/', 1)[-1]
+            self.send_json({'title': 'Issue ' + issue,
+                            'html_url': 'https://github.com' + url.path},
+                           ETag='"{0}"'.format(issue))
+        elif url.path.endswith('/search'):
+            keys = re.findall(r'[A-Z]+-\d+', query['jql'][0])
+            self.send_json({'issues': [
+                {'key': key, 'fields': {'summary': 'Summary of ' + key}}
+                for key in keys]})
+        elif url.path.endswith('/project'):
+            self.send_json([{'key': 'PROJ'}, {'key': 'CORE'}])
+        elif url.path.endswith('/query'):
+            self.send(WOLFRAM_ANSWER.format(query['input'][0]), 'text/xml')
+        elif url.path.endswith('/images'):
+            self.send_json({'responseData': {'results': [
+                {'unescapedUrl': 'http://example.com/image.png'}]}})
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        self.send('', 'text/plain')
+
+    def send_json(self, data, **headers):
+        self.send(json.dumps(data), 'application/json', **headers)
+
+    def send(self, body, content_type, **headers):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeServiceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    latency = 0
+
+
+@contextmanager
+def fake_services(latency=0):
+    """
+    Runs a `FakeServiceServer` and sends every request made with
+    `requests`, whatever its URL, to it instead
+    """
+    server = FakeServiceServer(('127.0.0.1', 0), FakeServiceHandler)
+    server.latency = latency
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    netloc = '127.0.0.1:{0}'.format(server.server_address[1])
+    request = requests.Session.request
+
+    def redirected(session, method, url, *args, **kwargs):
+        url = urlparse.urlsplit(url)
+        url = urlparse.urlunsplit(('http', netloc, url.path, url.query, ''))
+        return request(session, method, url, *args, **kwargs)
+
+    try:
+        with patch.object(requests.Session, 'request', redirected):
+            yield server
+    finally:
+        server.shutdown()
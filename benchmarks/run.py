@@ -0,0 +1,384 @@
+"""
+Benchmarks for the router, storage use and plugin handlers, run on a
+synthetic channel log with the web services replaced by local fakes.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py dispatch storage_ops --baseline results.json
+
+Results are written as JSON. Each one has a `benchmark`, a `name`, a
+`value` in `unit` and whether higher is better. Given a `--baseline`
+from an earlier run, results that got worse by more than `--tolerance`
+are listed and the exit status is 1.
+"""
+import argparse
+from collections import Counter, defaultdict, OrderedDict
+import datetime
+import gc
+from importlib import import_module
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botbot_plugins.base import BasePlugin, DummyApp, MultiChannelApp
+from botbot_plugins.engines import (LogEngine, MemoryEngine, RedisEngine,
+                                    SqliteEngine)
+from fakes import fake_services
+import sharded
+from synthetic import (LOCAL_PLUGINS, NETWORK_CONFIG, NETWORK_PLUGINS,
+                       channel_log)
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def result(benchmark, name, value, unit, higher_is_better=True, **extra):
+    extra.update(benchmark=benchmark, name=name, value=round(value, 4),
+                 unit=unit, higher_is_better=higher_is_better)
+    return extra
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class TimedApp(DummyApp):
+    """Records how long each handler call takes"""
+
+    def __init__(self, *args, **kwargs):
+        # '<plugin slug>.<handler name>' -> seconds per call
+        self.timings = defaultdict(list)
+        DummyApp.__init__(self, *args, **kwargs)
+
+    def call_handler(self, func, line, kwargs):
+        started = timeit.default_timer()
+        try:
+            return DummyApp.call_handler(self, func, line, kwargs)
+        finally:
+            self.timings['{0}.{1}'.format(func.im_self.slug, func.__name__)
+                         ].append(timeit.default_timer() - started)
+
+
+class CountingStorage(object):
+    """
+    Wraps a Redis client, counting the commands sent per plugin (by key
+    prefix) and the round-trips made
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.commands = Counter()
+        self.round_trips = 0
+
+    def count(self, args):
+        key = args[0] if args else ''
+        if isinstance(key, (dict, list, tuple)):
+            key = next(iter(key), '')
+        if isinstance(key, basestring):
+            self.commands[key.split(':', 1)[0]] += 1
+
+    def pipeline(self, *args, **kwargs):
+        return CountingPipeline(self, self.storage.pipeline(*args, **kwargs))
+
+    def __getattr__(self, name):
+        command = getattr(self.storage, name)
+
+        def counted(*args, **kwargs):
+            self.count(args)
+            self.round_trips += 1
+            return command(*args, **kwargs)
+        return counted
+
+
+class CountingPipeline(object):
+
+    def __init__(self, counter, pipe):
+        self.counter = counter
+        self.pipe = pipe
+
+    def execute(self):
+        self.counter.round_trips += 1
+        return self.pipe.execute()
+
+    def __getattr__(self, name):
+        command = getattr(self.pipe, name)
+
+        def counted(*args, **kwargs):
+            self.counter.count(args)
+            return command(*args, **kwargs)
+        return counted
+
+
+def build_app(slugs, app_class=DummyApp, storage=None):
+    """An app with the given plugins registered and configured"""
+    app = app_class(storage=storage)
+    # don't echo routes and responses
+    app.test_mode = True
+    app.storage.flushdb()
+    for slug in slugs:
+        plugin = import_module('botbot_plugins.plugins.' + slug).Plugin()
+        app.register(plugin)
+        if slug in NETWORK_CONFIG:
+            app.set_config(slug, NETWORK_CONFIG[slug])
+        if slug == 'jira':
+            plugin.refresh_interval = 0
+            app.storage.set('jira:projects', json.dumps(['PROJ', 'CORE']))
+    return app
+
+
+def replay(app, packets):
+    for _ in app.respond_many(packets):
+        pass
+
+
+@benchmark
+def dispatch(args):
+    """Lines per second through `DummyApp.dispatch` as plugins are added"""
+    packets = list(channel_log(args.lines))
+    slugs = LOCAL_PLUGINS + NETWORK_PLUGINS
+    results = []
+    for count in range(1, len(slugs) + 1):
+        app = build_app(slugs[:count])
+        started = timeit.default_timer()
+        replay(app, packets)
+        seconds = timeit.default_timer() - started
+        results.append(result('dispatch', 'plugins={0}'.format(count),
+                              len(packets) / seconds, 'lines/s',
+                              plugins=slugs[:count]))
+    return results
+
+
+@benchmark
+def handler_latency(args):
+    """Milliseconds per call of each handler, web services faked"""
+    packets = list(channel_log(args.lines, network=True))
+    with fake_services(args.latency):
+        app = build_app(LOCAL_PLUGINS + NETWORK_PLUGINS, TimedApp)
+        replay(app, packets)
+    results = []
+    for handler, timings in sorted(app.timings.items()):
+        results.append(result(
+            'handler_latency', handler, percentile(timings, 0.95) * 1000,
+            'ms (p95)', higher_is_better=False, calls=len(timings),
+            mean_ms=sum(timings) * 1000 / len(timings),
+            p50_ms=percentile(timings, 0.5) * 1000,
+            max_ms=max(timings) * 1000))
+    return results
+
+
+@benchmark
+def storage_ops(args):
+    """Storage commands and round-trips per line, per plugin"""
+    packets = list(channel_log(args.lines, network=True))
+    with fake_services(args.latency):
+        app = build_app(LOCAL_PLUGINS + NETWORK_PLUGINS)
+        storage = app.storage = CountingStorage(app.storage)
+        replay(app, packets)
+    lines = float(len(packets))
+    results = [result('storage_ops', 'round_trips',
+                      storage.round_trips / lines, 'round-trips/line',
+                      higher_is_better=False)]
+    for slug, commands in sorted(storage.commands.items()):
+        results.append(result('storage_ops', slug, commands / lines,
+                              'commands/line', higher_is_better=False))
+    return results
+
+
+def resident_memory():
+    """Bytes of memory the process uses now, or at its peak"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        # kilobytes on Linux, bytes on OS X
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _channel_memory(channels, lines_per_channel, queue):
+    app = build_app(LOCAL_PLUGINS, MultiChannelApp)
+    replay(app, channel_log(lines_per_channel, channels=1))
+    gc.collect()
+    before = resident_memory()
+    replay(app, channel_log(channels * lines_per_channel, channels=channels,
+                            seed=1))
+    gc.collect()
+    queue.put(resident_memory() - before)
+
+
+@benchmark
+def channel_memory(args):
+    """
+    Memory per channel of a `MultiChannelApp`, storage included, each
+    measured in a new process
+    """
+    results = []
+    for channels in (100, 1000, 5000):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_channel_memory, args=(channels, 10, queue))
+        process.start()
+        grown = queue.get()
+        process.join()
+        results.append(result('channel_memory', 'channels={0}'.format(channels),
+                              float(grown) / channels, 'bytes/channel',
+                              higher_is_better=False))
+    return results
+
+
+@benchmark
+def sharded_dispatch(args):
+    """Lines per second through `ShardedRunner`, per process count"""
+    packets = list(channel_log(args.lines, channels=200))
+    return [sharded.run(packets, processes, 100)
+            for processes in range(1, multiprocessing.cpu_count() + 1)]
+
+
+def storage_engines(args, directory):
+    """The engines to benchmark, by name"""
+    engines = [('memory', MemoryEngine()),
+               ('log', LogEngine(os.path.join(directory, 'botbot.log'))),
+               # the durability of fsyncing every write, for comparison
+               ('log-fsync-each', LogEngine(os.path.join(directory, 'each.log'),
+                                            sync_interval=0)),
+               ('sqlite', SqliteEngine(os.path.join(directory, 'botbot.db')))]
+    if args.redis:
+        engines.append(('redis', RedisEngine(args.redis)))
+    return engines
+
+
+def storage_calls(plugin, count):
+    """The plugin storage calls a handler typically makes, `count` times"""
+    for index in xrange(count):
+        key = 'key{0}'.format(index % 100)
+        plugin.store(key, u'value {0}'.format(index))
+        plugin.retrieve(key)
+        plugin.incr('counter')
+        plugin.push('queue', index, max_length=50)
+    plugin.pop_all('queue')
+
+
+@benchmark
+def engines(args):
+    """
+    Storage calls per second, and lines per second through the local
+    plugins, with each storage engine (Redis with --redis)
+    """
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        packets = list(channel_log(args.lines))
+        for name, engine in storage_engines(args, directory):
+            plugin = BasePlugin()
+            plugin.app = build_app([], storage=engine)
+            count = max(args.lines / 10, 1)
+            started = timeit.default_timer()
+            storage_calls(plugin, count)
+            seconds = timeit.default_timer() - started
+            results.append(result('engines', name + ' calls',
+                                  count * 4 / seconds, 'calls/s'))
+            app = build_app(LOCAL_PLUGINS, storage=engine)
+            started = timeit.default_timer()
+            replay(app, packets)
+            seconds = timeit.default_timer() - started
+            results.append(result('engines', name + ' dispatch',
+                                  len(packets) / seconds, 'lines/s'))
+            if hasattr(engine, 'close'):
+                engine.close()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'commit': commit,
+            'date': datetime.datetime.utcnow().isoformat() + 'Z'}
+
+
+def regressions(results, baseline, tolerance):
+    """The results worse than the same result in `baseline` by `tolerance`"""
+    previous = dict(((old['benchmark'], old['name']), old)
+                    for old in baseline['results'])
+    worse = []
+    for new in results:
+        old = previous.get((new['benchmark'], new['name']))
+        if not old or not old['value']:
+            continue
+        change = (new['value'] - old['value']) / float(old['value'])
+        if not new['higher_is_better']:
+            change = -change
+        if change < -tolerance:
+            worse.append((new, old, change))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run, all of them by default: '
+                             + ', '.join(BENCHMARKS))
+    parser.add_argument('--lines', type=int, default=5000,
+                        help='lines in the synthetic log')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds the fake web services take to answer')
+    parser.add_argument('--redis', metavar='URL',
+                        help='Redis server the engines benchmark also uses '
+                             '(its database is flushed)')
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--baseline', help='results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(sorted(unknown)))
+
+    results = []
+    for name in args.benchmarks or BENCHMARKS:
+        started = time.time()
+        results.extend(BENCHMARKS[name](args))
+        sys.stderr.write('{0}: {1:.1f}s\n'.format(name, time.time() - started))
+    report = {'meta': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            worse = regressions(results, json.load(baseline), args.tolerance)
+        for new, old, change in worse:
+            sys.stderr.write('{0} {1}: {2} -> {3} {4} ({5:+.0%})\n'.format(
+                new['benchmark'], new['name'], old['value'], new['value'],
+                new['unit'], change))
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Lines per second through `ShardedRunner` with 1 up to `--processes`
+worker processes, one JSON object per run:
+
+    python benchmarks/sharded.py --lines 100000 --processes 4
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botbot_plugins.sharding import ShardedRunner, plugin_app
+from synthetic import LOCAL_PLUGINS, channel_log
+
+
+def run(packets, processes, batch_size):
+    runner = ShardedRunner(functools.partial(plugin_app, LOCAL_PLUGINS),
+                           processes=processes, batch_size=batch_size)
+    runner.start()
+    started = time.time()
+    count = sum(1 for _ in runner.respond_many(packets))
+    seconds = time.time() - started
+    runner.stop()
+    return {'benchmark': 'sharded_dispatch',
+            'name': 'processes={0}'.format(processes),
+            'value': round(count / seconds, 4),
+            'unit': 'lines/s',
+            'higher_is_better': True,
+            'processes': processes,
+            'batch_size': batch_size,
+            'lines': count,
+            'seconds': round(seconds, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    packets = list(channel_log(args.lines, channels=args.channels))
+    for processes in range(1, args.processes + 1):
+        print(json.dumps(run(packets, processes, args.batch_size),
+                         sort_keys=True))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+A made up multi-channel IRC log for the benchmarks.
+"""
+import random
+
+# Plugins that don't talk to external services
+LOCAL_PLUGINS = ['bangmotivate', 'brain', 'last_seen', 'message_service',
+                 'ping']
+# Plugins calling web services, see `fakes`, and the config they need
+NETWORK_PLUGINS = ['github', 'images', 'jenkins', 'jira', 'wolfram']
+NETWORK_CONFIG = {
+    'github': {'organization': 'org', 'repo': 'repo'},
+    'jenkins': {'url': 'http://jenkins.example.com'},
+    'jira': {'jira_url': 'https://jira.example.com/', 'bot_name': 'bot'},
+    'wolfram': {'app_id': 'benchmark'},
+}
+
+WORDS = (u'the deploy is green again but the migration on staging took '
+         u'forever so someone should look at the index before friday').split()
+
+
+def _chatter(rand):
+    return u' '.join(rand.choice(WORDS) for _ in range(rand.randint(3, 15)))
+
+
+# (share of the lines, line maker) of the kinds of lines in the log
+LINE_KINDS = (
+    (70, lambda rand, nick: {'text': _chatter(rand)}),
+    (5, lambda rand, nick: {'text': u'!m ' + nick}),
+    (5, lambda rand, nick: {'text': u'@ping'}),
+    (5, lambda rand, nick: {'text': u'@{0}={1}'.format(rand.choice(WORDS),
+                                                      _chatter(rand))}),
+    (5, lambda rand, nick: {'text': u'@{0}?'.format(rand.choice(WORDS))}),
+    (5, lambda rand, nick: {'text': u'@seen ' + nick}),
+    (3, lambda rand, nick: {'text': u'', 'Command': 'JOIN'}),
+    (2, lambda rand, nick: {'text': u'@message {0} {1}'.format(
+        nick, _chatter(rand))}),
+)
+
+# Lines for the `NETWORK_PLUGINS`, mixed in when asked for
+NETWORK_LINE_KINDS = (
+    (2, lambda rand, nick: {'text': u'see gh:repo#{0}'.format(
+        rand.randint(1, 500))}),
+    (2, lambda rand, nick: {'text': u'fixed in gh#{0}'.format(
+        rand.randint(1, 500))}),
+    (2, lambda rand, nick: {'text': u'PROJ-{0} and CORE-{1} again'.format(
+        rand.randint(1, 500), rand.randint(1, 500))}),
+    (1, lambda rand, nick: {'text': u'@what is {0} plus {1}?'.format(
+        rand.randint(1, 99), rand.randint(1, 99))}),
+    (1, lambda rand, nick: {'text': u'@image me ' + rand.choice(WORDS)}),
+    (1, lambda rand, nick: {'text': u'@jenkins build proj'}),
+)
+
+
+def channel_log(lines, channels=50, users=20, seed=0, network=False):
+    """
+    Yields `lines` packets (dicts like the `DummyApp.respond` kwargs plus
+    `text`) from `users` nicks in each of `channels` channels, including
+    lines for the `NETWORK_PLUGINS` if `network` is True. The same
+    arguments always give the same log.
+    """
+    rand = random.Random(seed)
+    kinds = []
+    line_kinds = LINE_KINDS + (NETWORK_LINE_KINDS if network else ())
+    for share, make_line in line_kinds:
+        kinds.extend([make_line] * share)
+    for _ in range(lines):
+        channel = u'#channel{0}'.format(rand.randrange(channels))
+        packet = rand.choice(kinds)(rand, u'nick{0}'.format(
+            rand.randrange(users)))
+        packet.update(Channel=channel,
+                      User=u'nick{0}'.format(rand.randrange(users)))
+        yield packet
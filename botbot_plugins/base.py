@@ -1,8 +1,16 @@
 from cmd import Cmd
-import re
+from contextlib import contextmanager
 import sys
+import threading
+import time
 
-import fakeredis
+from .cache import LRUCache
+from .engines import MemoryEngine
+from .executor import LaneExecutor, SHED, Timeout, WorkerPool
+from .metrics import now
+from .profiling import Profiler
+from .routing import Route
+from .storage import WriteBuffer
 
 class PrivateMessage(object):
     """
@@ -14,43 +22,169 @@ class PrivateMessage(object):
         self.msg = msg
 
 
+# stands in for a value that isn't cached
+MISSING = object()
+
+
+class SharedHttpClient(object):
+    """
+    `BasePlugin.http`, made on first use so that importing the plugins
+    doesn't load `requests` until one of them makes a request. Plugins
+    get it wrapped to report to their app's metrics sink.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        if self.client is None:
+            with self.lock:
+                if self.client is None:
+                    from .http import HttpClient
+                    self.client = HttpClient()
+        if instance is None:
+            return self.client
+        from .http import PluginHttpClient
+        return PluginHttpClient(self.client, instance)
+
+
 class BasePlugin(object):
     "All plugins inherit this class"
     app = None
     config_class = None
+    # shared by every plugin, see `botbot_plugins.http`
+    http = SharedHttpClient()
+    # how many retrieved values are kept in memory, and for how many
+    # seconds at most (writes by other processes show up after that)
+    read_cache_size = None
+    read_cache_ttl = 60
 
     def __init__(self, *args, **kwargs):
         self.slug = self.__module__.split('.')[-1]
+        # the pipeline each thread has open, see `pipeline`
+        self._local = threading.local()
+        # values read from storage, dropped when written to through the
+        # methods below
+        self.read_cache = None
+        if self.read_cache_size:
+            self.read_cache = LRUCache(self.read_cache_size,
+                                       self.read_cache_ttl)
+        # counts writes, so a read that raced with one isn't cached
+        self._writes = 0
+        self._cache_lock = threading.Lock()
 
     @property
     def config(self):
         if hasattr(self, 'prod_config'):
             return self.prod_config
-        if self.slug in self.app.plugin_configs:
-            return self.app.plugin_configs[self.slug].fields
-        return None
+        return self.app.config_for(self.slug)
+
+    def _storage(self):
+        """The storage client the methods below talk to"""
+        return self.app.storage
+
+    def _backend(self):
+        """The storage, reporting to the app's metrics sink if it has one"""
+        storage = self._storage()
+        if self.app.metrics is not None:
+            return self.app.metrics.storage(storage, self.slug)
+        return storage
+
+    def _client(self):
+        """The open pipeline if there is one, otherwise the storage"""
+        pipe = getattr(self._local, 'pipe', None)
+        if pipe is not None:
+            return pipe
+        return self._backend()
+
+    def flush(self):
+        """Writes out anything the plugin holds back from storage"""
+        pass
 
     def _unique_key(self, key):
         """helper method for namespacing storage keys per plugin"""
-        return u'{0}:{1}'.format(self.slug, key.strip())
+        return u'{0}:{1}'.format(self.app.namespace_for(self.slug),
+                                 key.strip())
+
+    def _reading(self, method):
+        """Raises `ValueError` if a pipeline is open, as reads can't wait"""
+        if getattr(self._local, 'pipe', None) is not None:
+            raise ValueError('{0} is called in a pipeline, which only reads '
+                             'storage once the block exits'.format(method))
+
+    def _invalidate(self, ukeys):
+        """Drops keys from the read cache, and fails reads under way"""
+        with self._cache_lock:
+            self._writes += 1
+            for ukey in ukeys:
+                self.read_cache.invalidate(ukey)
+
+    def _cache_read(self, ukey, value, writes):
+        """Caches a value read, unless there were writes since `writes`"""
+        with self._cache_lock:
+            if writes == self._writes:
+                self.read_cache.set(ukey, value)
+
+    @contextmanager
+    def _writing(self, *ukeys):
+        """
+        Drops the keys written to in the block from the read cache, before
+        the write so this thread doesn't read its old value, and after it
+        so a read racing with the write doesn't cache the old value either
+        """
+        if self.read_cache is None:
+            yield
+            return
+        self._invalidate(ukeys)
+        written = getattr(self._local, 'written', None)
+        if written is not None:
+            # the write happens when the pipeline runs
+            written.update(ukeys)
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._invalidate(ukeys)
 
-    def store(self, key, value):
-        """Stores `value` as a string to `key`
+    def _ttl(self, ttl):
+        """`ttl`, or the plugin's default if it's None; None for no expiry"""
+        if ttl is None and self.config_class is not None:
+            ttl = self.config_class.storage_ttl
+        return ttl or None
+
+    def store(self, key, value, ttl=None):
+        """Stores `value` as a string to `key`, for `ttl` seconds. By
+        default that's the `storage_ttl` of the plugin's config; pass 0
+        to keep the value until it's deleted.
 
         SET: http://redis.io/commands/set
         """
         ukey = self._unique_key(key)
-        self.app.storage.set(ukey, unicode(value).encode('utf-8'))
+        with self._writing(ukey):
+            self._client().set(ukey, unicode(value).encode('utf-8'),
+                               ex=self._ttl(ttl))
 
     def retrieve(self, key):
         """Retrieves string stored at `key`
 
         GET: http://redis.io/commands/get
         """
+        self._reading('retrieve')
         ukey = self._unique_key(key)
-        value = self.app.storage.get(ukey)
+        cache = self.read_cache
+        if cache is not None:
+            value = cache.get(ukey, MISSING)
+            if value is not MISSING:
+                return value
+            writes = self._writes
+        value = self._client().get(ukey)
         if value:
             value = unicode(value, 'utf-8')
+        # unless it was written meanwhile, and may be stale already
+        if cache is not None:
+            self._cache_read(ukey, value, writes)
         return value
 
     def delete(self, key):
@@ -59,7 +193,8 @@ class BasePlugin(object):
         DEL: http://redis.io/commands/del
         """
         ukey = self._unique_key(key)
-        return self.app.storage.delete(ukey) == 1
+        with self._writing(ukey):
+            return self._client().delete(ukey) == 1
 
     def incr(self, key):
         """Increments counter specified by `key`. If necessary, creates
@@ -68,7 +203,134 @@ class BasePlugin(object):
         INCR http://redis.io/commands/incr
         """
         ukey = self._unique_key(key)
-        return self.app.storage.incr(ukey)
+        with self._writing(ukey):
+            return self._client().incr(ukey)
+
+    def expire(self, key, seconds):
+        """Has storage delete `key` after `seconds`
+
+        EXPIRE: http://redis.io/commands/expire
+        """
+        ukey = self._unique_key(key)
+        with self._writing(ukey):
+            return self._client().expire(ukey, seconds)
+
+    def touch(self, key, ttl=None):
+        """Has storage keep `key` for another `ttl` seconds, by default
+        the `storage_ttl` of the plugin's config. Returns False if there
+        is no such key.
+
+        EXPIRE: http://redis.io/commands/expire
+        """
+        ttl = self._ttl(ttl)
+        if not ttl:
+            raise ValueError('touch needs a ttl, the plugin has no default')
+        return self.expire(key, ttl)
+
+    def push(self, key, value, max_length=None, ttl=None):
+        """Appends `value` as a string to the list at `key`. If
+        `max_length` is given, only that many of the newest items are kept.
+        The list is kept for `ttl` seconds from now, as with `store`.
+
+        RPUSH: http://redis.io/commands/rpush
+        LTRIM: http://redis.io/commands/ltrim
+        """
+        ukey = self._unique_key(key)
+        ttl = self._ttl(ttl)
+        with self.pipeline():
+            self._client().rpush(ukey, unicode(value).encode('utf-8'))
+            if max_length:
+                self._client().ltrim(ukey, -max_length, -1)
+            if ttl:
+                self._client().expire(ukey, ttl)
+
+    def pop_all(self, key):
+        """Retrieves and deletes the list of strings at `key` in one
+        transaction, so items pushed meanwhile are never lost
+
+        LRANGE: http://redis.io/commands/lrange
+        """
+        ukey = self._unique_key(key)
+        pipe = self._backend().pipeline(transaction=True)
+        pipe.lrange(ukey, 0, -1)
+        pipe.delete(ukey)
+        values = pipe.execute()[0]
+        return [unicode(value, 'utf-8') for value in values]
+
+    def store_many(self, mapping, ttl=None):
+        """Stores each value in `mapping` as a string to its key, for
+        `ttl` seconds as with `store`
+
+        MSET: http://redis.io/commands/mset
+        """
+        ttl = self._ttl(ttl)
+        if ttl:
+            # MSET can't set an expiry
+            with self.pipeline():
+                for key, value in mapping.items():
+                    self.store(key, value, ttl)
+            return
+        values = dict((self._unique_key(key), unicode(value).encode('utf-8'))
+                      for key, value in mapping.items())
+        with self._writing(*values):
+            self._client().mset(values)
+
+    def retrieve_many(self, keys):
+        """Retrieves the strings stored at each of `keys`, in order.
+        Missing keys are None.
+
+        MGET: http://redis.io/commands/mget
+        """
+        self._reading('retrieve_many')
+        ukeys = [self._unique_key(key) for key in keys]
+        cache = self.read_cache
+        if cache is None:
+            return [unicode(value, 'utf-8') if value else value
+                    for value in self._client().mget(ukeys)]
+        values = dict((ukey, cache.get(ukey, MISSING)) for ukey in ukeys)
+        missing = [ukey for ukey, value in values.items() if value is MISSING]
+        if missing:
+            writes = self._writes
+            for ukey, value in zip(missing, self._client().mget(missing)):
+                if value:
+                    value = unicode(value, 'utf-8')
+                values[ukey] = value
+                self._cache_read(ukey, value, writes)
+        return [values[ukey] for ukey in ukeys]
+
+    @contextmanager
+    def pipeline(self, transaction=True):
+        """Sends the storage calls made in the block in one round-trip,
+        as a transaction unless `transaction` is False:
+
+            with self.pipeline() as results:
+                self.store('a', 1)
+                self.incr('b')
+            # results == [True, 1]
+
+        The calls return nothing useful inside the block; their results
+        are in the yielded list once it exits. `retrieve` and
+        `retrieve_many` raise `ValueError` in the block. Nested blocks
+        join the outer pipeline.
+
+        MULTI/EXEC: http://redis.io/topics/transactions
+        """
+        if getattr(self._local, 'pipe', None) is not None:
+            yield []
+            return
+        results = []
+        pipe = self._local.pipe = self._backend().pipeline(
+            transaction=transaction)
+        written = self._local.written = set()
+        try:
+            yield results
+        finally:
+            self._local.pipe = self._local.written = None
+        try:
+            results.extend(pipe.execute())
+        finally:
+            if written:
+                self._invalidate(written)
 
 
 class DummyLine(object):
@@ -125,16 +387,23 @@ class DummyApp(Cmd):
     prompt = '(repl_user) '
     intro = REPL_INTRO
     use_raw_input = False
+    # the `metrics.Sink` reported to, see `instrument`
+    metrics = None
 
     def __init__(self, *args, **kwargs):
         # Cmd is an old-style class, super doesn't work
         # super(DummyApp, self).__init__(*args, **kwargs)
         self.responses = []
-        self.storage = fakeredis.FakeStrictRedis()
+        # any engine of `botbot_plugins.engines`
+        self.storage = kwargs.pop('storage', None) or MemoryEngine()
         self.messages_router = {}
         self.mentions_router = {}
         self.firehose_router = {}
+        # firehose routes limited to IRC commands, by command
+        self.command_routers = {}
         self.plugin_configs = {}
+        self.plugins = []
+        self.executor = None
         if 'test_plugin' in kwargs:
             self.test_mode = True
             self.register(kwargs['test_plugin'])
@@ -149,6 +418,7 @@ class DummyApp(Cmd):
         that need to be registered with the internal app routers.
         """
         plugin.app = self
+        self.plugins.append(plugin)
         for key in dir(plugin):
             attr = getattr(plugin, key)
             if (not key.startswith('__') and
@@ -157,13 +427,27 @@ class DummyApp(Cmd):
                 self.output('Route {}: {} ({}, {})'.format(attr.route_rule[0],
                                                            plugin.slug, key,
                                                            attr.route_rule[1]))
-                getattr(self, attr.route_rule[0] + '_router').setdefault(
-                    plugin.slug, []).append((attr.route_rule[1], attr))
+                # Rules are compiled once here rather than on every line
+                route = Route(attr.route_rule[1], attr)
+                commands = getattr(attr, 'route_commands', None)
+                if commands and attr.route_rule[0] == 'firehose':
+                    # Indexed by command so other traffic never reaches it
+                    for command in commands:
+                        self.command_routers.setdefault(command, {}).setdefault(
+                            plugin.slug, []).append(route)
+                else:
+                    getattr(self, attr.route_rule[0] + '_router').setdefault(
+                        plugin.slug, []).append(route)
                 # Setup the plugin config
                 if (plugin.config_class and
                         plugin.slug not in self.plugin_configs):
                     self.plugin_configs[plugin.slug] = plugin.config_class()
 
+    def flush(self):
+        """Has every plugin write out the data it holds back from storage"""
+        for plugin in self.plugins:
+            plugin.flush()
+
     def output(self, text):
         """Print text to stdout for repl. No-op for tests"""
         if not self.test_mode:
@@ -173,6 +457,74 @@ class DummyApp(Cmd):
         """Manually set a plugin config. Used for testing"""
         self.plugin_configs[plugin_slug].fields.update(fields_dict)
 
+    def config_for(self, plugin_slug):
+        """The config fields of a plugin, None if it has no config"""
+        if plugin_slug in self.plugin_configs:
+            return self.plugin_configs[plugin_slug].fields
+        return None
+
+    def carry_context(self, func):
+        """
+        Returns `func` to be called on another thread, such as one of a
+        plugin's own `WorkerPool`, with the config and storage keys of the
+        line being handled on this one
+        """
+        return func
+
+    def namespace_for(self, plugin_slug):
+        """The prefix of a plugin's storage keys"""
+        return plugin_slug
+
+    def use_thread_pool(self, max_workers=8, concurrency=2, queue_size=10,
+                        policy=SHED):
+        """
+        Runs handlers decorated with `io_bound` on a pool of `max_workers`
+        threads instead of inline. Each plugin gets at most `concurrency`
+        running and `queue_size` waiting handler calls; beyond that lines
+        are dropped (`executor.SHED`) or dispatch waits for room
+        (`executor.DEFER`). Queue depth and wait times per plugin slug are
+        available from `self.executor.stats()`.
+        """
+        self.executor = LaneExecutor(max_workers, concurrency, queue_size,
+                                     policy)
+
+    def instrument(self, sink):
+        """
+        Reports route match times, handler times and errors, storage
+        commands and HTTP requests to `sink` (see `botbot_plugins.metrics`).
+        None turns the instrumentation off again.
+        """
+        self.metrics = sink
+
+    def routes(self):
+        """Yields `(router_name, plugin_slug, route)` for every route"""
+        routers = [(router_name, getattr(self, router_name + '_router'))
+                   for router_name in ('messages', 'mentions', 'firehose')]
+        routers.extend(('firehose:' + command, router)
+                       for command, router in self.command_routers.items())
+        for router_name, router in routers:
+            for plugin_slug, route_list in router.items():
+                for route in route_list:
+                    yield router_name, plugin_slug, route
+
+    def cache_stats(self):
+        """Returns the read cache counters of the plugins with one, by slug"""
+        return dict((plugin.slug, plugin.read_cache.stats())
+                    for plugin in self.plugins
+                    if getattr(plugin, 'read_cache', None) is not None)
+
+    def route_stats(self):
+        """
+        Returns the prefilter skip and regex hit/miss counters of every
+        registered route
+        """
+        stats = []
+        for router_name, plugin_slug, route in self.routes():
+            route_stats = route.stats()
+            route_stats.update(router=router_name, plugin=plugin_slug)
+            stats.append(route_stats)
+        return stats
+
     def respond(self, text, **kwargs):
         """Listens for incoming messages"""
         if text.startswith('!!'):
@@ -190,6 +542,50 @@ class DummyApp(Cmd):
     # Cmd sends all text to the `default` method
     default = respond
 
+    def respond_many(self, packets, window=500):
+        """
+        Dispatches a stream of packets (dicts like the `respond` kwargs
+        plus `text`, or plain strings), yielding `(line, responses)` for
+        each one as it is handled.
+
+        Storage writes are buffered and flushed every `window` lines, so
+        only one window of writes is held in memory at a time.
+        """
+        storage = self.storage
+        self.storage = buffered = WriteBuffer(storage)
+        try:
+            for count, packet in enumerate(packets, 1):
+                if isinstance(packet, basestring):
+                    packet = {'text': packet}
+                self.responses = []
+                line = DummyLine(packet)
+                self.dispatch(line)
+                yield line, self.responses
+                if count % window == 0:
+                    buffered.flush()
+        finally:
+            self.flush()
+            buffered.flush()
+            self.storage = storage
+
+    def profile(self, packets, mode='cprofile', interval=0.001):
+        """
+        Dispatches a stream of packets like `respond_many` while profiling
+        the handlers, returning a `profiling.Profile` with a ranked report
+        and collapsed stacks for a flame graph. `mode` is 'cprofile' or
+        'sample', which records the stacks every `interval` seconds.
+        """
+        profiler = Profiler(mode, interval)
+        profiler.start(self)
+        try:
+            for _ in self.respond_many(packets):
+                pass
+            if self.executor:
+                self.executor.join()
+        finally:
+            profile = profiler.stop()
+        return profile
+
     def do_EOF(self, arg):
         """Kill cmdloop on CTRL-d"""
         print "\nGoodbye"
@@ -215,26 +611,195 @@ class DummyApp(Cmd):
 
     def dispatch(self, line):
         """Given a line, dispatch it to the right function(s)"""
-        self.check_routes_for_matches(line, self.messages_router)
+        for router in self.routers_for(line):
+            self.check_routes_for_matches(line, router)
 
+    def routers_for(self, line):
+        """Returns the routers a line is checked against, in order"""
+        routers = [self.messages_router]
         if line.is_direct_message:
-            self.check_routes_for_matches(line, self.mentions_router)
-
-        self.check_routes_for_matches(line, self.firehose_router)
+            routers.append(self.mentions_router)
+        routers.append(self.firehose_router)
+        if line._command in self.command_routers:
+            routers.append(self.command_routers[line._command])
+        return routers
 
     def check_routes_for_matches(self, line, router):
         """Checks if line matches the routes' rules and calls functions"""
-        for _, route_list in router.items():
-            for rule, func in route_list:
-                match = re.match(rule, line.text, re.IGNORECASE)
+        for func, kwargs in self.matching_handlers(line, router):
+            if self.executor and getattr(func, 'io_bound', False):
+                self.submit_to_executor(func, line, kwargs)
+            else:
+                self.handle_response(self.call_handler(func, line, kwargs))
+
+    def call_handler(self, func, line, kwargs):
+        """Calls a handler the line matched, returning its response"""
+        metrics = self.metrics
+        if metrics is None:
+            return func(line, **kwargs)
+        tags = {'plugin': func.im_self.slug, 'handler': func.__name__}
+        started = now()
+        try:
+            return func(line, **kwargs)
+        except Exception:
+            metrics.incr('handler.errors', **tags)
+            raise
+        finally:
+            metrics.timing('handler.time', now() - started, **tags)
+
+    def submit_to_executor(self, func, line, kwargs):
+        """
+        Runs the handler on the thread pool. Its response is added to the
+        responses of the line that triggered it once it finishes.
+        """
+        responses = self.responses
+        slug = func.im_self.slug
+        future = self.executor.submit(slug, self.call_handler, func, line,
+                                      kwargs)
+        if future is None:
+            self.output('[shed]: {0} ({1})'.format(slug, func.__name__))
+            return
+        future.add_done_callback(
+            lambda done: self.handle_response(done.result(), responses))
+
+    def matching_handlers(self, line, router):
+        """
+        Yields `(func, kwargs)` for each route in `router` whose rule
+        matches the line
+        """
+        metrics = self.metrics
+        lowered = line.text.lower()
+        for plugin_slug, route_list in router.items():
+            for route in route_list:
+                if metrics is None:
+                    match = route.match(line.text, lowered)
+                else:
+                    started = now()
+                    match = route.match(line.text, lowered)
+                    metrics.timing('route.match', now() - started,
+                                   plugin=plugin_slug,
+                                   handler=route.func.__name__)
                 if match:
-                    response = func(line, **match.groupdict())
-                    if response:
-                        if isinstance(response, PrivateMessage):
-                            self.responses.append(response.msg)
-                            self.output('[o__o]: ' + response.msg)
-                        else:
-                            self.responses.append(response)
-                            self.output('[o__o]: ' + response)
+                    yield route.func, match.groupdict()
+
+    def handle_response(self, response, responses=None):
+        """Collects and echoes a handler's response"""
+        if responses is None:
+            responses = self.responses
+        if response:
+            if isinstance(response, PrivateMessage):
+                responses.append(response.msg)
+                self.output('[o__o]: ' + response.msg)
+            else:
+                responses.append(response)
+                self.output('[o__o]: ' + response)
+
+
+class AsyncApp(DummyApp):
+    """
+    Registration and routing for plugins, running the handlers a line
+    matches concurrently on a pool of worker threads.
+
+    Responses are delivered in the same order as `DummyApp`. A handler
+    that hasn't returned `handler_timeout` seconds after the line was
+    dispatched (or its own `@timeout`) is dropped. It goes on running, so
+    a spare worker takes its place until it returns; past `max_workers`
+    such spares, handlers that hang hold on to the pool's workers.
+    """
+    handler_timeout = 10
+    max_workers = 8
+
+    def __init__(self, *args, **kwargs):
+        self.pool = WorkerPool(self.max_workers)
+        DummyApp.__init__(self, *args, **kwargs)
+
+    def dispatch(self, line):
+        """Given a line, run the matching function(s) concurrently"""
+        started = time.time()
+        calls = []
+        for router in self.routers_for(line):
+            for func, kwargs in self.matching_handlers(line, router):
+                calls.append((func, self.pool.submit(self.call_handler, func,
+                                                     line, kwargs)))
+
+        for func, future in calls:
+            deadline = started + getattr(func, 'timeout', self.handler_timeout)
+            try:
+                response = future.result(max(deadline - time.time(), 0))
+            except Timeout:
+                self.output('[timeout]: {0}'.format(func.__name__))
+                self.pool.abandon(future)
+                continue
+            self.handle_response(response)
+
+
+class MultiChannelApp(DummyApp):
+    """
+    Registration and routing for plugins serving many channels at once.
+
+    The plugins and their compiled routes are shared by every channel.
+    While a handler runs, its plugin's config and storage keys are those
+    of the channel the line came from (`line._channel_name`): storage keys
+    are prefixed with the channel, and config set for the channel with
+    `set_config(..., channel=...)` takes the place of the default config.
+    Only channels with their own config take up memory of their own.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # channel -> {plugin slug: config fields}
+        self.channel_configs = {}
+        self._local = threading.local()
+        DummyApp.__init__(self, *args, **kwargs)
+
+    def current_channel(self):
+        """The channel of the line being handled by this thread, if any"""
+        return getattr(self._local, 'channel', None)
+
+    def set_config(self, plugin_slug, fields_dict, channel=None):
+        """
+        Manually set a plugin config, for `channel` only if it's given.
+        A channel's config starts out as a copy of the default config.
+        """
+        if channel is None:
+            return DummyApp.set_config(self, plugin_slug, fields_dict)
+        configs = self.channel_configs.setdefault(channel, {})
+        if plugin_slug not in configs:
+            configs[plugin_slug] = dict(
+                self.plugin_configs[plugin_slug].fields)
+        configs[plugin_slug].update(fields_dict)
+
+    def config_for(self, plugin_slug):
+        configs = self.channel_configs.get(self.current_channel())
+        if configs and plugin_slug in configs:
+            return configs[plugin_slug]
+        return DummyApp.config_for(self, plugin_slug)
+
+    def namespace_for(self, plugin_slug):
+        channel = self.current_channel()
+        if channel is None:
+            return plugin_slug
+        return u'{0}:{1}'.format(channel, plugin_slug)
+
+    @contextmanager
+    def in_channel(self, channel):
+        """Has the plugins act for `channel` on this thread in the block"""
+        previous = self.current_channel()
+        self._local.channel = channel
+        try:
+            yield
+        finally:
+            self._local.channel = previous
+
+    def carry_context(self, func):
+        channel = self.current_channel()
+
+        def in_channel(*args, **kwargs):
+            with self.in_channel(channel):
+                return func(*args, **kwargs)
+        return in_channel
+
+    def call_handler(self, func, line, kwargs):
+        with self.in_channel(line._channel_name):
+            return DummyApp.call_handler(self, func, line, kwargs)
 
 app = DummyApp()
@@ -0,0 +1,61 @@
+"""
+In-process caches for plugins.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    A mapping holding at most `max_size` entries, evicting the least
+    recently used one when full. Entries older than `ttl` seconds (if
+    given) are treated as missing.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry timestamp or None, value), most recently used last
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or (entry[0] and entry[0] <= time.time()):
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = self.ttl and time.time() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Returns the hit/miss counters and size of the cache"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size}
@@ -13,6 +13,10 @@ class BaseConfig(object):
     Base class for plugin configs.
     `fields` attribute is a dictionary of {field_name}: {field_value}
     """
+    # seconds the keys the plugin stores are kept, unless it says
+    # otherwise; None keeps them until they're deleted
+    storage_ttl = None
+
     def __new__(self, *args, **kwargs):
         self.fields = {}
         for attr, value in self.__dict__.items():
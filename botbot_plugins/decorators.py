@@ -12,4 +12,36 @@ def listens_to_all(rule):
     def decorator(func):
         func.route_rule = ('messages', rule)
         return func
-    return decorator
\ No newline at end of file
+    return decorator
+
+def listens_to_command(commands, rule=ur'(.*)'):
+    """
+    Decorator to add function and rule to the routing table for lines of
+    the given IRC command(s), e.g. 'JOIN' or ('PART', 'QUIT')
+    """
+    if isinstance(commands, basestring):
+        commands = [commands]
+
+    def decorator(func):
+        func.route_rule = ('firehose', rule)
+        func.route_commands = frozenset(command.upper() for command in commands)
+        return func
+    return decorator
+
+
+def io_bound(func):
+    """
+    Decorator to mark a function that waits on the network, so it can be
+    run on the app's thread pool
+    """
+    func.io_bound = True
+    return func
+
+
+def timeout(seconds):
+    """Decorator to limit how long AsyncApp waits for the function"""
+
+    def decorator(func):
+        func.timeout = seconds
+        return func
+    return decorator
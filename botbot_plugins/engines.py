@@ -0,0 +1,873 @@
+"""
+Storage engines the app can keep plugin data in:
+
+    app = DummyApp(storage=engine_for('sqlite:////var/lib/botbot.db'))
+
+Every engine speaks the same protocol, the subset of Redis commands the
+plugins use, with redis-py's signatures and return values:
+
+* strings: `get`, `set(name, value, ex=None)`, `incr(name, amount=1)`,
+  `mget(keys)` and `mset(mapping)`
+* lists: `rpush(name, *values)`, `lrange(name, start, end)` and
+  `ltrim(name, start, end)`
+* sets: `sadd(name, *values)`, `srem(name, *values)` and `smembers`
+* any key: `delete(*names)`, `expire(name, seconds)`, `ttl(name)` and
+  `keys(pattern='*')`, plus `flushdb()`
+* `pipeline(transaction=True)`, whose `execute()` runs the queued
+  commands at once and returns their results
+
+Keys and values are byte strings; unicode is stored UTF-8 encoded and
+numbers in their decimal form.
+
+`MemoryEngine` keeps everything in a dict, for tests and the REPL.
+`LogEngine` is a `MemoryEngine` that appends its writes to a log file,
+so plugin data survives restarts.
+`RedisEngine` is a Redis server reached through a connection pool.
+`SqliteEngine` keeps the data in a SQLite database in WAL mode, for a
+bot running on a single machine.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import fnmatch
+import heapq
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+import urlparse
+import zlib
+
+
+# roughly the bytes of memory a key, and an item of a list or set, take
+# on top of their contents
+KEY_OVERHEAD = 200
+ITEM_OVERHEAD = 50
+
+
+class WrongType(TypeError):
+    """Raised for a command on a key holding another kind of value"""
+
+
+def encode(value):
+    """`value` as the byte string an engine stores"""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def span(start, end):
+    """The Python slice of the Redis range `start`-`end`, both inclusive"""
+    return slice(start, None if end == -1 else end + 1)
+
+
+class Engine(object):
+    """
+    Base of the in-process engines. Subclasses implement the commands
+    and hold `_lock` while running them, which `batch` takes for all of
+    a pipeline's commands.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def batch(self):
+        """Runs the commands called in the block as one"""
+        with self._lock:
+            yield
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+    def mget(self, keys, *args):
+        names = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        names.extend(args)
+        with self.batch():
+            return [self.get(name) for name in names]
+
+    def mset(self, mapping):
+        with self.batch():
+            for name, value in mapping.items():
+                self.set(name, value)
+        return True
+
+
+class Pipeline(object):
+    """Queues an engine's commands, running them together on `execute`"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.commands = []
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        with self.engine.batch():
+            return [command(*args, **kwargs)
+                    for command, args, kwargs in commands]
+
+    def __getattr__(self, name):
+        command = getattr(self.engine, name)
+
+        def queued(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queued
+
+
+def footprint(name, value):
+    """Roughly how many bytes of memory a key and its value take"""
+    if isinstance(value, str):
+        return KEY_OVERHEAD + len(name) + len(value)
+    return KEY_OVERHEAD + len(name) + sum(ITEM_OVERHEAD + len(item)
+                                          for item in value)
+
+
+class MemoryEngine(Engine):
+    """
+    Keeps the data in a dict, strings as str, lists and sets as such.
+    Expired keys are dropped as soon as the engine is written to, read or
+    not. Given `max_memory`, the least recently used keys are evicted
+    once the data takes roughly more than that many bytes.
+    """
+
+    def __init__(self, max_memory=None):
+        super(MemoryEngine, self).__init__()
+        self.data = {}
+        # key -> time.time() it expires at, and a heap of
+        # `(time it expires at, key)` some of which are outdated
+        self.expires = {}
+        self._deadlines = []
+        self.max_memory = max_memory
+        # key -> its footprint, least recently used first, if bounded
+        self.sizes = OrderedDict() if max_memory else None
+        self.memory = 0
+        self.evicted = 0
+
+    def _get(self, name, kind):
+        """The value at `name` if it hasn't expired, checking its kind"""
+        deadline = self.expires.get(name)
+        if deadline is not None and deadline <= time.time():
+            self._drop(name)
+        value = self.data.get(name)
+        if value is not None:
+            if not isinstance(value, kind):
+                raise WrongType(name)
+            if self.sizes is not None:
+                self.sizes[name] = self.sizes.pop(name)
+        return value
+
+    def _drop(self, name):
+        self.expires.pop(name, None)
+        if self.sizes is not None:
+            self.memory -= self.sizes.pop(name, 0)
+        return self.data.pop(name, None) is not None
+
+    def _expire_at(self, name, deadline):
+        self.expires[name] = deadline
+        heapq.heappush(self._deadlines, (deadline, name))
+        if len(self._deadlines) > 2 * len(self.expires) + 1000:
+            self._deadlines = [(when, key)
+                               for key, when in self.expires.items()]
+            heapq.heapify(self._deadlines)
+
+    def _changed(self, name):
+        """Drops expired keys, and evicts some if `name` took too much"""
+        now = time.time()
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            deadline, key = heapq.heappop(deadlines)
+            if self.expires.get(key) == deadline:
+                self._drop(key)
+        if self.sizes is None:
+            return
+        value = self.data.get(name)
+        if value is not None:
+            size = footprint(name, value)
+            self.memory += size - self.sizes.pop(name, 0)
+            self.sizes[name] = size
+        while self.memory > self.max_memory and self.sizes:
+            self._drop(next(iter(self.sizes)))
+            self.evicted += 1
+
+    def get(self, name):
+        with self._lock:
+            return self._get(encode(name), str)
+
+    def set(self, name, value, ex=None):
+        name = encode(name)
+        with self._lock:
+            self.data[name] = encode(value)
+            if ex is None:
+                self.expires.pop(name, None)
+            else:
+                self._expire_at(name, time.time() + ex)
+            self._changed(name)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._get(name, object) is not None and
+                       self._drop(name) for name in map(encode, names))
+
+    def incr(self, name, amount=1):
+        name = encode(name)
+        with self._lock:
+            value = int(self._get(name, str) or 0) + amount
+            self.data[name] = str(value)
+            self._changed(name)
+        return value
+
+    def expire(self, name, time_):
+        name = encode(name)
+        with self._lock:
+            if self._get(name, object) is None:
+                return False
+            self._expire_at(name, time.time() + time_)
+        return True
+
+    def ttl(self, name):
+        name = encode(name)
+        with self._lock:
+            if self._get(name, object) is None or name not in self.expires:
+                return None
+            return int(round(self.expires[name] - time.time()))
+
+    def keys(self, pattern='*'):
+        with self._lock:
+            return [name for name in self.data.keys()
+                    if fnmatch.fnmatchcase(name, pattern) and
+                    self._get(name, object) is not None]
+
+    def rpush(self, name, *values):
+        name = encode(name)
+        with self._lock:
+            items = self._get(name, list)
+            if items is None:
+                items = self.data[name] = []
+            items.extend(map(encode, values))
+            self._changed(name)
+            return len(items)
+
+    def lrange(self, name, start, end):
+        with self._lock:
+            return list((self._get(encode(name), list) or [])[
+                span(start, end)])
+
+    def ltrim(self, name, start, end):
+        name = encode(name)
+        with self._lock:
+            items = self._get(name, list)
+            if items is not None:
+                items[:] = items[span(start, end)]
+                if not items:
+                    self._drop(name)
+                self._changed(name)
+        return True
+
+    def sadd(self, name, *values):
+        name = encode(name)
+        with self._lock:
+            members = self._get(name, set)
+            if members is None:
+                members = self.data[name] = set()
+            size = len(members)
+            members.update(map(encode, values))
+            self._changed(name)
+            return len(members) - size
+
+    def srem(self, name, *values):
+        name = encode(name)
+        with self._lock:
+            members = self._get(name, set)
+            if members is None:
+                return 0
+            size = len(members)
+            members.difference_update(map(encode, values))
+            if not members:
+                self._drop(name)
+            self._changed(name)
+            return size - len(members)
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._get(encode(name), set) or ())
+
+    def flushdb(self):
+        with self._lock:
+            self.data.clear()
+            self.expires.clear()
+            del self._deadlines[:]
+            if self.sizes is not None:
+                self.sizes.clear()
+            self.memory = 0
+        return True
+
+
+# length and CRC-32 of each record in a `LogEngine` log
+HEADER = struct.Struct('>II')
+
+
+def record(op, args):
+    """A log record of the command `op` run with `args`"""
+    data = marshal.dumps((op, args))
+    return HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff) + data
+
+
+class LogEngine(MemoryEngine):
+    """
+    A `MemoryEngine` that survives restarts by appending every write to
+    the log at `path`. On open the log is memory-mapped and replayed; a
+    torn record at its end, left by a crash, is cut off.
+
+    Records are written and fsynced together every `sync_interval`
+    seconds by a background thread, so a crash loses at most that much;
+    with `sync_interval=0` each command is fsynced before it returns. A
+    pipeline is logged as a single record, so it's replayed whole or not
+    at all. Once the log holds `compact_ratio` times more records than
+    there are keys (and at least `compact_min`), it is rewritten with
+    just the current data.
+
+    Keys evicted because of `max_memory` aren't logged as deleted; they
+    are evicted again as the log is replayed, or left out when it's
+    compacted.
+    """
+
+    def __init__(self, path, sync_interval=0.05, compact_min=10000,
+                 compact_ratio=4, max_memory=None):
+        super(LogEngine, self).__init__(max_memory)
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_min = compact_min
+        self.compact_ratio = compact_ratio
+        # records in the log, those not written yet, those of the open
+        # pipeline, and those since the snapshot being compacted
+        self.records = 0
+        self._pending = []
+        self._batch = None
+        self._since_snapshot = None
+        # held to write to the log file, before `_lock` if both are
+        self._io_lock = threading.Lock()
+        self._load()
+        self._file = open(path, 'ab')
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop)
+        self._syncer.daemon = True
+        self._syncer.start()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            open(self.path, 'ab').close()
+        size = os.path.getsize(self.path)
+        end = 0
+        if size:
+            with open(self.path, 'rb') as log:
+                view = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    while end + HEADER.size <= size:
+                        length, checksum = HEADER.unpack_from(view, end)
+                        start = end + HEADER.size
+                        data = view[start:start + length]
+                        if (len(data) < length or
+                                zlib.crc32(data) & 0xffffffff != checksum):
+                            break
+                        self._apply(*marshal.loads(data))
+                        self.records += 1
+                        end = start + length
+                finally:
+                    view.close()
+        if end < size:
+            with open(self.path, 'r+b') as log:
+                log.truncate(end)
+
+    def _apply(self, op, args):
+        """Runs a logged command on the data in memory"""
+        if op == 'batch':
+            for command in args:
+                self._apply(*command)
+        elif op == 'set':
+            name, value, expires = args
+            MemoryEngine.set(self, name, value)
+            if expires is not None and name in self.data:
+                self._expire_at(name, expires)
+        elif op == 'expireat':
+            name, expires = args
+            if name in self.data and expires is not None:
+                self._expire_at(name, expires)
+        else:
+            getattr(MemoryEngine, op)(self, *args)
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            outer = self._batch is None
+            if outer:
+                self._batch = []
+            try:
+                yield
+            finally:
+                if outer:
+                    commands, self._batch = self._batch, None
+                    if len(commands) == 1:
+                        self._write(record(*commands[0]))
+                    elif commands:
+                        self._write(record('batch', commands))
+
+    def _log(self, op, *args):
+        """Logs a command, called holding `_lock` once it has been run"""
+        if self._batch is not None:
+            self._batch.append((op, args))
+        else:
+            self._write(record(op, args))
+
+    def _write(self, data):
+        self.records += 1
+        if self._since_snapshot is not None:
+            self._since_snapshot.append(data)
+        if self.sync_interval:
+            self._pending.append(data)
+        else:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def sync(self):
+        """Writes and fsyncs the records logged since the last sync"""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if pending:
+                self._file.write(''.join(pending))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.sync_interval or 1):
+            self.sync()
+            if (self.records >= self.compact_min and
+                    self.records > self.compact_ratio * len(self.data)):
+                self.compact()
+
+    def compact(self):
+        """Rewrites the log with just the current data"""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._since_snapshot = []
+                now = time.time()
+                snapshot = [(name, value if isinstance(value, str)
+                             else type(value)(value), self.expires.get(name))
+                            for name, value in self.data.items()
+                            if self.expires.get(name, now + 1) > now]
+            # the old log stays complete until it's replaced
+            self._file.write(''.join(pending))
+            self._file.flush()
+            compacted = self.path + '.compact'
+            records = 0
+            with open(compacted, 'wb') as log:
+                for name, value, expires in snapshot:
+                    if isinstance(value, str):
+                        log.write(record('set', (name, value, expires)))
+                    else:
+                        op = 'rpush' if isinstance(value, list) else 'sadd'
+                        log.write(record(op, (name,) + tuple(value)))
+                        if expires is not None:
+                            log.write(record('expireat', (name, expires)))
+                    records += 1
+                with self._lock:
+                    since, self._since_snapshot = self._since_snapshot, None
+                    del self._pending[:]
+                    log.write(''.join(since))
+                    log.flush()
+                    os.fsync(log.fileno())
+                    os.rename(compacted, self.path)
+                    self._fsync_directory()
+                    self._file.close()
+                    self._file = open(self.path, 'ab')
+                    self.records = records + len(since)
+
+    def _fsync_directory(self):
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)),
+                            os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def close(self):
+        self._closed.set()
+        self._syncer.join()
+        self.sync()
+        self._file.close()
+
+    def set(self, name, value, ex=None):
+        name, value = encode(name), encode(value)
+        with self._lock:
+            MemoryEngine.set(self, name, value, ex)
+            self._log('set', name, value, self.expires.get(name))
+        return True
+
+    def delete(self, *names):
+        names = tuple(map(encode, names))
+        with self._lock:
+            deleted = MemoryEngine.delete(self, *names)
+            if deleted:
+                self._log('delete', *names)
+        return deleted
+
+    def incr(self, name, amount=1):
+        name = encode(name)
+        with self._lock:
+            value = MemoryEngine.incr(self, name, amount)
+            self._log('incr', name, amount)
+        return value
+
+    def expire(self, name, time_):
+        name = encode(name)
+        with self._lock:
+            if not MemoryEngine.expire(self, name, time_):
+                return False
+            self._log('expireat', name, self.expires.get(name))
+        return True
+
+    def rpush(self, name, *values):
+        name, values = encode(name), tuple(map(encode, values))
+        with self._lock:
+            length = MemoryEngine.rpush(self, name, *values)
+            self._log('rpush', name, *values)
+        return length
+
+    def ltrim(self, name, start, end):
+        name = encode(name)
+        with self._lock:
+            MemoryEngine.ltrim(self, name, start, end)
+            self._log('ltrim', name, start, end)
+        return True
+
+    def sadd(self, name, *values):
+        name, values = encode(name), tuple(map(encode, values))
+        with self._lock:
+            added = MemoryEngine.sadd(self, name, *values)
+            if added:
+                self._log('sadd', name, *values)
+        return added
+
+    def srem(self, name, *values):
+        name, values = encode(name), tuple(map(encode, values))
+        with self._lock:
+            removed = MemoryEngine.srem(self, name, *values)
+            if removed:
+                self._log('srem', name, *values)
+        return removed
+
+    def flushdb(self):
+        with self._lock:
+            MemoryEngine.flushdb(self)
+            self._log('flushdb')
+        return True
+
+
+class RedisEngine(object):
+    """
+    A Redis server, through a pool of up to `max_connections`. Commands
+    are passed on to a `redis.StrictRedis` client, `client`.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', max_connections=50,
+                 **kwargs):
+        # only bots storing their data in Redis load its client
+        import redis
+        pool = redis.ConnectionPool.from_url(
+            url, max_connections=max_connections, **kwargs)
+        self.client = redis.StrictRedis(connection_pool=pool)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def ttl(self, name):
+        """None, as from the other engines, for keys without an expiry"""
+        seconds = self.client.ttl(name)
+        # -1 for a key without an expiry, -2 for a missing one
+        return seconds if seconds >= 0 else None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value BLOB,
+    expires REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    key TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (key, pos)
+);
+CREATE TABLE IF NOT EXISTS members (
+    key TEXT NOT NULL,
+    member BLOB NOT NULL,
+    PRIMARY KEY (key, member)
+);
+CREATE INDEX IF NOT EXISTS keys_expires ON keys (expires)
+    WHERE expires IS NOT NULL;
+"""
+
+
+class SqliteEngine(Engine):
+    """
+    Keeps the data in the SQLite database at `path`. Each command, or
+    pipeline, is one transaction; the WAL journal makes those cheap and
+    lets other processes read the database meanwhile. Expired keys are
+    deleted every `purge_every` transactions, read or not.
+    """
+    purge_every = 1000
+
+    def __init__(self, path):
+        super(SqliteEngine, self).__init__()
+        # loaded only by bots keeping their data in SQLite
+        import sqlite3
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.text_factory = str
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self._depth = 0
+        self._transactions = 0
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1:
+                self.db.execute('BEGIN IMMEDIATE')
+                self._transactions += 1
+                if self._transactions % self.purge_every == 0:
+                    self.purge()
+            try:
+                yield
+            except Exception:
+                if self._depth == 1:
+                    self.db.execute('ROLLBACK')
+                raise
+            else:
+                if self._depth == 1:
+                    self.db.execute('COMMIT')
+            finally:
+                self._depth -= 1
+
+    def close(self):
+        self.db.close()
+
+    def purge(self):
+        """Deletes the keys that have expired"""
+        with self.batch():
+            names = [name for (name,) in self._query(
+                'SELECT key FROM keys WHERE expires <= ?', time.time())]
+            for name in names:
+                self._drop(name)
+
+    def _query(self, sql, *args):
+        return self.db.execute(sql, args)
+
+    def _kind(self, name, kind=None):
+        """The kind of value at `name` if it hasn't expired, checking it"""
+        row = self._query('SELECT kind, expires FROM keys WHERE key = ?',
+                          name).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            self._drop(name)
+            return None
+        if kind is not None and row[0] != kind:
+            raise WrongType(name)
+        return row[0]
+
+    def _drop(self, name):
+        for table in ('keys', 'items', 'members'):
+            self._query('DELETE FROM {0} WHERE key = ?'.format(table), name)
+
+    def get(self, name):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name, 'string') is None:
+                return None
+            return str(self._query('SELECT value FROM keys WHERE key = ?',
+                                   name).fetchone()[0])
+
+    def set(self, name, value, ex=None):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name) not in (None, 'string'):
+                self._drop(name)
+            self._query('INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?)',
+                        name, 'string', buffer(encode(value)),
+                        None if ex is None else time.time() + ex)
+        return True
+
+    def delete(self, *names):
+        deleted = 0
+        with self.batch():
+            for name in map(encode, names):
+                if self._kind(name) is not None:
+                    self._drop(name)
+                    deleted += 1
+        return deleted
+
+    def incr(self, name, amount=1):
+        name = encode(name)
+        with self.batch():
+            value = int(self.get(name) or 0) + amount
+            if self._kind(name) is None:
+                self._query('INSERT INTO keys VALUES (?, ?, ?, NULL)',
+                            name, 'string', buffer(str(value)))
+            else:
+                self._query('UPDATE keys SET value = ? WHERE key = ?',
+                            buffer(str(value)), name)
+        return value
+
+    def expire(self, name, time_):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name) is None:
+                return False
+            self._query('UPDATE keys SET expires = ? WHERE key = ?',
+                        time.time() + time_, name)
+        return True
+
+    def ttl(self, name):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name) is None:
+                return None
+            expires = self._query('SELECT expires FROM keys WHERE key = ?',
+                                  name).fetchone()[0]
+        if expires is None:
+            return None
+        return int(round(expires - time.time()))
+
+    def keys(self, pattern='*'):
+        now = time.time()
+        with self.batch():
+            rows = self._query('SELECT key, expires FROM keys').fetchall()
+        return [name for name, expires in rows
+                if (expires is None or expires > now) and
+                fnmatch.fnmatchcase(name, pattern)]
+
+    def _items(self, name):
+        return self._query('SELECT pos, value FROM items WHERE key = ? '
+                           'ORDER BY pos', name).fetchall()
+
+    def rpush(self, name, *values):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name, 'list') is None:
+                self._query('INSERT INTO keys VALUES (?, ?, NULL, NULL)',
+                            name, 'list')
+            last, length = self._query(
+                'SELECT MAX(pos), COUNT(*) FROM items WHERE key = ?',
+                name).fetchone()
+            start = 0 if last is None else last + 1
+            self.db.executemany(
+                'INSERT INTO items VALUES (?, ?, ?)',
+                [(name, start + offset, buffer(encode(value)))
+                 for offset, value in enumerate(values)])
+        return length + len(values)
+
+    def lrange(self, name, start, end):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name, 'list') is None:
+                return []
+            return [str(value) for _, value in
+                    self._items(name)[span(start, end)]]
+
+    def ltrim(self, name, start, end):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name, 'list') is None:
+                return True
+            items = self._items(name)
+            kept = set(pos for pos, _ in items[span(start, end)])
+            if not kept:
+                self._drop(name)
+            else:
+                self.db.executemany(
+                    'DELETE FROM items WHERE key = ? AND pos = ?',
+                    [(name, pos) for pos, _ in items if pos not in kept])
+        return True
+
+    def sadd(self, name, *values):
+        name = encode(name)
+        added = 0
+        with self.batch():
+            if self._kind(name, 'set') is None:
+                self._query('INSERT INTO keys VALUES (?, ?, NULL, NULL)',
+                            name, 'set')
+            for value in values:
+                added += self._query(
+                    'INSERT OR IGNORE INTO members VALUES (?, ?)',
+                    name, buffer(encode(value))).rowcount
+        return added
+
+    def srem(self, name, *values):
+        name = encode(name)
+        removed = 0
+        with self.batch():
+            if self._kind(name, 'set') is None:
+                return 0
+            for value in values:
+                removed += self._query(
+                    'DELETE FROM members WHERE key = ? AND member = ?',
+                    name, buffer(encode(value))).rowcount
+            if not self._query('SELECT 1 FROM members WHERE key = ? LIMIT 1',
+                               name).fetchone():
+                self._drop(name)
+        return removed
+
+    def smembers(self, name):
+        name = encode(name)
+        with self.batch():
+            if self._kind(name, 'set') is None:
+                return set()
+            return set(str(member) for (member,) in self._query(
+                'SELECT member FROM members WHERE key = ?', name))
+
+    def flushdb(self):
+        with self.batch():
+            for table in ('keys', 'items', 'members'):
+                self._query('DELETE FROM {0}'.format(table))
+        return True
+
+
+# how the options in a storage URL are parsed, `int` for those not here
+OPTION_TYPES = {'sync_interval': float, 'compact_ratio': float}
+
+
+def engine_for(url):
+    """
+    The engine for a `memory://`, `redis://host:port/db`,
+    `sqlite:///relative/path.db` (`sqlite:////absolute/path.db`) or
+    `log:///relative/path.log` URL
+    """
+    scheme, _, rest = url.partition('://')
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisEngine(url)
+    rest, _, query = rest.partition('?')
+    # such as `?max_memory=100000000`
+    options = dict((name, OPTION_TYPES.get(name, int)(value))
+                   for name, value in urlparse.parse_qsl(query))
+    if scheme == 'memory':
+        return MemoryEngine(**options)
+    if scheme == 'sqlite':
+        return SqliteEngine(rest[1:] or ':memory:', **options)
+    if scheme == 'log':
+        return LogEngine(rest[1:], **options)
+    raise ValueError('unknown storage URL {0!r}'.format(url))
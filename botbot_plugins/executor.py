@@ -0,0 +1,263 @@
+"""
+A small thread pool for running plugin handlers off the dispatch thread.
+"""
+from collections import deque
+import logging
+import Queue
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# What a LaneExecutor does with a call when its lane is full
+SHED = 'shed'
+DEFER = 'defer'
+
+# has the worker that takes it off a WorkerPool's queue leave the pool
+RETIRE = object()
+
+
+class Timeout(Exception):
+    pass
+
+
+class Future(object):
+    """The pending result of a call submitted to a `WorkerPool`"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def add_done_callback(self, callback):
+        """Calls `callback(future)` once the call has finished"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            log.exception('Error in callback %r', callback)
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits up to `timeout` seconds for the call to finish, returning its
+        result or re-raising its exception. Raises `Timeout` otherwise.
+        """
+        if not self._done.wait(timeout):
+            raise Timeout()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class WorkerPool(object):
+    """
+    Runs submitted calls on up to `max_workers` daemon threads, started
+    as they are needed.
+
+    A call given up on with `abandon` while it's still running has a
+    spare worker started in its place, so calls that hang don't starve
+    the pool. At most `max_spares` (by default `max_workers`) spares are
+    running at once; calls abandoned past that hold on to their workers.
+    """
+
+    def __init__(self, max_workers, max_spares=None):
+        self.max_workers = max_workers
+        if max_spares is None:
+            max_spares = max_workers
+        self.max_spares = max_spares
+        self._spares = 0
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Schedules `func(*args, **kwargs)`, returning its `Future`"""
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        with self._lock:
+            if len(self._threads) < self.max_workers + self._spares:
+                self._start()
+        return future
+
+    def abandon(self, future):
+        """
+        Gives up on the call of `future`, starting a spare worker in its
+        place if it hasn't finished. The spare leaves once the call does.
+        Returns False if no spare was started.
+        """
+        with self._lock:
+            if future.done() or self._spares >= self.max_spares:
+                return False
+            self._spares += 1
+            self._start()
+        future.add_done_callback(self._retire)
+        return True
+
+    def _start(self):
+        thread = threading.Thread(target=self._work)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _retire(self, future):
+        with self._lock:
+            self._spares -= 1
+        self._queue.put(RETIRE)
+
+    def shutdown(self, wait=True):
+        """Stops the workers once the calls already submitted are done"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if item is RETIRE:
+                with self._lock:
+                    thread = threading.current_thread()
+                    if thread in self._threads:
+                        self._threads.remove(thread)
+                return
+            future, func, args, kwargs = item
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+
+class Lane(object):
+    """The calls a `LaneExecutor` has running and waiting for one name"""
+
+    def __init__(self):
+        self.running = 0
+        self.waiting = deque()
+        self.completed = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def stats(self):
+        started = self.completed + self.running
+        return {'running': self.running,
+                'queued': len(self.waiting),
+                'completed': self.completed,
+                'shed': self.shed,
+                'avg_wait': self.total_wait / started if started else 0.0,
+                'max_wait': self.max_wait}
+
+
+class LaneExecutor(object):
+    """
+    Runs calls on a `WorkerPool`, grouped into lanes by name (a plugin
+    slug). Each lane runs at most `concurrency` calls at once and holds at
+    most `queue_size` more. When a lane is full, new calls are dropped
+    (`SHED`) or the caller blocks until there is room (`DEFER`).
+    """
+
+    def __init__(self, max_workers=8, concurrency=2, queue_size=10,
+                 policy=SHED):
+        self.pool = WorkerPool(max_workers)
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.policy = policy
+        self._lanes = {}
+        self._changed = threading.Condition()
+
+    def submit(self, name, func, *args, **kwargs):
+        """
+        Schedules `func(*args, **kwargs)` in lane `name`, returning its
+        `Future`, or None if the call was shed.
+        """
+        with self._changed:
+            lane = self._lanes.setdefault(name, Lane())
+            while (lane.running >= self.concurrency and
+                    len(lane.waiting) >= self.queue_size):
+                if self.policy == SHED:
+                    lane.shed += 1
+                    return None
+                self._changed.wait()
+            future = Future()
+            job = (future, func, args, kwargs, time.time())
+            if lane.running < self.concurrency:
+                lane.running += 1
+                self.pool.submit(self._run, lane, job)
+            else:
+                lane.waiting.append(job)
+        return future
+
+    def _run(self, lane, job):
+        future, func, args, kwargs, queued = job
+        waited = time.time() - queued
+        with self._changed:
+            lane.total_wait += waited
+            lane.max_wait = max(lane.max_wait, waited)
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            future.set_exception(sys.exc_info())
+        else:
+            future.set_result(result)
+        with self._changed:
+            lane.completed += 1
+            if lane.waiting:
+                self.pool.submit(self._run, lane, lane.waiting.popleft())
+            else:
+                lane.running -= 1
+            self._changed.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Waits until no calls are running or waiting. Returns False if
+        that didn't happen within `timeout` seconds.
+        """
+        deadline = timeout and time.time() + timeout
+        with self._changed:
+            while any(lane.running for lane in self._lanes.values()):
+                if deadline is None:
+                    self._changed.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._changed.wait(remaining)
+        return True
+
+    def stats(self):
+        """Returns queue depth, wait times and counters for each lane"""
+        with self._changed:
+            return dict((name, lane.stats())
+                        for name, lane in self._lanes.items())
@@ -0,0 +1,230 @@
+"""
+The HTTP client plugins share, as `BasePlugin.http`:
+
+    response = self.http.get(url, params={'q': query})
+
+Connections are pooled and kept alive per host. Requests get a connect
+and read timeout unless they pass their own `timeout`, and idempotent
+ones are retried with jittered backoff on connection errors, timeouts
+and 502/503/504 responses. A host that keeps failing has its circuit
+opened: calls to it raise `CircuitOpen` right away until `reset_timeout`
+seconds have passed, after which a single call is let through to see
+whether it's back.
+
+A plugin's requests are reported to the metrics sink of its app.
+"""
+from contextlib import contextmanager
+import random
+import threading
+import time
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import now
+
+RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpen(requests.RequestException):
+    """Raised instead of calling a host whose circuit is open"""
+
+
+class Host(object):
+    """The connection pool, circuit breaker and counters of a host"""
+
+    def __init__(self, pool_size):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.state = CLOSED
+        # failures in a row, and when the circuit was last opened
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def stats(self):
+        return {'state': self.state,
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'mean_seconds': self.seconds / self.requests
+                                if self.requests else 0.0}
+
+
+class HttpClient(object):
+    """
+    Makes HTTP requests with `requests`, see the module docs. Per host
+    request times and errors go to the `metrics.Sink` a thread is
+    `reporting_to`, or else the one given to `instrument`, if any, and
+    are counted in `stats()`.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2,
+                 backoff=0.2, failure_threshold=5, reset_timeout=30,
+                 pool_size=10):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.pool_size = pool_size
+        self.metrics = None
+        # 'scheme://netloc' -> Host
+        self.hosts = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def instrument(self, sink):
+        self.metrics = sink
+
+    @contextmanager
+    def reporting_to(self, sink):
+        """Has this thread's requests in the block report to `sink`"""
+        previous = getattr(self._local, 'metrics', None)
+        self._local.metrics = sink
+        try:
+            yield
+        finally:
+            self._local.metrics = previous
+
+    def _sink(self):
+        sink = getattr(self._local, 'metrics', None)
+        return self.metrics if sink is None else sink
+
+    def _host(self, url):
+        parsed = urlparse.urlsplit(url)
+        key = '{0}://{1}'.format(parsed.scheme, parsed.netloc)
+        host = self.hosts.get(key)
+        if host is None:
+            with self._lock:
+                host = self.hosts.get(key)
+                if host is None:
+                    host = self.hosts[key] = Host(self.pool_size)
+        return parsed.netloc, host
+
+    def _allow(self, name, host):
+        """Raises `CircuitOpen` if `host` isn't to be called now"""
+        with host.lock:
+            if host.state == CLOSED:
+                return
+            if (host.state == OPEN and
+                    time.time() - host.opened >= self.reset_timeout):
+                host.state = HALF_OPEN
+            if host.state == HALF_OPEN and not host.probing:
+                host.probing = True
+                return
+            host.rejected += 1
+        metrics = self._sink()
+        if metrics is not None:
+            metrics.incr('http.rejected', host=name)
+        raise CircuitOpen('{0} is failing, not calling it for now'.format(
+            name))
+
+    def _record(self, name, host, seconds, failed):
+        with host.lock:
+            host.requests += 1
+            host.seconds += seconds
+            host.probing = False
+            if failed:
+                host.errors += 1
+                host.failures += 1
+                if (host.state == HALF_OPEN or
+                        host.failures >= self.failure_threshold):
+                    host.state = OPEN
+                    host.opened = time.time()
+            else:
+                host.failures = 0
+                host.state = CLOSED
+        metrics = self._sink()
+        if metrics is not None:
+            metrics.timing('http.time', seconds, host=name)
+            if failed:
+                metrics.incr('http.errors', host=name)
+
+    def request(self, method, url, **kwargs):
+        """Makes a request like `requests.request`, see the module docs"""
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        name, host = self._host(url)
+        attempts = 1
+        if method.upper() in RETRY_METHODS:
+            attempts += self.retries
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                host.retries += 1
+                metrics = self._sink()
+                if metrics is not None:
+                    metrics.incr('http.retries', host=name)
+            self._allow(name, host)
+            last = attempt == attempts - 1
+            started = now()
+            # any exception is a failure, and ends a half-open probe
+            failed = True
+            try:
+                response = host.session.request(method, url, **kwargs)
+                failed = response.status_code >= 500
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                continue
+            finally:
+                self._record(name, host, now() - started, failed)
+            if response.status_code in RETRY_STATUSES and not last:
+                continue
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Request counts, errors and circuit state per host"""
+        return dict((key, host.stats()) for key, host in self.hosts.items())
+
+
+class PluginHttpClient(object):
+    """
+    `BasePlugin.http` as a plugin sees it: the shared `HttpClient`, with
+    the plugin's requests reported to its app's metrics sink
+    """
+
+    def __init__(self, client, plugin):
+        self.client = client
+        self.plugin = plugin
+
+    def _reporting(self):
+        app = self.plugin.app
+        return self.client.reporting_to(app and app.metrics)
+
+    def request(self, method, url, **kwargs):
+        with self._reporting():
+            return self.client.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        with self._reporting():
+            return self.client.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        with self._reporting():
+            return self.client.post(url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
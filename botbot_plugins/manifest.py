@@ -0,0 +1,231 @@
+"""
+A manifest of the plugins in `botbot_plugins.plugins`, read from their
+source without importing them, and stand-ins that import a plugin only
+when one of its handlers is first called.
+
+The manifest can be written to a JSON file once and loaded from there:
+
+    python -m botbot_plugins.manifest > manifest.json
+"""
+import ast
+import functools
+from importlib import import_module
+import json
+import os
+import sys
+import threading
+
+ROUTE_DECORATORS = {
+    'listens_to_all': 'messages',
+    'listens_to_mentions': 'mentions',
+    'listens_to_command': 'firehose',
+}
+
+
+def _name(node):
+    """The (last) name a decorator or call refers to"""
+    if isinstance(node, ast.Call):
+        node = node.func
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+def _literal_args(call):
+    """The positional and keyword arguments of `call` as Python values"""
+    args = [ast.literal_eval(arg) for arg in call.args]
+    kwargs = dict((keyword.arg, ast.literal_eval(keyword.value))
+                  for keyword in call.keywords)
+    return args, kwargs
+
+
+def _describe_route(func):
+    """Reads the routing decorators of method `func`, None if it has none"""
+    route = {'name': func.name}
+    for decorator in func.decorator_list:
+        name = _name(decorator)
+        if name == 'io_bound':
+            route['io_bound'] = True
+        elif name == 'timeout':
+            route['timeout'] = _literal_args(decorator)[0][0]
+        elif name in ROUTE_DECORATORS:
+            args, kwargs = _literal_args(decorator)
+            if name == 'listens_to_command':
+                commands = args[0] if args else kwargs['commands']
+                if isinstance(commands, basestring):
+                    commands = [commands]
+                route['commands'] = [command.upper() for command in commands]
+                rule = args[1] if len(args) > 1 else kwargs.get('rule', u'(.*)')
+            else:
+                rule = args[0] if args else kwargs['rule']
+            route['route_rule'] = [ROUTE_DECORATORS[name], rule]
+    if 'route_rule' in route:
+        return route
+    return None
+
+
+def _config_fields(config_class):
+    """Reads the `config.Field` attributes of a config class and defaults"""
+    fields = {}
+    for node in config_class.body:
+        if (isinstance(node, ast.Assign) and
+                isinstance(node.value, ast.Call) and
+                _name(node.value) == 'Field'):
+            default = _literal_args(node.value)[1].get('default')
+            for target in node.targets:
+                fields[target.id] = default
+    return fields
+
+
+def describe_module(source, module):
+    """
+    Describes the `Plugin` class in `source`: its slug (the module name,
+    as `BasePlugin` sets it), routes and config fields. `static` is False
+    if they couldn't all be read from the source, in which case the
+    plugin has to be imported to register it.
+    """
+    entry = {'module': module,
+             'slug': module.split('.')[-1],
+             'routes': [],
+             'config': None,
+             'static': True}
+    tree = ast.parse(source)
+    classes = dict((node.name, node) for node in tree.body
+                   if isinstance(node, ast.ClassDef))
+    plugin = classes.get('Plugin')
+    if plugin is None:
+        entry['static'] = False
+        return entry
+    if [_name(base) for base in plugin.bases] != ['BasePlugin']:
+        # routes could be inherited from somewhere we don't read
+        entry['static'] = False
+    try:
+        for node in plugin.body:
+            if isinstance(node, ast.FunctionDef):
+                route = _describe_route(node)
+                if route:
+                    entry['routes'].append(route)
+            elif isinstance(node, ast.Assign):
+                target = node.targets[0]
+                if isinstance(target, ast.Name) and target.id == 'config_class':
+                    entry['config'] = _config_fields(classes[_name(node.value)])
+                elif (isinstance(target, ast.Attribute) and
+                        target.attr == 'route_rule'):
+                    # `func.route_rule = (...)` set after the method
+                    for route in entry['routes']:
+                        if route['name'] == target.value.id:
+                            break
+                    else:
+                        route = {'name': target.value.id}
+                        entry['routes'].append(route)
+                    route['route_rule'] = list(ast.literal_eval(node.value))
+    except (ValueError, KeyError, IndexError, AttributeError):
+        # something other than literals, e.g. a rule built at import time
+        entry['static'] = False
+    return entry
+
+
+def build_manifest(package='botbot_plugins.plugins'):
+    """Describes every plugin module in `package`"""
+    plugins = import_module(package)
+    plugins_dir = os.path.dirname(plugins.__file__)
+    manifest = []
+    for name in sorted(plugins.__all__):
+        with open(os.path.join(plugins_dir, name + '.py')) as source:
+            manifest.append(describe_module(source.read(),
+                                            package + '.' + name))
+    return manifest
+
+
+def load_manifest(path=None):
+    """Reads the manifest written to `path`, or builds it if there's none"""
+    if path and os.path.exists(path):
+        with open(path) as manifest:
+            return json.load(manifest)
+    return build_manifest()
+
+
+class StaticConfig(object):
+    """The config fields of a plugin that hasn't been imported yet"""
+
+    def __init__(self, fields):
+        self.fields = dict(fields)
+
+
+class LazyHandler(object):
+    """A handler of a `LazyPlugin`, importing the plugin when called"""
+
+    def __init__(self, plugin, route):
+        self.im_self = plugin
+        self.__name__ = str(route['name'])
+        self.route_rule = tuple(route['route_rule'])
+        if 'commands' in route:
+            self.route_commands = frozenset(route['commands'])
+        if route.get('io_bound'):
+            self.io_bound = True
+        if 'timeout' in route:
+            self.timeout = route['timeout']
+
+    def __call__(self, line, **kwargs):
+        plugin = self.im_self.load()
+        return getattr(plugin, self.__name__)(line, **kwargs)
+
+
+class LazyPlugin(object):
+    """
+    Stands in for the plugin described by a manifest entry when it is
+    registered with an app. The plugin module is imported, and the app's
+    routes pointed at the real handlers, when a handler is first called.
+    """
+    app = None
+
+    def __init__(self, entry):
+        self.slug = entry['slug']
+        self.module = entry['module']
+        self.plugin = None
+        self.config_class = None
+        if entry['config'] is not None:
+            self.config_class = functools.partial(StaticConfig,
+                                                  entry['config'])
+        self._lock = threading.Lock()
+        for route in entry['routes']:
+            setattr(self, route['name'], LazyHandler(self, route))
+
+    def load(self):
+        """Imports and sets up the plugin, returning it"""
+        with self._lock:
+            if self.plugin is not None:
+                return self.plugin
+            plugin = import_module(self.module).Plugin()
+            plugin.app = self.app
+            configs = self.app.plugin_configs
+            if plugin.config_class and plugin.slug in configs:
+                config = plugin.config_class()
+                config.fields.update(configs[plugin.slug].fields)
+                configs[plugin.slug] = config
+            for _, _, route in self.app.routes():
+                if getattr(route.func, 'im_self', None) is self:
+                    route.func = getattr(plugin, route.func.__name__)
+            self.app.plugins[self.app.plugins.index(self)] = plugin
+            self.plugin = plugin
+        return plugin
+
+    def flush(self):
+        if self.plugin is not None:
+            self.plugin.flush()
+
+
+def plugin_for(entry):
+    """
+    Returns a `LazyPlugin` for a manifest entry, or the imported plugin
+    if its routes couldn't be read from the source
+    """
+    if entry['static']:
+        return LazyPlugin(entry)
+    return import_module(entry['module']).Plugin()
+
+
+if __name__ == '__main__':
+    json.dump(build_manifest(), sys.stdout, indent=2, sort_keys=True)
@@ -0,0 +1,249 @@
+"""
+Counters and latency histograms for the app, sent to a pluggable sink.
+
+Instrumentation is off until a sink is given to `DummyApp.instrument`:
+
+    sink = MemorySink()
+    app.instrument(sink)
+    ...
+    sink.dump()
+
+The app reports:
+
+* `route.match`: seconds spent matching a route's rule against a line,
+  by `plugin` and `handler`
+* `handler.time`: seconds spent in a handler, by `plugin` and `handler`
+* `handler.errors`: handler calls that raised, by `plugin` and `handler`
+* `storage.time`: seconds per storage command (a pipeline counts as one
+  `pipeline` command), by `plugin` and `op`
+* `storage.ops`: storage commands sent, pipelined ones included, by
+  `plugin` and `op`
+* `http.time`, `http.errors`, `http.retries` and `http.rejected`: the
+  requests made with `BasePlugin.http`, by `host`
+"""
+from contextlib import contextmanager
+import re
+import socket
+import threading
+import timeit
+
+now = timeit.default_timer
+
+# Upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1,
+           5, 10)
+
+
+class Sink(object):
+    """Where instrumented code reports to; subclasses handle the events"""
+
+    def incr(self, name, value=1, **tags):
+        raise NotImplementedError
+
+    def timing(self, name, seconds, **tags):
+        raise NotImplementedError
+
+    @contextmanager
+    def timer(self, name, **tags):
+        """Reports how long the block took as a timing of `name`"""
+        started = now()
+        try:
+            yield
+        finally:
+            self.timing(name, now() - started, **tags)
+
+    def storage(self, storage, plugin_slug):
+        """Wraps a storage client to time the commands sent through it"""
+        return InstrumentedStorage(storage, self, plugin_slug)
+
+
+class Histogram(object):
+    """Counts of values per bucket, plus their number and sum"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """`(upper bound, values up to it)` pairs, ending with infinity"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MemorySink(Sink):
+    """Keeps the counters and histograms in memory"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # (name, sorted tag items) -> value / Histogram
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1, **tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timing(self, name, seconds, **tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.add(seconds)
+
+    def dump(self):
+        """The counters and histograms as plain data"""
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'tags': dict(tags), 'value': value}
+                    for (name, tags), value in sorted(self.counters.items())],
+                'histograms': [
+                    {'name': name, 'tags': dict(tags),
+                     'count': histogram.count, 'sum': histogram.sum,
+                     'buckets': list(histogram.cumulative())}
+                    for (name, tags), histogram
+                    in sorted(self.histograms.items())],
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class PrometheusSink(MemorySink):
+    """A `MemorySink` that can render itself in the Prometheus text format"""
+
+    def __init__(self, namespace='botbot', buckets=BUCKETS):
+        super(PrometheusSink, self).__init__(buckets)
+        self.namespace = namespace
+
+    def _name(self, name, suffix):
+        return re.sub(r'[^a-zA-Z0-9_]', '_',
+                      '{0}_{1}_{2}'.format(self.namespace, name, suffix))
+
+    @staticmethod
+    def _labels(tags, **extra):
+        labels = list(tags) + sorted(extra.items())
+        if not labels:
+            return ''
+        return '{{{0}}}'.format(','.join(
+            '{0}="{1}"'.format(key, unicode(value).replace('\\', '\\\\')
+                               .replace('"', '\\"').replace('\n', '\\n'))
+            for key, value in labels))
+
+    def render(self):
+        """The metrics as a Prometheus text exposition"""
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, tags), value in sorted(self.counters.items()):
+                metric = self._name(name, 'total')
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append('# TYPE {0} counter'.format(metric))
+                lines.append('{0}{1} {2}'.format(metric, self._labels(tags),
+                                                 value))
+            for (name, tags), histogram in sorted(self.histograms.items()):
+                metric = self._name(name, 'seconds')
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append('# TYPE {0} histogram'.format(metric))
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        metric, self._labels(tags, le=le), count))
+                lines.append('{0}_sum{1} {2!r}'.format(
+                    metric, self._labels(tags), histogram.sum))
+                lines.append('{0}_count{1} {2}'.format(
+                    metric, self._labels(tags), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdSink(Sink):
+    """
+    Sends every event to a StatsD server over UDP, as
+    `<prefix>.<name>.<tag values>:<value>|c` or `...|ms`. Send errors are
+    ignored so a missing server never slows the bot down.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='botbot'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, name, tags):
+        parts = [self.prefix, name]
+        parts.extend(unicode(value) for _, value in sorted(tags.items()))
+        return re.sub(r'[^\w.\-]', '_', '.'.join(parts))
+
+    def _send(self, line):
+        try:
+            self.socket.sendto(line.encode('utf-8'), self.address)
+        except socket.error:
+            pass
+
+    def incr(self, name, value=1, **tags):
+        self._send(u'{0}:{1}|c'.format(self._name(name, tags), value))
+
+    def timing(self, name, seconds, **tags):
+        self._send(u'{0}:{1:.3f}|ms'.format(self._name(name, tags),
+                                            seconds * 1000))
+
+
+class InstrumentedStorage(object):
+    """Wraps a storage client, reporting every command sent through it"""
+
+    def __init__(self, storage, sink, plugin_slug):
+        self.storage = storage
+        self.sink = sink
+        self.plugin_slug = plugin_slug
+
+    def pipeline(self, *args, **kwargs):
+        return InstrumentedPipeline(self.storage.pipeline(*args, **kwargs),
+                                    self.sink, self.plugin_slug)
+
+    def __getattr__(self, name):
+        command = getattr(self.storage, name)
+        sink, plugin_slug = self.sink, self.plugin_slug
+
+        def instrumented(*args, **kwargs):
+            sink.incr('storage.ops', plugin=plugin_slug, op=name)
+            with sink.timer('storage.time', plugin=plugin_slug, op=name):
+                return command(*args, **kwargs)
+        return instrumented
+
+
+class InstrumentedPipeline(InstrumentedStorage):
+    """Counts the commands queued on a pipeline and times `execute`"""
+
+    def execute(self):
+        with self.sink.timer('storage.time', plugin=self.plugin_slug,
+                             op='pipeline'):
+            return self.storage.execute()
+
+    def __getattr__(self, name):
+        command = getattr(self.storage, name)
+        sink, plugin_slug = self.sink, self.plugin_slug
+
+        def queued(*args, **kwargs):
+            sink.incr('storage.ops', plugin=plugin_slug, op=name)
+            return command(*args, **kwargs)
+        return queued
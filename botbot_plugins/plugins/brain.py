@@ -18,6 +18,8 @@ class Plugin(BasePlugin):
 
         thing I need to remember
     """
+    # popular facts are recalled without asking storage
+    read_cache_size = 1000
 
     @listens_to_mentions(ur'(?P<key>.+?)=\s*(?P<value>.*)')
     def remember(self, line, key, value):
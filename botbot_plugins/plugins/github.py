@@ -1,10 +1,17 @@
+import json
+import time
+
 import requests
+
 from ..base import BasePlugin
 from .. import config
-from ..decorators import listens_to_all
+from ..decorators import io_bound, listens_to_all
+from ..executor import WorkerPool
 
 
 class Config(config.BaseConfig):
+    # issues not looked up for a month are forgotten
+    storage_ttl = 30 * 24 * 60 * 60
     organization = config.Field(help_text="GitHub organization")
     repo = config.Field(required=False,
                         help_text="GitHub repository name")
@@ -25,54 +32,105 @@ class Plugin(BasePlugin):
         gh#<issue_number>
         gh#<comma_separated_issue_numbers>
 
-    Note: The lookup is limited to 5 issues.
+    Note: The lookup is limited to 10 issues.
     """
     url = "https://api.github.com/repos"
     config_class = Config
+    max_issues = 10
+    # seconds a looked up issue is served from storage before GitHub is
+    # asked (conditionally, with its ETag) whether it changed
+    cache_ttl = 10 * 60
 
+    def __init__(self, *args, **kwargs):
+        super(Plugin, self).__init__(*args, **kwargs)
+        self.pool = WorkerPool(self.max_issues)
+
+    @io_bound
     @listens_to_all(ur'(?:.*)\b(?:GH|gh):(?P<repo>[\w\-\_]+)#?(?P<issues>\d+(?:,\d+)*)\b(?:.*)')
     def issue_lookup(self, line, repo, issues):
         """Lookup an specified repo issue"""
-        # issues can be a list of issue separated by a comma
-        issue_list = [i.strip() for i in issues.split(",")]
-        response_list = []
-        for issue in issue_list[:5]:
-            api_url = "/".join([self.url, self.config['organization'],
-                                repo, "issues", issue])
-            response = requests.get(api_url, auth=self._get_auth())
-            if response.status_code == 200:
-                resp = u'{title}: {html_url}'.format(**response.json())
-                response_list.append(resp)
-            else:
-                resp = u"Sorry I couldn't find issue #{0} in {1}/{2}".format(
-                    issue, self.config['organization'], repo)
-                response_list.append(resp)
-
-        return ", ".join(response_list)
-
+        return self._lookup(repo, issues)
 
+    @io_bound
     @listens_to_all(ur'(?:.*)\b(?:GH|gh)#?(?P<issues>\d+(?:,\d+)*)\b(?:.*)')
     def project_issue_lookup(self, line, issues):
         """Lookup an issue for the default repo"""
         if not (self.config['organization'] and self.config['repo']):
             return
-        # issues can be a list of issue separated by a comma
-        issue_list = [i.strip() for i in issues.split(",")]
+        return self._lookup(self.config['repo'], issues)
+
+    def _lookup(self, repo, issues):
+        """Describes each of the comma separated `issues` in `repo`"""
+        organization = self.config['organization']
+        issue_list = [i.strip() for i in issues.split(",")][:self.max_issues]
+        unique_issues = list(set(issue_list))
+        keys = [u'issue:{0}/{1}#{2}'.format(organization, repo, issue)
+                for issue in unique_issues]
+        cached = {}
+        pending = {}
+        updated = {}
+        unreachable = set()
+        for issue, key, entry in zip(unique_issues, keys,
+                                     self.retrieve_many(keys)):
+            entry = entry and json.loads(entry)
+            if entry and time.time() - entry['checked'] < self.cache_ttl:
+                cached[issue] = entry
+            else:
+                api_url = "/".join([self.url, organization, repo,
+                                    "issues", issue])
+                # the pool thread reads this line's channel config
+                pending[issue] = (key, entry, self.pool.submit(
+                    self.app.carry_context(self._fetch_issue), api_url,
+                    entry))
+
+        for issue, (key, entry, future) in pending.items():
+            try:
+                response = future.result()
+            except requests.RequestException:
+                response = None
+            if response is None or response.status_code >= 500:
+                # GitHub is failing, what it last said will do
+                if entry:
+                    cached[issue] = entry
+                else:
+                    unreachable.add(issue)
+                continue
+            if response.status_code == 304:
+                entry['checked'] = time.time()
+            elif response.status_code == 200:
+                data = response.json()
+                entry = {'title': data['title'],
+                         'html_url': data['html_url'],
+                         'etag': response.headers.get('ETag'),
+                         'checked': time.time()}
+            else:
+                continue
+            updated[key] = json.dumps(entry)
+            cached[issue] = entry
+        if updated:
+            self.store_many(updated)
+
         response_list = []
-        for issue in issue_list[:5]:
-            api_url = "/".join([self.url, self.config['organization'],
-                                self.config['repo'], "issues", issue])
-            response = requests.get(api_url, auth=self._get_auth())
-            if response.status_code == 200:
-                resp = u'{title}: {html_url}'.format(**response.json())
-                response_list.append(resp)
+        for issue in issue_list:
+            if issue in cached:
+                resp = u'{title}: {html_url}'.format(**cached[issue])
+            elif issue in unreachable:
+                resp = u"Sorry, GitHub didn't answer about issue #{0}".format(
+                    issue)
             else:
                 resp = u"Sorry I couldn't find issue #{0} in {1}/{2}".format(
-                    issue, self.config['organization'], self.config['repo'])
-                response_list.append(resp)
+                    issue, organization, repo)
+            response_list.append(resp)
 
         return ", ".join(response_list)
 
+    def _fetch_issue(self, api_url, entry):
+        """GETs an issue, only downloading it again if it has changed"""
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        return self.http.get(api_url, auth=self._get_auth(), headers=headers)
+
     def _get_auth(self):
         """Return user credentials if they are configured"""
         if self.config['user'] and self.config['password']:
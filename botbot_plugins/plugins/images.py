@@ -1,11 +1,16 @@
+import hashlib
+import json
 import re
 import random
+import threading
+import time
 from urllib import urlencode
 
 import requests
 
 from ..base import BasePlugin
-from ..decorators import listens_to_mentions
+from ..decorators import io_bound, listens_to_mentions
+from ..executor import WorkerPool
 
 
 class Plugin(BasePlugin):
@@ -32,18 +37,37 @@ class Plugin(BasePlugin):
 
         {{ nick }}: mustache me http://example.com/queen_of_england.jpg
     """
+    # seconds the results of a search are kept, after how many of them
+    # they're fetched again in the background, and how many of those
+    # refreshes can run at once. Searches for uncached queries are made by
+    # the handlers, which are `io_bound` so an app using a thread pool
+    # runs them off the dispatch thread.
+    cache_ttl = 24 * 60 * 60
+    refresh_after = 6 * 60 * 60
+    max_fetches = 4
+
+    def __init__(self, *args, **kwargs):
+        super(Plugin, self).__init__(*args, **kwargs)
+        self.pool = WorkerPool(self.max_fetches)
+        # keys of the searches being refreshed in the background
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @io_bound
     @listens_to_mentions(ur'(image|img)( me)? (?P<image>.*)')
     def respond_to_image(self, line, image):
-        url = image_me(image)
+        url = self._image(image)
         return url
 
 
+    @io_bound
     @listens_to_mentions(ur'(animate)( me)? (?P<image>.*)')
     def respond_to_animate(self, line, image):
-        url = image_me(image, animated=True)
+        url = self._image(image, animated=True)
         return url
 
 
+    @io_bound
     @listens_to_mentions(ur'(?:mo?u)?sta(?:s|c)he?(?: me)? (?P<image>.*)')
     def respond_to_mustache(self, line, image):
         mustache = random.choice([0, 1, 2])
@@ -51,19 +75,90 @@ class Plugin(BasePlugin):
         if re.match(r'^https?:\/\/', image, re.IGNORECASE):
             url = image
         else:
-            url = image_me(image)
+            url = self._image(image)
+            if url is None:
+                return None
         return mustachify.format(mustache=mustache, url=url)
 
+    def _image(self, query, animated=False):
+        """
+        The next of the cached results for `query`, searching for them if
+        they aren't cached. None if there are none.
+        """
+        key = u'results:{0}:{1}'.format(
+            'gif' if animated else 'any',
+            hashlib.md5(normalize(query).encode('utf8')).hexdigest())
+        entry = self.retrieve(key)
+        if entry:
+            entry = json.loads(entry)
+            if time.time() - entry['fetched'] >= self.refresh_after:
+                self._refresh(key, query, animated)
+        else:
+            entry = self._fetch(key, query, animated)
+            if entry is None:
+                return None
+        # each ask gets the next result
+        turn_key = key + u':turn'
+        with self.pipeline() as results:
+            self.incr(turn_key)
+            self.expire(turn_key, self.cache_ttl)
+        turn = results[0] - 1
+        return entry['urls'][turn % len(entry['urls'])]
+
+    def _refresh(self, key, query, animated):
+        """Fetches the results for `query` again, without waiting for them"""
+        # the same query may be refreshed for each channel
+        ukey = self._unique_key(key)
+        with self._lock:
+            if ukey in self._refreshing:
+                return
+            self._refreshing.add(ukey)
+
+        def fetch():
+            try:
+                self._fetch(key, query, animated)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(ukey)
+        # stored with the keys of this line's channel
+        self.pool.submit(self.app.carry_context(fetch))
+
+    def _fetch(self, key, query, animated):
+        """Searches for `query`, caching and returning any results"""
+        urls = search(query, animated, self.http)
+        if not urls:
+            return None
+        entry = {'urls': urls, 'fetched': time.time()}
+        self.store(key, json.dumps(entry), self.cache_ttl)
+        return entry
+
+
+def normalize(query):
+    """The query in lower case with single spaces"""
+    return u' '.join(query.lower().split())
+
 
 def image_me(query, animated=False):
+    """The first result for `query`"""
+    urls = search(query, animated)
+    if urls:
+        return urls[0]
+
+
+def search(query, animated=False, http=BasePlugin.http):
+    """
+    The URLs of the images Google finds for `query`, none if it can't be
+    reached
+    """
     query = query.encode("utf8")
     query_dict = {'v': '1.0', 'rsz': '8', 'q': query, 'safe': 'active'}
     if animated:
         query_dict['as_filetype'] = 'gif'
     url = 'http://ajax.googleapis.com/ajax/services/search/images?{0}'.format(
         urlencode(query_dict))
-    response = requests.get(url)
+    try:
+        response = http.get(url)
+    except requests.RequestException:
+        return []
     images = response.json()['responseData']['results']
-    if len(images) > 0:
-        image = images[0]
-        return image['unescapedUrl'] + '#.png'
+    return [image['unescapedUrl'] + '#.png' for image in images]
@@ -1,9 +1,10 @@
-import requests
 import urlparse
 
+import requests
+
 from ..base import BasePlugin
 from .. import config
-from ..decorators import listens_to_mentions
+from ..decorators import io_bound, listens_to_mentions
 
 
 class Config(config.BaseConfig):
@@ -23,6 +24,7 @@ class Plugin(BasePlugin):
 
     config_class = Config
 
+    @io_bound
     @listens_to_mentions(ur'jenkins build (?P<job>[\w\-\_]+)')
     def build(self, line, job):
         """Trigger a build job on Jenkins"""
@@ -31,7 +33,11 @@ class Plugin(BasePlugin):
         # for handling parameterized builds later
         # url = base_job_url + '/buildWithParameters?{}'.format(params)
         url = base_job_url + '/build'
-        resp = requests.post(url, auth=auth)
+        try:
+            resp = self.http.post(url, auth=auth)
+        except requests.RequestException:
+            return "Error building {0}. Jenkins couldn't be reached.".format(
+                job)
         if resp.status_code == 200:
             status_url = base_job_url + '/lastBuild/console'
             return "Build started for {0}.\n{1}".format(job, status_url)
@@ -47,5 +53,8 @@ class Plugin(BasePlugin):
             auth = (parsed.username, parsed.password)
         else:
             auth = None
-        non_auth_url = parsed.scheme + '://' + parsed.hostname + parsed.path
+        host = parsed.hostname
+        if parsed.port:
+            host += ':{0}'.format(parsed.port)
+        non_auth_url = parsed.scheme + '://' + host + parsed.path
         return auth, non_auth_url
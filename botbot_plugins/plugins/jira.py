@@ -1,10 +1,13 @@
 import requests
 import json
 import re
+import threading
+import time
 from urlparse import urljoin
 from .. import config
 from ..base import BasePlugin, DummyLine
-from ..decorators import listens_to_all, listens_to_mentions
+from ..cache import LRUCache
+from ..decorators import io_bound, listens_to_all, listens_to_mentions
 
 
 
@@ -22,7 +25,140 @@ class Plugin(BasePlugin):
         jira:{{projectname}}-{{issuenumber}}
     """
     config_class = Config
-    
+    # seconds between background refreshes of the project list
+    refresh_interval = 60 * 60
+    # how many issue summaries are kept in memory, and for how many seconds
+    summary_cache_size = 1000
+    summary_cache_ttl = 15 * 60
+
+    def __init__(self, *args, **kwargs):
+        super(Plugin, self).__init__(*args, **kwargs)
+        # (storage namespace, issue key) -> summary, as each channel may
+        # have a JIRA of its own
+        self.summaries = LRUCache(self.summary_cache_size,
+                                  self.summary_cache_ttl)
+        # storage namespace -> (project keys, issue regex), an entry being
+        # replaced as a whole so a lookup never pairs the keys of one list
+        # with the regex of another
+        self._indexes = {}
+        # storage namespace -> `_fetch_projects` in its channel
+        self._refreshes = {}
+        self._refresher = None
+        self._lock = threading.Lock()
+
+    def _namespace(self):
+        return self.app.namespace_for(self.slug)
+
+    def get_projects(self):
+        """
+        Returns the known project keys, loaded from storage on first use
+        and replaced whenever the list is updated
+        """
+        return self._get_index()[0]
+
+    def _get_index(self):
+        """The project keys and the issue regex for them (None if none)"""
+        index = self._indexes.get(self._namespace())
+        if index is None:
+            projects = self.retrieve('projects')
+            index = self._set_projects(json.loads(projects) if projects
+                                       else [])
+        return index
+
+    def _set_projects(self, projects):
+        """
+        Indexes `projects` and compiles the issue regex for them, for the
+        current channel, and has the list refreshed from now on
+        """
+        projects = frozenset(projects)
+        pattern = None
+        if projects:
+            # longest first so a key that prefixes another can't shadow it
+            keys = sorted(projects, key=len, reverse=True)
+            pattern = re.compile(
+                r'(?<!\w)({0})-(\d+)'.format('|'.join(map(re.escape, keys))))
+        index = self._indexes[self._namespace()] = (projects, pattern)
+        self._start_refresher()
+        return index
+
+    def _start_refresher(self):
+        """
+        Has the project list of the current channel refreshed in the
+        background, along with those of the other channels
+        """
+        if not self.refresh_interval or not (self.config and
+                                             self.config['jira_url']):
+            return
+        # lookups run on a pool, more than one may get here at once
+        with self._lock:
+            self._refreshes[self._namespace()] = self.app.carry_context(
+                self._fetch_projects)
+            if self._refresher:
+                return
+            self._refresher = threading.Thread(target=self._refresh_forever)
+            self._refresher.daemon = True
+            self._refresher.start()
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            with self._lock:
+                refreshes = self._refreshes.values()
+            for refresh in refreshes:
+                try:
+                    refresh()
+                except requests.RequestException:
+                    pass
+
+    def _get_summaries(self, keys):
+        """
+        Returns a dict of issue key to summary for the `keys` that exist,
+        fetching the ones that aren't cached with a single JQL search
+        """
+        namespace = self._namespace()
+        summaries = {}
+        missing = []
+        for key in keys:
+            summary = self.summaries.get((namespace, key))
+            if summary is None:
+                missing.append(key)
+            else:
+                summaries[key] = summary
+        if not missing:
+            return summaries
+
+        api_url = urljoin(self.config['jira_url'], self.config['rest_api_suffix'])
+        response = self.http.get(urljoin(api_url, 'search'), params={
+            'jql': 'key in ({})'.format(','.join(missing)),
+            'fields': 'summary',
+            'maxResults': len(missing),
+            # don't fail the whole search when one of the keys doesn't exist
+            'validateQuery': 'warn'})
+
+        if response.status_code == 200:
+            for issue in json.loads(response.text)['issues']:
+                summary = issue['fields']['summary']
+                self.summaries.set((namespace, issue['key']), summary)
+                summaries[issue['key']] = summary
+        return summaries
+
+    def _fetch_projects(self):
+        """
+        Fetches the project list from JIRA, storing and indexing it.
+        Returns False if JIRA didn't answer with the list.
+        """
+        api_url = urljoin(self.config['jira_url'], self.config['rest_api_suffix'])
+        project_url = urljoin(api_url, 'project')
+        response = self.http.get(project_url)
+
+        if response.status_code == 200:
+            projects = [project['key'] for project in json.loads(response.text)]
+            self.store('projects', json.dumps(projects))
+            self._set_projects(projects)
+            return True
+        return False
+
+    @io_bound
     @listens_to_all(ur'(?:.*)\b(\w+-\d+)\b(?:.*)')
     def issue_lookup(self, line):
         """
@@ -35,37 +171,43 @@ class Plugin(BasePlugin):
         """
 
         if line.user not in (self.config['bot_name'],'github'):
-            api_url = urljoin(self.config['jira_url'], self.config['rest_api_suffix'])
-            projects = json.loads(self.retrieve('projects'))
-
-            queries = re.findall(r"\w+-\d+", line.text)
-            queries = [query.split("-") for query in queries]
+            projects, pattern = self._get_index()
+            if not projects:
+                # UPDATE:JIRA hasn't been run yet
+                return
+            queries = pattern.findall(line.text)
+            if not queries:
+                return
+            keys = []
+            for query in queries:
+                key = "{}-{}".format(*query)
+                if key not in keys:
+                    keys.append(key)
+            try:
+                summaries = self._get_summaries(keys)
+            except requests.RequestException:
+                return
             reply = []
 
-            for query in queries:
-                if query[0] in projects:
-                    issue_url = urljoin(api_url,"issue/{}-{}".format(query[0],query[1]))
-                    response = requests.get(issue_url)
-
-                    if response.status_code == 200:
-                        response_text = json.loads(response.text)
-                        name = response_text['key']
-                        desc = response_text['fields']['summary']
-
-                        # Only post URL if issue isn't already mentioned as part of one
-                        if re.search(ur'(http)(\S*)/({})\b'.format(name), line.text):
-                            reply.append("{}: {}".format(name, desc))
-
-                        else:       
-                            return_url = urljoin(self.config['jira_url'], "browse/{}".format(name))
-                            reply.append("{}: {} {}".format(name, desc, return_url))
-                
+            for name in keys:
+                if name in summaries:
+                    desc = summaries[name]
+
+                    # Only post URL if issue isn't already mentioned as part of one
+                    if re.search(ur'(http)(\S*)/({})\b'.format(name), line.text):
+                        reply.append("{}: {}".format(name, desc))
+
+                    else:
+                        return_url = urljoin(self.config['jira_url'], "browse/{}".format(name))
+                        reply.append("{}: {} {}".format(name, desc, return_url))
+
             # if Off topic then bot also replies with off topic                   
             if re.search(r'^\[off\]', line.text):                     
                 return "[off] {}".format("\n[off] ".join(reply))
             else:
                 return "\n".join(reply)      
 
+    @io_bound
     @listens_to_mentions(ur'(.*)\bUPDATE:JIRA')
     def update_projects(self, line):
         """
@@ -75,13 +217,10 @@ class Plugin(BasePlugin):
             Ping the bot with the command:
             UPDATE:JIRA
         """
-        api_url = urljoin(self.config['jira_url'], self.config['rest_api_suffix'])
-        project_url = urljoin(api_url, 'project')
-        response = requests.get(project_url)
-
-        if response.status_code == 200:
-            projects = [project['key'] for project in json.loads(response.text)]
-            self.store('projects', json.dumps(projects))
-            return "Successfully updated projects list"
+        try:
+            if self._fetch_projects():
+                return "Successfully updated projects list"
+        except requests.RequestException:
+            pass
 
         return "Could not update projects list"
\ No newline at end of file
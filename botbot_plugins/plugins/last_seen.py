@@ -2,7 +2,14 @@ import datetime
 import time
 
 from ..base import BasePlugin
+from .. import config
 from ..decorators import listens_to_mentions, listens_to_all
+from ..storage import WriteBuffer
+
+
+class Config(config.BaseConfig):
+    # nicks not seen for half a year are forgotten
+    storage_ttl = 180 * 24 * 60 * 60
 
 
 class Plugin(BasePlugin):
@@ -15,6 +22,31 @@ class Plugin(BasePlugin):
 
         {{ nick }}: seen MrTaubyPants?
     """
+    # Every line is logged, so writes are held in memory (latest per nick)
+    # and sent in one pipeline once this many nicks are pending or the
+    # oldest pending write is this many seconds old
+    config_class = Config
+    flush_size = 100
+    flush_interval = 5
+    read_cache_size = 1000
+
+    def __init__(self, *args, **kwargs):
+        super(Plugin, self).__init__(*args, **kwargs)
+        self.buffer = None
+
+    def _storage(self):
+        if self.buffer is None or self.buffer.storage is not self.app.storage:
+            if self.buffer is not None:
+                self.buffer.flush()
+            self.buffer = WriteBuffer(self.app.storage,
+                                      max_pending=self.flush_size,
+                                      max_age=self.flush_interval)
+        return self.buffer
+
+    def flush(self):
+        if self.buffer is not None:
+            self.buffer.flush()
+
     @listens_to_all(ur'(.*)')
     def log_user_message(self, line):
         now = time.mktime(time.gmtime())
@@ -2,8 +2,9 @@
 Message service plugin
 """
 import json
+
 from ..base import BasePlugin, PrivateMessage
-from ..decorators import listens_to_mentions
+from ..decorators import listens_to_command, listens_to_mentions
 
 
 class Plugin(BasePlugin):
@@ -16,16 +17,33 @@ class Plugin(BasePlugin):
     """
 
     slug = 'message_service'
+    # most messages kept for one nick, and how many seconds they are kept
+    max_messages = 20
+    message_ttl = 30 * 24 * 60 * 60
+
+    def _inbox(self, nick):
+        return u'inbox:{0}'.format(nick)
+
+    def _pop_legacy(self, nick):
+        """
+        Messages left before inboxes, as a JSON list stored at the nick.
+        They're only returned by the call that deletes them.
+        """
+        messages = self.retrieve(nick)
+        if messages and self.delete(nick):
+            return json.loads(messages)
+        return []
 
+    @listens_to_command('JOIN')
     def find_message(self, line):
         """
         Find any messages for a user after they have logged in.
         """
+        # runners that don't route by command still send every line
         if line._command == "JOIN":
-            messages = self.retrieve(line.user)
+            messages = (self._pop_legacy(line.user) +
+                        self.pop_all(self._inbox(line.user)))
             if messages:
-                self.delete(line.user)
-                messages = json.loads(messages)
                 if hasattr(line, '_channel_name'):
                     out = "Beep BEEP! You received the following messages in {0} when you were offline.".format(
                         line._channel_name)
@@ -35,8 +53,6 @@ class Plugin(BasePlugin):
                     out += "\n{0}".format(message)
                 return PrivateMessage(line.user, out)
 
-    find_message.route_rule = ('firehose', ur'(.*)')
-
     @listens_to_mentions(r'^message\s+(?P<nick>[\w\-_]+)\s+(?P<message>.*)$')
     def store_message(self, line, nick, message):
         """
@@ -44,16 +60,8 @@ class Plugin(BasePlugin):
         """
         message = "From {0} '{1}'".format(
             line.user, message)
-        # does the user have any messages waiting?
-        messages = self.retrieve(nick)
-        if not messages:
-            messages = set()
-        else:
-            messages = set(json.loads(messages))
-
-        messages.add(message)
-        messages = list(messages)
-        self.store(nick, json.dumps(messages))
+        self.push(self._inbox(nick), message, max_length=self.max_messages,
+                  ttl=self.message_ttl)
         return u"{0}, I will tell {1} when they appear online.".format(
             line.user, nick)
 
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 #import urllib
-import requests
+import hashlib
+import re
+
 from defusedxml import ElementTree
+import requests
 
 from ..base import BasePlugin
 from .. import config
-from ..decorators import listens_to_mentions
+from ..decorators import io_bound, listens_to_mentions
 
 
 class Config(config.BaseConfig):
@@ -30,28 +33,79 @@ class Plugin(BasePlugin):
     """
     config_class = Config
     url = "http://api.wolframalpha.com/v2/query?"
+    # seconds an answer is kept, and "I don't know" (in case Wolfram|Alpha
+    # learns it meanwhile), and how many answers are kept at most
+    cache_ttl = 24 * 60 * 60
+    negative_ttl = 60 * 60
+    cache_size = 1000
 
+    @io_bound
     @listens_to_mentions(ur'(W|w)(hat|here|ho|hy|hen) .*?\?')
     def search(self, line):
+        key = u'answer:{0}'.format(
+            hashlib.md5(normalize(line.text).encode('utf8')).hexdigest())
+        answer = self.retrieve(key)
+        if answer:
+            return answer
+        answer, ttl = self._ask(line)
+        if ttl:
+            self._cache(key, answer, ttl)
+        return answer
+
+    def _ask(self, line):
+        """
+        Returns Wolfram|Alpha's answer to the question and how long it can
+        be cached for, None for errors
+        """
         message = line.text.encode('utf8')
         payload = {'input': message, 'appid': self.config['app_id']}
 
-        response = requests.get(self.url, params=payload)
+        try:
+            response = self.http.get(self.url, params=payload)
+        except requests.RequestException:
+            return "Error reaching wolframalpha.com.", None
 
         try:
             tree = ElementTree.fromstring(response.content)
         except ElementTree.ParseError:
-            return "Error parsing response from wolframalpha.com."
+            return "Error parsing response from wolframalpha.com.", None
 
         if tree.attrib["success"] == "false":
-            return u"I don't know"
+            return u"I don't know", self.negative_ttl
 
         result = _gather_results(tree)
 
         try:
-            return _answer(result, line)
+            answer = _answer(result, line)
         except (KeyError, IndexError):
-            return "Error parsing response"
+            return "Error parsing response", None
+        # only the question came back, so there's nothing to keep
+        return answer, answer and self.cache_ttl
+
+    def _cache(self, key, answer, ttl):
+        """
+        Stores an answer for `ttl` seconds. The keys are kept in a ring of
+        `cache_size` slots, and the answer in the slot that's taken over
+        is deleted.
+        """
+        slot = u'slot:{0}'.format(self.incr('slots') % self.cache_size)
+        evicted = self.retrieve(slot)
+        with self.pipeline():
+            if evicted and evicted != key:
+                self.delete(evicted)
+            self.store(key, answer, ttl)
+            self.store(slot, key)
+
+
+def normalize(question):
+    """
+    The question in lower case, without punctuation (but for decimal
+    points) and with single spaces, so different ways of typing the same
+    question share an answer
+    """
+    question = re.sub(ur'[?!,;:\'"`]|(?<!\d)\.|\.(?!\d)', u' ',
+                      question.lower())
+    return u' '.join(question.split())
 
 
 def _gather_results(tree):
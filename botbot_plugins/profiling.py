@@ -0,0 +1,276 @@
+"""
+Profiles dispatch, grouped per plugin handler, to find the plugin or
+route rule that slows the bot down:
+
+    profile = app.profile(packets, mode='sample')
+    print(profile.report())
+    profile.write_collapsed('botbot.collapsed')
+
+The collapsed stacks can be turned into a flame graph with
+`flamegraph.pl botbot.collapsed > botbot.svg`.
+
+In `cprofile` mode each handler is run under its own `cProfile.Profile`.
+In `sample` mode a thread records the stacks of the threads running
+dispatch or a handler every `interval` seconds, which costs less and
+also shows the time spent matching routes.
+"""
+from collections import Counter, defaultdict
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+from .metrics import MemorySink, now
+
+MODES = ('cprofile', 'sample')
+
+
+def frame_name(code):
+    return '{0} ({1}:{2})'.format(code.co_name,
+                                  os.path.basename(code.co_filename),
+                                  code.co_firstlineno)
+
+
+class RouteTimes(MemorySink):
+    """A sink keeping just the route match times, leaving storage as is"""
+
+    def incr(self, name, value=1, **tags):
+        pass
+
+    def timing(self, name, seconds, **tags):
+        if name == 'route.match':
+            super(RouteTimes, self).timing(name, seconds, **tags)
+
+    def storage(self, storage, plugin_slug):
+        return storage
+
+
+class Profiler(object):
+    """
+    Profiles an app's dispatch between `start` and `stop`, which returns
+    the `Profile`
+    """
+
+    def __init__(self, mode='cprofile', interval=0.001):
+        if mode not in MODES:
+            raise ValueError('mode must be one of {0}'.format(MODES))
+        self.mode = mode
+        self.interval = interval
+        self.app = None
+        # (handler key, thread ident) -> cProfile.Profile
+        self.profiles = {}
+        self.times = Counter()
+        self.calls = Counter()
+        # collapsed stack -> samples
+        self.stacks = Counter()
+        # idents of the threads in dispatch or a handler -> handler key
+        self._active = {}
+        self._sampler = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._previous_metrics = None
+
+    def start(self, app):
+        self.app = app
+        # route match times come from the metrics hooks
+        self._previous_metrics = app.metrics
+        self.sink = RouteTimes()
+        app.instrument(self.sink)
+        app.dispatch = self._wrap_dispatch(app.dispatch)
+        app.call_handler = self._wrap_handler(app.call_handler)
+        if self.mode == 'sample':
+            self._sampler = threading.Thread(target=self._sample)
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def stop(self):
+        """Stops profiling the app, returning the `Profile`"""
+        if self._sampler is not None:
+            self._stopped.set()
+            self._sampler.join()
+        # drop the wrappers set on the instance
+        del self.app.dispatch
+        del self.app.call_handler
+        self.app.instrument(self._previous_metrics)
+        return Profile(self)
+
+    def _wrap_dispatch(self, dispatch):
+        active = self._active
+
+        def profiled_dispatch(line):
+            ident = threading.current_thread().ident
+            active[ident] = None
+            try:
+                return dispatch(line)
+            finally:
+                del active[ident]
+        self._dispatch_code = profiled_dispatch.__code__
+        return profiled_dispatch
+
+    def _wrap_handler(self, call_handler):
+        active = self._active
+
+        def profiled_handler(func, line, kwargs):
+            key = '{0}.{1}'.format(func.im_self.slug, func.__name__)
+            ident = threading.current_thread().ident
+            outer = active.get(ident, False)
+            active[ident] = key
+            profile = None
+            if self.mode == 'cprofile':
+                # a profile can only be enabled on one thread at a time
+                with self._lock:
+                    profile = self.profiles.get((key, ident))
+                    if profile is None:
+                        profile = cProfile.Profile()
+                        self.profiles[key, ident] = profile
+            started = now()
+            if profile is not None:
+                profile.enable()
+            try:
+                return call_handler(func, line, kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                with self._lock:
+                    self.times[key] += now() - started
+                    self.calls[key] += 1
+                if outer is False:
+                    del active[ident]
+                else:
+                    active[ident] = outer
+        self._handler_code = profiled_handler.__code__
+        return profiled_handler
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in self._active.keys():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[self._collapse(frame)] += 1
+
+    def _collapse(self, frame):
+        """The stack of `frame` from where profiling starts, as a string"""
+        names = []
+        root = 0
+        while frame is not None:
+            code = frame.f_code
+            if code is self._handler_code:
+                names.append(frame.f_locals.get('key', 'handler'))
+                root = len(names)
+            elif code is self._dispatch_code:
+                names.append('dispatch')
+                root = len(names)
+            else:
+                names.append(frame_name(code))
+            frame = frame.f_back
+        return ';'.join(reversed(names[:root]))
+
+
+class Profile(object):
+    """What a `Profiler` collected, with a ranked report"""
+
+    def __init__(self, profiler):
+        self.mode = profiler.mode
+        self.times = profiler.times
+        self.calls = profiler.calls
+        # handler key -> pstats.Stats of its calls on all threads
+        self.stats = {}
+        for (key, _), profile in profiler.profiles.items():
+            if key in self.stats:
+                self.stats[key].add(profile)
+            else:
+                self.stats[key] = pstats.Stats(profile)
+        for stats in self.stats.values():
+            # the profiler's own call to stop profiling
+            for function in stats.stats.keys():
+                if '_lsprof.Profiler' in function[2]:
+                    del stats.stats[function]
+        self.stacks = profiler.stacks
+        self.metrics = profiler.sink.dump()
+
+    def handlers(self):
+        """`(handler, seconds, calls)` by total time, slowest first"""
+        return sorted(((key, seconds, self.calls[key])
+                       for key, seconds in self.times.items()),
+                      key=lambda handler: -handler[1])
+
+    def routes(self):
+        """`(handler, seconds, matches tried)` of the route rules by total
+        match time, slowest first"""
+        routes = [('{plugin}.{handler}'.format(**histogram['tags']),
+                   histogram['sum'], histogram['count'])
+                  for histogram in self.metrics['histograms']
+                  if histogram['name'] == 'route.match']
+        return sorted(routes, key=lambda route: -route[1])
+
+    def hot_functions(self, key, limit=5):
+        """`(function, seconds, share)` taking the most time in a handler"""
+        if self.mode == 'cprofile':
+            stats = self.stats[key].stats
+            total = sum(stat[2] for stat in stats.values()) or 1
+            functions = [('{0} ({1}:{2})'.format(name, os.path.basename(path),
+                                                 line), stat[2])
+                         for (path, line, name), stat in stats.items()]
+        else:
+            leaves = Counter()
+            for stack, samples in self.stacks.items():
+                frames = stack.split(';')
+                if key in frames:
+                    leaves[frames[-1]] += samples
+            total = sum(leaves.values()) or 1
+            functions = leaves.items()
+        functions = sorted(functions, key=lambda function: -function[1])
+        return [(name, value, float(value) / total)
+                for name, value in functions[:limit]]
+
+    def collapsed(self):
+        """
+        Collapsed stacks as `frame;frame;... count` lines. In `cprofile`
+        mode the stacks are just handler and function, counted in
+        microseconds of the function's own time.
+        """
+        if self.mode == 'sample':
+            stacks = self.stacks.items()
+        else:
+            stacks = defaultdict(int)
+            for key, stats in self.stats.items():
+                for (path, line, name), stat in stats.stats.items():
+                    function = '{0} ({1}:{2})'.format(
+                        name, os.path.basename(path), line)
+                    stacks[key + ';' + function] += int(stat[2] * 1000000)
+            stacks = stacks.items()
+        for stack, count in sorted(stacks):
+            if count:
+                yield '{0} {1}'.format(stack, count)
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as collapsed:
+            for line in self.collapsed():
+                collapsed.write(line + '\n')
+
+    def report(self, limit=10):
+        """A plain text report of the slowest handlers and route rules"""
+        lines = ['Handlers by total time',
+                 '{0:>10} {1:>8} {2:>10}  {3}'.format('total ms', 'calls',
+                                                      'mean ms', 'handler')]
+        handlers = self.handlers()
+        for key, seconds, calls in handlers[:limit]:
+            lines.append('{0:>10.2f} {1:>8} {2:>10.3f}  {3}'.format(
+                seconds * 1000, calls, seconds * 1000 / calls, key))
+        lines.extend(['', 'Route rules by total match time',
+                      '{0:>10} {1:>8}  {2}'.format('total ms', 'lines',
+                                                   'handler')])
+        for key, seconds, count in self.routes()[:limit]:
+            lines.append('{0:>10.2f} {1:>8}  {2}'.format(seconds * 1000,
+                                                         count, key))
+        unit = 'ms' if self.mode == 'cprofile' else 'samples'
+        for key, _, _ in handlers[:limit]:
+            lines.extend(['', 'Hot functions in {0}'.format(key)])
+            for name, value, share in self.hot_functions(key):
+                if self.mode == 'cprofile':
+                    value *= 1000
+                lines.append('{0:>10.2f} {1} {2:>4.0%}  {3}'.format(
+                    value, unit, share, name))
+        return '\n'.join(lines) + '\n'
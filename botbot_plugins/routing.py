@@ -0,0 +1,163 @@
+"""
+Route compilation for the app routers.
+
+Rules are compiled once, when a plugin is registered, instead of on every
+line. Each route also records the literal text a line has to start with
+and the literal substrings it has to contain to match, so most lines are
+rejected with `startswith` and `in` checks before the regex engine runs.
+"""
+import re
+import sre_constants
+import sre_parse
+
+
+class Route(object):
+    """A route rule compiled and bound to its handler"""
+
+    def __init__(self, rule, func):
+        self.rule = rule
+        self.func = func
+        self.pattern = re.compile(rule, re.IGNORECASE)
+        self.prefix = literal_prefix(rule)
+        self.literals = tuple(literal for literal in required_literals(rule)
+                              if literal != self.prefix)
+        # lines rejected by the prefilter / regex misses / regex matches
+        self.skips = 0
+        self.misses = 0
+        self.hits = 0
+
+    def match(self, text, lowered):
+        """
+        Matches `text` against the rule. `lowered` is `text.lower()`,
+        computed once per line by the caller.
+        """
+        if self.prefix and not lowered.startswith(self.prefix):
+            self.skips += 1
+            return None
+        for literal in self.literals:
+            if literal not in lowered:
+                self.skips += 1
+                return None
+        match = self.pattern.match(text)
+        if match:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return match
+
+    def stats(self):
+        """Returns the prefilter and regex counters for this route"""
+        return {'rule': self.rule,
+                'handler': self.func.__name__,
+                'skips': self.skips,
+                'misses': self.misses,
+                'hits': self.hits}
+
+    def __iter__(self):
+        # Router entries used to be `(rule, func)` tuples
+        return iter((self.rule, self.func))
+
+    def __repr__(self):
+        return '<Route {0!r} {1}>'.format(self.rule, self.func.__name__)
+
+
+def _parse(rule):
+    """Parses `rule`, returning None if the prefilter can't reason about it"""
+    try:
+        parsed = sre_parse.parse(rule)
+    except (sre_constants.error, TypeError):
+        return None
+    if parsed.pattern.flags & sre_constants.SRE_FLAG_LOCALE:
+        # Case folding depends on the locale, don't guess
+        return None
+    return parsed
+
+
+def _ascii_literal(op, av):
+    """Returns the lowercased character for an ASCII literal op, or None"""
+    if op == sre_constants.LITERAL and av < 128:
+        return chr(av).lower()
+    return None
+
+
+def literal_prefix(rule):
+    """
+    Returns the lowercased literal text any line matching `rule`
+    (with `re.match` and `re.IGNORECASE`) must start with.
+    """
+    parsed = _parse(rule)
+    if parsed is None:
+        return ''
+    chars = []
+    for op, av in parsed:
+        if (op == sre_constants.AT and not chars and
+                av == sre_constants.AT_BEGINNING):
+            continue
+        char = _ascii_literal(op, av)
+        if char is None:
+            break
+        chars.append(char)
+    return ''.join(chars)
+
+
+def _branch_literal(alternative):
+    """Returns the lowercased text of an all-literal branch alternative"""
+    chars = [_ascii_literal(op, av) for op, av in alternative]
+    if None in chars:
+        return None
+    return ''.join(chars)
+
+
+def _collect_literals(items, runs, current):
+    """
+    Walks parsed pattern `items`, appending the characters of the literal
+    run in progress to `current` and completed runs to `runs`.
+    """
+    for op, av in items:
+        char = _ascii_literal(op, av)
+        if char is not None:
+            current.append(char)
+            continue
+        if op == sre_constants.AT:
+            # zero-width, the run continues on the other side
+            continue
+        if op == sre_constants.SUBPATTERN:
+            _collect_literals(av[-1], runs, current)
+            continue
+        if op == sre_constants.BRANCH:
+            # `(?:GH|gh)` is the literal "gh" once case is folded
+            alternatives = set(_branch_literal(alt) for alt in av[1])
+            if len(alternatives) == 1 and None not in alternatives:
+                current.extend(alternatives.pop())
+                continue
+        _end_run(runs, current)
+        if (op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and
+                av[0] >= 1):
+            # the first repetition is required
+            inner = []
+            _collect_literals(av[2], runs, inner)
+            _end_run(runs, inner)
+
+
+def _end_run(runs, current):
+    if current:
+        runs.append(''.join(current))
+        del current[:]
+
+
+def required_literals(rule):
+    """
+    Returns the lowercased literal substrings every line matching `rule`
+    must contain, longest first.
+    """
+    parsed = _parse(rule)
+    if parsed is None:
+        return ()
+    runs = []
+    current = []
+    _collect_literals(parsed, runs, current)
+    _end_run(runs, current)
+    runs = sorted(set(runs), key=len, reverse=True)
+    # a run contained in a longer one adds nothing to the check
+    return tuple(run for i, run in enumerate(runs)
+                 if not any(run in longer for longer in runs[:i]))
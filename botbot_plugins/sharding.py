@@ -0,0 +1,242 @@
+"""
+Runs the plugins on a pool of worker processes, one shard of the
+channels each, so dispatch isn't limited to a single core.
+
+    runner = ShardedRunner(processes=4)
+    runner.start()
+    for packet, responses in runner.respond_many(packets):
+        ...
+    runner.stop()
+"""
+from collections import deque, OrderedDict
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import Queue
+
+from .base import DummyLine, MultiChannelApp
+from .manifest import load_manifest, plugin_for
+from .storage import WriteBuffer
+
+log = logging.getLogger(__name__)
+
+# The packet fields sent to the workers, in order
+FIELDS = ('text', 'User', 'Channel', 'Command')
+
+
+def plugin_app(modules=None):
+    """
+    Builds a `MultiChannelApp` with the plugin `modules` (all of them by
+    default) registered from the manifest
+    """
+    app = MultiChannelApp()
+    # workers aren't interactive, don't echo routes and responses
+    app.test_mode = True
+    for entry in load_manifest():
+        if not modules or entry['slug'] in modules:
+            app.register(plugin_for(entry))
+    return app
+
+
+def _pack(packet):
+    """A packet dict as a tuple of its `FIELDS`, to keep messages small"""
+    return tuple(packet.get(field) for field in FIELDS)
+
+
+def _unpack(fields):
+    return dict((field, value) for field, value in zip(FIELDS, fields)
+                if value is not None)
+
+
+def _work(app_factory, shard, inbox, outbox):
+    """
+    Runs in a worker process: dispatches the batches of packets put in
+    `inbox` and puts `(shard, batch_id, responses)` in `outbox` for each
+    one, until it gets None
+    """
+    app = app_factory()
+    storage = app.storage = WriteBuffer(app.storage)
+    for batch_id, packets in iter(inbox.get, None):
+        results = []
+        for fields in packets:
+            app.responses = []
+            try:
+                app.dispatch(DummyLine(_unpack(fields)))
+            except Exception:
+                log.exception('Error handling %r', fields)
+            results.append(app.responses)
+        app.flush()
+        storage.flush()
+        outbox.put((shard, batch_id, results))
+
+
+class ShardedRunner(object):
+    """
+    Dispatches packets (dicts like the `DummyApp.respond` kwargs plus
+    `text`) on `processes` worker processes, each with its own app from
+    `app_factory`. Every channel is handled by the same worker, so the
+    lines of a channel are handled, and their responses returned, in
+    order. Lines of different channels may be returned out of order.
+
+    Packets are sent to the workers in batches of up to `batch_size`.
+    A worker that dies is restarted and sent the batches it hadn't
+    finished again, so their lines may be handled twice.
+    """
+
+    def __init__(self, app_factory=plugin_app, processes=None,
+                 batch_size=100, max_outstanding=None):
+        self.app_factory = app_factory
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        # batches sent but not answered yet, before the runner waits
+        self.max_outstanding = max_outstanding or 4 * self.processes
+        self.results = multiprocessing.Queue()
+        self.workers = [None] * self.processes
+        self.inboxes = [None] * self.processes
+        # packets not sent yet, per shard
+        self.pending = [[] for _ in range(self.processes)]
+        # batch id -> packets, per shard, oldest first
+        self.unacked = [OrderedDict() for _ in range(self.processes)]
+        self.restarts = 0
+        self._shards = {}
+        self._ready = deque()
+        self._batch_ids = itertools.count()
+
+    def start(self):
+        for shard in range(self.processes):
+            self._spawn(shard)
+
+    def _spawn(self, shard):
+        """Starts the worker of `shard`, resending its unfinished batches"""
+        if self.inboxes[shard] is not None:
+            # don't wait on exit to feed a queue nobody reads anymore
+            self.inboxes[shard].cancel_join_thread()
+        inbox = self.inboxes[shard] = multiprocessing.Queue()
+        worker = self.workers[shard] = multiprocessing.Process(
+            target=_work, args=(self.app_factory, shard, inbox, self.results),
+            name='botbot-shard-{0}'.format(shard))
+        worker.daemon = True
+        worker.start()
+        for batch_id, packets in self.unacked[shard].items():
+            inbox.put((batch_id, [_pack(packet) for packet in packets]))
+
+    def shard_for(self, channel):
+        """The worker shard handling `channel`"""
+        shard = self._shards.get(channel)
+        if shard is None:
+            key = channel or ''
+            if isinstance(key, unicode):
+                key = key.encode('utf-8')
+            digest = hashlib.md5(key).hexdigest()
+            shard = self._shards[channel] = int(digest[:8], 16) % self.processes
+        return shard
+
+    def submit(self, packet):
+        """Queues a packet to be sent to the worker of its channel"""
+        if isinstance(packet, basestring):
+            packet = {'text': packet}
+        shard = self.shard_for(packet.get('Channel'))
+        self.pending[shard].append(packet)
+        if len(self.pending[shard]) >= self.batch_size:
+            self._send(shard)
+
+    def _send(self, shard):
+        packets, self.pending[shard] = self.pending[shard], []
+        if not packets:
+            return
+        batch_id = next(self._batch_ids)
+        self.unacked[shard][batch_id] = packets
+        self.inboxes[shard].put(
+            (batch_id, [_pack(packet) for packet in packets]))
+
+    def outstanding(self):
+        """The number of batches sent but not answered yet"""
+        return sum(len(batches) for batches in self.unacked)
+
+    def _collect(self, timeout=0.5):
+        """
+        Waits up to `timeout` seconds for a worker to answer a batch and
+        queues its `(packet, responses)`. Restarts workers that died.
+        """
+        try:
+            shard, batch_id, results = self.results.get(timeout=timeout)
+        except Queue.Empty:
+            self._restart_dead()
+            return
+        packets = self.unacked[shard].pop(batch_id, None)
+        if packets is not None:
+            self._ready.extend(zip(packets, results))
+
+    def _restart_dead(self):
+        for shard, worker in enumerate(self.workers):
+            if worker.exitcode not in (None, 0):
+                log.warning('Worker %s died (exit code %s), restarting',
+                            shard, worker.exitcode)
+                self.restarts += 1
+                self._spawn(shard)
+
+    def _take_ready(self):
+        while self._ready:
+            yield self._ready.popleft()
+
+    def respond_many(self, packets):
+        """
+        Dispatches a stream of packets, yielding `(packet, responses)` for
+        each one as the workers answer. Everything sent has been answered
+        when the iteration ends.
+        """
+        for packet in packets:
+            self.submit(packet)
+            while self.outstanding() >= self.max_outstanding:
+                self._collect()
+            for result in self._take_ready():
+                yield result
+        for result in self.drain():
+            yield result
+
+    def drain(self):
+        """Sends the queued packets and yields the answers to everything"""
+        for shard in range(self.processes):
+            self._send(shard)
+        while self.outstanding():
+            self._collect()
+            for result in self._take_ready():
+                yield result
+        for result in self._take_ready():
+            yield result
+
+    def restart(self, shard):
+        """
+        Has the worker of `shard` finish the batches sent to it and exit,
+        then starts a new one. Answers arriving meanwhile are kept for
+        `respond_many` and `drain`.
+        """
+        self._send(shard)
+        worker = self.workers[shard]
+        self.inboxes[shard].put(None)
+        # keep reading answers so the worker can flush its queue and exit
+        while worker.is_alive():
+            self._collect(timeout=0.1)
+        worker.join()
+        self.restarts += 1
+        self._spawn(shard)
+
+    def stop(self):
+        """
+        Stops the workers once everything sent is answered, returning the
+        `(packet, responses)` not yielded yet
+        """
+        results = list(self.drain())
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for worker in self.workers:
+            worker.join()
+        return results
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,72 @@
+"""
+Helpers that sit between plugins and the app's Redis storage.
+"""
+import threading
+import time
+
+
+class WriteBuffer(object):
+    """
+    Wraps a Redis client, holding SETs in memory until `flush` sends them
+    in a single pipeline. Only the latest value per key is kept, and GETs
+    of buffered keys are answered from the buffer so reads are never stale.
+
+    The buffer flushes itself once it holds `max_pending` keys or its
+    oldest write is `max_age` seconds old, if those are given. The latter
+    is done by a timer thread, so writes don't wait for the next `set` on
+    a quiet channel.
+
+    Any other command flushes the buffer first and then goes straight to
+    the wrapped client.
+    """
+
+    def __init__(self, storage, max_pending=None, max_age=None):
+        self.storage = storage
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.pending = {}
+        self._oldest = None
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            if not self.pending:
+                self._oldest = time.time()
+                if self.max_age is not None:
+                    self._timer = threading.Timer(self.max_age, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+            self.pending[name] = (value, ex)
+            if ((self.max_pending and len(self.pending) >= self.max_pending) or
+                    (self.max_age is not None and
+                     time.time() - self._oldest >= self.max_age)):
+                self.flush()
+        return True
+
+    def get(self, name):
+        with self._lock:
+            if name in self.pending:
+                return self.pending[name][0]
+        return self.storage.get(name)
+
+    def flush(self):
+        """Writes the buffered values to the wrapped client"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.pending:
+                return
+            pipe = self.storage.pipeline(transaction=False)
+            for name, (value, ex) in self.pending.items():
+                pipe.set(name, value, ex=ex)
+            pipe.execute()
+            self.pending.clear()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __getattr__(self, name):
+        self.flush()
+        return getattr(self.storage, name)
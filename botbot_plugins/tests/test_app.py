@@ -0,0 +1,185 @@
+import threading
+
+import pytest
+from botbot_plugins import config
+from botbot_plugins.base import BasePlugin, DummyApp, MultiChannelApp
+from botbot_plugins.decorators import io_bound, listens_to_all
+from botbot_plugins.executor import DEFER
+from botbot_plugins.plugins import brain, ping
+
+
+@pytest.fixture
+def app():
+    app_instance = DummyApp(test_plugin=ping.Plugin())
+    app_instance.register(brain.Plugin())
+    return app_instance
+
+
+def test_respond_many(app):
+    packets = [u'@ping',
+               {'text': u'@ping', 'User': 'george'},
+               u'nothing to see here']
+    results = [(line.user, responses)
+               for line, responses in app.respond_many(packets)]
+    assert results == [
+        ('repl_user', [u'Are you in need of my services, repl_user?']),
+        ('george', [u'Are you in need of my services, george?']),
+        ('repl_user', []),
+    ]
+
+
+def test_respond_many_buffers_writes(app):
+    storage = app.storage
+    replay = app.respond_many([u'@color=blue', u'@color?'], window=10)
+    line, responses = next(replay)
+    # the write is held back but already visible to the plugin
+    assert storage.get('brain:color') is None
+    line, responses = next(replay)
+    assert responses == [u'blue']
+    assert list(replay) == []
+    assert storage.get('brain:color') == 'blue'
+    assert app.storage is storage
+
+
+def test_respond_many_flushes_per_window(app):
+    storage = app.storage
+    packets = (u'@fact{0}=true'.format(i) for i in range(5))
+    replay = app.respond_many(packets, window=2)
+    for i in range(3):
+        next(replay)
+    assert storage.get('brain:fact1') is not None
+    assert storage.get('brain:fact2') is None
+    replay.close()
+    assert storage.get('brain:fact2') is not None
+
+
+class Blocking(BasePlugin):
+    """Holds every io_bound call until `release` is set"""
+
+    def __init__(self):
+        super(Blocking, self).__init__()
+        self.slug = 'blocking'
+        self.release = threading.Event()
+        self.callers = set()
+
+    @io_bound
+    @listens_to_all(ur'^fetch (?P<what>.+)$')
+    def fetch(self, line, what):
+        self.callers.add(threading.current_thread())
+        self.release.wait(5)
+        return u'fetched ' + what
+
+    @listens_to_all(ur'^fetch')
+    def cheap(self, line):
+        self.callers.add(threading.current_thread())
+        return u'inline'
+
+
+def test_thread_pool_runs_io_bound_handlers():
+    plugin = Blocking()
+    app = DummyApp(test_plugin=plugin)
+    app.use_thread_pool()
+    responses = app.respond(u'fetch cats')
+    assert responses == [u'inline']
+    plugin.release.set()
+    assert app.executor.join(5)
+    assert responses == [u'inline', u'fetched cats']
+    assert len(plugin.callers) == 2
+    assert threading.current_thread() in plugin.callers
+
+
+def test_thread_pool_sheds_when_saturated():
+    plugin = Blocking()
+    app = DummyApp(test_plugin=plugin)
+    app.use_thread_pool(concurrency=1, queue_size=1)
+    results = [app.respond(u'fetch {0}'.format(i)) for i in range(3)]
+    stats = app.executor.stats()['blocking']
+    assert (stats['running'], stats['queued'], stats['shed']) == (1, 1, 1)
+    plugin.release.set()
+    assert app.executor.join(5)
+    assert results == [[u'inline', u'fetched 0'],
+                       [u'inline', u'fetched 1'],
+                       [u'inline']]
+    stats = app.executor.stats()['blocking']
+    assert stats['completed'] == 2
+    assert stats['max_wait'] > 0
+
+
+def test_thread_pool_defers_when_saturated():
+    plugin = Blocking()
+    app = DummyApp(test_plugin=plugin)
+    app.use_thread_pool(concurrency=1, queue_size=0, policy=DEFER)
+    app.respond(u'fetch 0')
+    second = threading.Thread(target=app.respond, args=(u'fetch 1',))
+    second.start()
+    second.join(0.1)
+    # dispatch of the second line waits for the first call to finish
+    assert second.is_alive()
+    plugin.release.set()
+    second.join(5)
+    assert app.executor.join(5)
+    assert app.executor.stats()['blocking']['completed'] == 2
+
+
+class GreeterConfig(config.BaseConfig):
+    greeting = config.Field(default=u'hello')
+
+
+class Greeter(BasePlugin):
+    config_class = GreeterConfig
+
+    def __init__(self):
+        super(Greeter, self).__init__()
+        self.slug = 'greeter'
+
+    @listens_to_all(ur'^hi$')
+    def greet(self, line):
+        return self.config['greeting']
+
+    @io_bound
+    @listens_to_all(ur'^where$')
+    def where(self, line):
+        return self.app.namespace_for(self.slug)
+
+
+@pytest.fixture
+def host():
+    app_instance = MultiChannelApp(test_plugin=brain.Plugin())
+    app_instance.register(Greeter())
+    app_instance.storage.flushdb()
+    return app_instance
+
+
+def test_multi_channel_storage(host):
+    host.respond(u'@color=blue', Channel='#one')
+    host.respond(u'@color=red', Channel='#two')
+    assert host.respond(u'@color?', Channel='#one') == [u'blue']
+    assert host.respond(u'@color?', Channel='#two') == [u'red']
+    assert host.respond(u'@color?', Channel='#three') == []
+    assert host.storage.get('#one:brain:color') == 'blue'
+
+
+def test_multi_channel_config(host):
+    host.set_config('greeter', {'greeting': u'bonjour'}, channel='#fr')
+    assert host.respond(u'hi', Channel='#fr') == [u'bonjour']
+    assert host.respond(u'hi', Channel='#en') == [u'hello']
+    host.set_config('greeter', {'greeting': u'hey'})
+    assert host.respond(u'hi', Channel='#en') == [u'hey']
+    assert host.respond(u'hi', Channel='#fr') == [u'bonjour']
+
+
+def test_multi_channel_shares_plugins(host):
+    routes = list(host.routes())
+    for i in range(100):
+        host.respond(u'hi', Channel='#channel{0}'.format(i))
+    assert list(host.routes()) == routes
+    assert len(host.plugins) == 2
+    assert host.channel_configs == {}
+    assert host.current_channel() is None
+
+
+def test_multi_channel_thread_pool(host):
+    host.use_thread_pool()
+    responses = host.respond(u'where', Channel='#one')
+    assert host.executor.join(5)
+    assert responses == [u'#one:greeter']
@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import pytest
+from botbot_plugins.base import AsyncApp, BasePlugin
+from botbot_plugins.decorators import listens_to_all, timeout
+from botbot_plugins.plugins import github, jenkins
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves GitHub issues and Jenkins builds, slowly if asked to"""
+
+    def do_GET(self):
+        if '/slow/' in self.path:
+            time.sleep(0.5)
+        issue = self.path.rsplit('/', 1)[-1]
+        body = json.dumps({
+            'title': 'Issue {0}'.format(issue),
+            'html_url': 'https://github.com/org/repo/issues/' + issue})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if '/slow/' in self.path:
+            time.sleep(0.5)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server(request):
+    httpd = StubServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    request.addfinalizer(httpd.shutdown)
+    return 'http://127.0.0.1:{0}'.format(httpd.server_address[1])
+
+
+def make_app(server, github_path='', jenkins_path=''):
+    app = AsyncApp(test_plugin=github.Plugin())
+    app.register(jenkins.Plugin())
+    app.set_config('github', {'organization': 'org', 'repo': 'repo'})
+    app.set_config('jenkins', {'url': server + jenkins_path})
+    for plugin in (route.func.im_self
+                   for route in app.messages_router['github']):
+        plugin.url = server + github_path
+    return app
+
+
+def test_responses_in_match_order(server):
+    app = make_app(server)
+    responses = app.respond(u'@jenkins build proj for gh:repo#1')
+    assert responses == [
+        u'Issue 1: https://github.com/org/repo/issues/1',
+        u'Build started for proj.\n{0}/job/proj/lastBuild/console'.format(
+            server),
+    ]
+
+
+def test_handlers_run_concurrently(server):
+    app = make_app(server, github_path='/slow', jenkins_path='/slow')
+    started = time.time()
+    responses = app.respond(u'@jenkins build proj for gh:repo#1')
+    assert len(responses) == 2
+    assert time.time() - started < 0.9
+
+
+def test_slow_handler_times_out(server):
+    app = make_app(server, jenkins_path='/slow')
+    app.handler_timeout = 0.1
+    responses = app.respond(u'@jenkins build proj for gh:repo#1')
+    assert responses == [u'Issue 1: https://github.com/org/repo/issues/1']
+
+
+class Sleepy(BasePlugin):
+    @timeout(0.1)
+    @listens_to_all(ur'^nap$')
+    def nap(self, line):
+        time.sleep(0.5)
+        return u'yawn'
+
+    @listens_to_all(ur'^nap$')
+    def stay_up(self, line):
+        time.sleep(0.2)
+        return u'still here'
+
+
+def test_per_handler_timeout():
+    app = AsyncApp(test_plugin=Sleepy())
+    assert app.respond(u'nap') == [u'still here']
+
+
+class Stuck(BasePlugin):
+    def __init__(self, *args, **kwargs):
+        super(Stuck, self).__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    @timeout(0.05)
+    @listens_to_all(ur'^hang$')
+    def hang(self, line):
+        self.release.wait()
+
+    @listens_to_all(ur'^ping$')
+    def ping(self, line):
+        return u'pong'
+
+
+class SmallApp(AsyncApp):
+    max_workers = 2
+
+
+def test_hung_handlers_are_replaced():
+    plugin = Stuck()
+    app = SmallApp(test_plugin=plugin)
+    for _ in range(3):
+        assert app.respond(u'hang') == []
+    # two spares stand in for the first two hung handlers; the third
+    # holds a worker, which leaves one for other lines
+    assert app.respond(u'ping') == [u'pong']
+    assert len(app.pool._threads) == 4
+    plugin.release.set()
+    deadline = time.time() + 1
+    while len(app.pool._threads) > 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(app.pool._threads) == 2
@@ -0,0 +1,25 @@
+from mock import patch
+from botbot_plugins.cache import LRUCache
+
+
+def test_lru_eviction():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    # "b" was the least recently used
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'hit_ratio': 2 / 3.0,
+                             'size': 2, 'max_size': 2}
+
+
+def test_ttl():
+    cache = LRUCache(10, ttl=60)
+    with patch('time.time', return_value=1000):
+        cache.set('a', 1)
+    with patch('time.time', return_value=1059):
+        assert cache.get('a') == 1
+    with patch('time.time', return_value=1060):
+        assert cache.get('a') is None
@@ -0,0 +1,308 @@
+"""
+The conformance suite every storage engine has to pass. The Redis engine
+is tested against the server at BOTBOT_TEST_REDIS (whose database is
+flushed) when that is set.
+"""
+import os
+import time
+
+import pytest
+from mock import patch
+from botbot_plugins.base import BasePlugin, DummyApp
+from botbot_plugins.engines import (HEADER, LogEngine, MemoryEngine,
+                                    RedisEngine, SqliteEngine, engine_for)
+
+
+@pytest.fixture(params=['memory', 'log', 'sqlite', 'redis'])
+def engine(request, tmpdir):
+    if request.param == 'memory':
+        return MemoryEngine()
+    if request.param == 'log':
+        engine = LogEngine(str(tmpdir.join('botbot.log')))
+        request.addfinalizer(engine.close)
+        return engine
+    if request.param == 'sqlite':
+        engine = SqliteEngine(str(tmpdir.join('botbot.db')))
+        request.addfinalizer(engine.close)
+        return engine
+    url = os.environ.get('BOTBOT_TEST_REDIS')
+    if not url:
+        pytest.skip('BOTBOT_TEST_REDIS is not set')
+    engine = RedisEngine(url)
+    engine.flushdb()
+    return engine
+
+
+def test_strings(engine):
+    assert engine.get('missing') is None
+    assert engine.set('a', u'\xf6') is True
+    assert engine.get('a') == '\xc3\xb6'
+    engine.set('a', 2)
+    assert engine.get(u'a') == '2'
+    assert engine.incr('a') == 3
+    assert engine.incr('counter', 5) == 5
+    assert engine.get('counter') == '5'
+
+
+def test_many(engine):
+    assert engine.mset({'a': 'one', 'b': 'two'}) is True
+    assert engine.mget(['b', 'missing', 'a']) == ['two', None, 'one']
+
+
+def test_delete(engine):
+    engine.set('a', 'one')
+    engine.rpush('list', 'x')
+    engine.sadd('set', 'x')
+    assert engine.delete('a', 'list', 'set', 'missing') == 3
+    assert engine.keys() == []
+
+
+def test_lists(engine):
+    assert engine.rpush('list', 'a', 'b') == 2
+    assert engine.rpush('list', 'c', 'd') == 4
+    assert engine.lrange('list', 0, -1) == ['a', 'b', 'c', 'd']
+    assert engine.lrange('list', 1, 2) == ['b', 'c']
+    assert engine.lrange('list', -2, -1) == ['c', 'd']
+    assert engine.lrange('missing', 0, -1) == []
+    assert engine.ltrim('list', -3, -1)
+    assert engine.lrange('list', 0, -1) == ['b', 'c', 'd']
+    assert engine.rpush('list', 'e') == 4
+    assert engine.lrange('list', 0, -1) == ['b', 'c', 'd', 'e']
+    engine.ltrim('list', 5, -1)
+    assert engine.keys() == []
+
+
+def test_sets(engine):
+    assert engine.sadd('set', 'a', 'b', 'a') == 2
+    assert engine.sadd('set', 'b', 'c') == 1
+    assert engine.smembers('set') == set(['a', 'b', 'c'])
+    assert engine.srem('set', 'a', 'missing') == 1
+    assert engine.smembers('set') == set(['b', 'c'])
+    engine.srem('set', 'b', 'c')
+    assert engine.smembers('set') == set()
+    assert engine.keys() == []
+
+
+def test_keys(engine):
+    engine.mset({'brain:a': '1', 'brain:b': '2', 'last_seen:a': '3'})
+    assert sorted(engine.keys('brain:*')) == ['brain:a', 'brain:b']
+    assert engine.flushdb()
+    assert engine.keys() == []
+
+
+def test_expiry(engine):
+    assert engine.expire('missing', 10) is False
+    assert engine.ttl('missing') is None
+    engine.set('a', 'one')
+    assert engine.ttl('a') is None
+    assert engine.expire('a', 10) is True
+    assert 9 <= engine.ttl('a') <= 10
+    # setting a value drops its expiry
+    engine.set('a', 'two')
+    assert engine.ttl('a') is None
+
+    engine.set('b', 'one', ex=1)
+    engine.rpush('list', 'x')
+    engine.expire('list', 1)
+    time.sleep(1.1)
+    assert engine.get('b') is None
+    assert engine.lrange('list', 0, -1) == []
+    assert engine.keys() == ['a']
+
+
+def test_expired_keys_are_dropped_unread(engine):
+    # whole seconds, as Redis takes no others
+    engine.set('a', 'one', ex=1)
+    engine.rpush('list', 'x')
+    engine.expire('list', 1)
+    time.sleep(1.1)
+    engine.set('b', 'two')
+    if isinstance(engine, MemoryEngine):
+        assert engine.data.keys() == ['b']
+    elif isinstance(engine, SqliteEngine):
+        engine.purge()
+        assert engine.db.execute('SELECT COUNT(*) FROM items').fetchone() \
+            == (0,)
+    assert engine.keys() == ['b']
+
+
+def test_pipeline(engine):
+    engine.set('a', '1')
+    pipe = engine.pipeline()
+    pipe.incr('a')
+    pipe.rpush('list', 'x')
+    pipe.get('a')
+    assert engine.get('a') == '1'
+    assert pipe.execute() == [2, 1, '2']
+
+
+def test_plugin_storage(engine):
+    plugin = BasePlugin()
+    plugin.app = DummyApp(storage=engine)
+    plugin.store('fact', u'caf\xe9')
+    assert plugin.retrieve('fact') == u'caf\xe9'
+    plugin.push('queue', u'one')
+    plugin.push('queue', u'tw\xf6')
+    assert plugin.pop_all('queue') == [u'one', u'tw\xf6']
+    with plugin.pipeline() as results:
+        plugin.incr('count')
+        plugin.store('other', 1)
+    assert results == [1, True]
+
+
+def test_engine_for(tmpdir):
+    assert isinstance(engine_for('memory://'), MemoryEngine)
+    assert isinstance(engine_for('redis://localhost:6379/0'), RedisEngine)
+    path = tmpdir.join('botbot.db')
+    engine = engine_for('sqlite:///' + str(path))
+    engine.set('a', 'one')
+    engine.close()
+    assert SqliteEngine(str(path)).get('a') == 'one'
+    assert isinstance(engine_for('log:///' + str(tmpdir.join('botbot.log'))),
+                      LogEngine)
+    with pytest.raises(ValueError):
+        engine_for('mysql://localhost')
+
+
+def test_eviction(log_path):
+    for engine in (MemoryEngine(max_memory=2000),
+                   LogEngine(log_path, max_memory=2000)):
+        for index in range(20):
+            engine.set('key{0}'.format(index), 'x' * 100)
+            # key0 is used, so the next least recently used go first
+            engine.get('key0')
+        assert engine.memory <= 2000
+        assert engine.evicted == 20 - len(engine.data)
+        assert 'key0' in engine.data and 'key19' in engine.data
+        assert 'key1' not in engine.data
+        engine.rpush('list', *['x' * 100] * 5)
+        assert engine.memory <= 2000
+        engine.delete(*engine.keys())
+        assert engine.memory == 0
+
+
+def test_engine_options(log_path):
+    assert engine_for('memory://?max_memory=1000').max_memory == 1000
+    engine = engine_for('log:///{0}?max_memory=1000'.format(log_path))
+    assert (engine.path, engine.max_memory) == (log_path, 1000)
+    engine.close()
+    engine = engine_for('log:///{0}?sync_interval=0.5'.format(log_path))
+    assert engine.sync_interval == 0.5
+    engine.close()
+
+
+@pytest.fixture
+def log_path(tmpdir):
+    return str(tmpdir.join('botbot.log'))
+
+
+def fill(engine):
+    engine.set('a', 'one')
+    engine.set('gone', 'x', ex=1)
+    engine.incr('count', 2)
+    engine.rpush('list', 'x', 'y', 'z')
+    engine.ltrim('list', 1, -1)
+    engine.sadd('set', 'a', 'b')
+    engine.srem('set', 'a')
+    engine.set('b', 'two')
+    engine.expire('b', 100)
+    engine.delete('a')
+
+
+def check(engine):
+    assert sorted(engine.keys()) == ['b', 'count', 'list', 'set']
+    assert engine.get('count') == '2'
+    assert engine.lrange('list', 0, -1) == ['y', 'z']
+    assert engine.smembers('set') == set(['b'])
+    assert 99 <= engine.ttl('b') <= 100
+
+
+def test_log_survives_restart(log_path):
+    engine = LogEngine(log_path)
+    fill(engine)
+    engine.close()
+    time.sleep(1.1)
+    check(LogEngine(log_path))
+
+
+def test_log_cuts_torn_record(log_path):
+    engine = LogEngine(log_path)
+    engine.set('a', 'one')
+    engine.close()
+    size = os.path.getsize(log_path)
+    with open(log_path, 'ab') as log:
+        # a crash halfway through writing a record
+        log.write(HEADER.pack(100, 0) + 'partial')
+    engine = LogEngine(log_path)
+    assert engine.get('a') == 'one'
+    assert os.path.getsize(log_path) == size
+    engine.set('b', 'two')
+    engine.close()
+    assert LogEngine(log_path).keys() != []
+
+
+def test_log_batches_fsyncs(log_path):
+    engine = LogEngine(log_path, sync_interval=60)
+    with patch('os.fsync') as fsync:
+        for index in range(100):
+            engine.set('key', index)
+        assert not fsync.called
+        engine.sync()
+        assert fsync.call_count == 1
+    engine.close()
+
+    engine = LogEngine(log_path, sync_interval=0)
+    with patch('os.fsync') as fsync:
+        engine.set('key', 1)
+        engine.set('key', 2)
+        assert fsync.call_count == 2
+    engine.close()
+
+
+def test_log_pipeline_is_one_record(log_path):
+    engine = LogEngine(log_path)
+    pipe = engine.pipeline()
+    pipe.set('a', 1)
+    pipe.incr('a')
+    pipe.rpush('list', 'x')
+    pipe.execute()
+    engine.mset({'b': 1, 'c': 2})
+    assert engine.records == 2
+    engine.close()
+    assert LogEngine(log_path).mget(['a', 'b', 'c']) == ['2', '1', '2']
+
+
+def test_log_compaction(log_path):
+    engine = LogEngine(log_path, sync_interval=60)
+    fill(engine)
+    for index in range(1000):
+        engine.set('b', index)
+    engine.expire('b', 100)
+    engine.sync()
+    size = os.path.getsize(log_path)
+    time.sleep(1.1)
+    engine.compact()
+    assert os.path.getsize(log_path) < size / 10
+    # expired keys are left out
+    assert engine.records == 4
+    # writes after compacting are appended to the new log
+    engine.set('after', 'yes')
+    engine.close()
+    engine = LogEngine(log_path)
+    assert engine.get('after') == 'yes'
+    engine.delete('after')
+    check(engine)
+    assert engine.get('b') == '999'
+
+
+def test_log_compacts_itself(log_path):
+    engine = LogEngine(log_path, sync_interval=0.01, compact_min=100,
+                       compact_ratio=2)
+    for index in range(200):
+        engine.set('key', index)
+    deadline = time.time() + 2
+    while engine.records > 1 and time.time() < deadline:
+        time.sleep(0.01)
+    assert engine.records == 1
+    engine.close()
+    assert LogEngine(log_path).get('key') == '199'
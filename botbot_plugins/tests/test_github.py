@@ -1,19 +1,26 @@
 import pytest
 from mock import patch, call
-import requests
-from botbot_plugins.base import DummyApp
+from botbot_plugins.base import DummyApp, MultiChannelApp
+from botbot_plugins.http import CircuitOpen, HttpClient
 from botbot_plugins.plugins import github
 
 
 class FakeResponse(object):
     """Dummy response from GitHub"""
     status_code = 200
+    headers = {'ETag': '"abc123"'}
     json = lambda x: {
         'title': 'import PIL',
         'html_url': 'https://github.com/lincolnloop/python-qrcode/issues/2'
     }
 
 
+class FakeNotModified(object):
+    """Dummy response from GitHub to a conditional request"""
+    status_code = 304
+    headers = {}
+
+
 @pytest.fixture
 def app():
     dummy_app = DummyApp(test_plugin=github.Plugin())
@@ -22,13 +29,13 @@ def app():
 
 
 def test_github(app):
-    # patch requests.get so we don't need to make a real call to GitHub
-    with patch.object(requests, 'get') as mock_get:
+    # patch the HTTP client so we don't need to make a real call to GitHub
+    with patch.object(HttpClient, 'get') as mock_get:
         mock_get.return_value = FakeResponse()
         responses = app.respond("I'm working on gh:python-qrcode#2 today")
         mock_get.assert_called_with(
             'https://api.github.com/repos/lincolnloop/python-qrcode/issues/2',
-            auth=None)
+            auth=None, headers={})
         expected = ("import PIL: "
                     "https://github.com/lincolnloop/python-qrcode/issues/2")
         assert responses == [expected]
@@ -38,12 +45,15 @@ def test_github_multi(app):
     """Multiple issue lookup"""
     app.set_config('github', {'organization': 'gittip',
                               'repo': 'www.gittip.com'})
-    with patch.object(requests, 'get') as mock_get:
+    with patch.object(HttpClient, 'get') as mock_get:
         mock_get.return_value = FakeResponse()
         responses = app.respond("I'm working on gh1,2 today")
         expected_url = 'https://api.github.com/repos/gittip/www.gittip.com/issues/{}'
-        mock_get.assert_has_calls([call(expected_url.format('1'), auth=None),
-                                  call(expected_url.format('2'), auth=None)])
+        # the issues are fetched in parallel
+        mock_get.assert_has_calls(
+            [call(expected_url.format('1'), auth=None, headers={}),
+             call(expected_url.format('2'), auth=None, headers={})],
+            any_order=True)
         assert len(responses) == 1
         assert len(responses[0].split(',')) == 2
 
@@ -52,11 +62,74 @@ def test_greediness(app):
     """Regression test for Github issue #8"""
     app.set_config('github', {'organization': 'gittip',
                               'repo': 'www.gittip.com'})
-    with patch.object(requests, 'get') as mock_get:
+    with patch.object(HttpClient, 'get') as mock_get:
         mock_get.return_value = FakeResponse()
         responses = app.respond("tough cookies")
-        assert not mock_get.called, 'requests.get should not have been called'
+        assert not mock_get.called, 'GitHub should not have been called'
         assert responses == []
         responses = app.respond("tough, cookies")
-        assert not mock_get.called, 'requests.get should not have been called'
+        assert not mock_get.called, 'GitHub should not have been called'
         assert responses == []
+
+
+def test_cached_lookup(app):
+    """Repeated mentions are served from storage"""
+    expected = ("import PIL: "
+                "https://github.com/lincolnloop/python-qrcode/issues/2")
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse()
+        app.respond("gh:python-qrcode#2")
+        responses = app.respond("still on gh:python-qrcode#2")
+        assert mock_get.call_count == 1
+        assert responses == [expected]
+
+
+def test_conditional_lookup(app):
+    """Expired cache entries are revalidated with their ETag"""
+    url = 'https://api.github.com/repos/lincolnloop/python-qrcode/issues/2'
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse()
+        app.respond("gh:python-qrcode#2")
+    with patch.object(github.Plugin, 'cache_ttl', 0):
+        with patch.object(HttpClient, 'get') as mock_get:
+            mock_get.return_value = FakeNotModified()
+            responses = app.respond("gh:python-qrcode#2")
+            mock_get.assert_called_with(
+                url, auth=None, headers={'If-None-Match': '"abc123"'})
+    assert responses == ["import PIL: " + url.replace(
+        'api.github.com/repos', 'github.com')]
+
+
+def test_cached_issues_expire(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse()
+        app.respond("gh:python-qrcode#2")
+    key = app.storage.keys('github:issue:*')[0]
+    assert 0 < app.storage.ttl(key) <= github.Config.storage_ttl
+
+
+def test_channel_auth():
+    """Issues are fetched with the config of the line's channel"""
+    app = MultiChannelApp(test_plugin=github.Plugin())
+    app.set_config('github', {'organization': 'lincolnloop'})
+    app.set_config('github', {'user': 'bot', 'password': 'secret'},
+                   channel='#c')
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse()
+        app.respond("gh:python-qrcode#2", Channel='#c')
+        assert mock_get.call_args[1]['auth'] == ('bot', 'secret')
+        app.respond("gh:python-qrcode#2", Channel='#d')
+        assert mock_get.call_args[1]['auth'] is None
+
+
+def test_github_down(app):
+    """Issues GitHub can't be asked about are served stale, if at all"""
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse()
+        app.respond("gh:python-qrcode#2")
+    with patch.object(github.Plugin, 'cache_ttl', 0):
+        with patch.object(HttpClient, 'get', side_effect=CircuitOpen):
+            responses = app.respond("gh:python-qrcode#2,3")
+    assert responses == [
+        "import PIL: https://github.com/lincolnloop/python-qrcode/issues/2, "
+        "Sorry, GitHub didn't answer about issue #3"]
@@ -0,0 +1,176 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import pytest
+import requests
+from mock import patch
+from botbot_plugins.base import BasePlugin, DummyApp
+from botbot_plugins.http import CLOSED, OPEN, CircuitOpen, HttpClient
+from botbot_plugins.metrics import MemorySink
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers /ok with 200, /error with 500, /slow after half a second and
+    /flaky with 503 until it has been asked `server.flaky` times
+    """
+
+    def respond(self):
+        self.server.hits.append(self.path)
+        status = 200
+        if self.path == '/error':
+            status = 500
+        elif self.path == '/slow':
+            time.sleep(0.5)
+        elif self.path == '/flaky':
+            if self.server.hits.count('/flaky') <= self.server.flaky:
+                status = 503
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+
+    do_GET = do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server(request):
+    httpd = StubServer(('127.0.0.1', 0), StubHandler)
+    httpd.hits = []
+    httpd.flaky = 0
+    httpd.url = 'http://127.0.0.1:{0}'.format(httpd.server_address[1])
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    request.addfinalizer(httpd.shutdown)
+    return httpd
+
+
+@pytest.fixture
+def client():
+    return HttpClient(retries=2, backoff=0.001, failure_threshold=3,
+                      reset_timeout=0.2)
+
+
+def test_plugins_share_a_client():
+    assert isinstance(BasePlugin.http, HttpClient)
+
+
+def test_keeps_connections_per_host(client, server):
+    assert client.get(server.url + '/ok').status_code == 200
+    assert client.post(server.url + '/ok').status_code == 200
+    assert client.hosts.keys() == [server.url]
+    stats = client.stats()[server.url]
+    assert (stats['requests'], stats['errors'], stats['state']) == \
+        (2, 0, CLOSED)
+
+
+def test_retries_idempotent_requests(client, server):
+    server.flaky = 2
+    assert client.get(server.url + '/flaky').status_code == 200
+    assert server.hits == ['/flaky'] * 3
+    assert client.stats()[server.url]['retries'] == 2
+
+
+def test_gives_up_after_retries(client, server):
+    server.flaky = 5
+    assert client.get(server.url + '/flaky').status_code == 503
+    assert len(server.hits) == 3
+
+
+def test_does_not_retry_posts(client, server):
+    server.flaky = 1
+    assert client.post(server.url + '/flaky').status_code == 503
+    assert server.hits == ['/flaky']
+
+
+def test_read_timeout(server):
+    client = HttpClient(read_timeout=0.1, retries=1, backoff=0.001)
+    with pytest.raises(requests.Timeout):
+        client.get(server.url + '/slow')
+    assert server.hits == ['/slow', '/slow']
+    assert client.stats()[server.url]['errors'] == 2
+
+
+def test_circuit_breaker(client, server):
+    for _ in range(3):
+        assert client.post(server.url + '/error').status_code == 500
+    assert client.stats()[server.url]['state'] == OPEN
+    # fails fast without calling the host
+    with pytest.raises(CircuitOpen):
+        client.get(server.url + '/ok')
+    assert len(server.hits) == 3
+    assert client.stats()[server.url]['rejected'] == 1
+
+    time.sleep(0.2)
+    assert client.get(server.url + '/ok').status_code == 200
+    assert client.stats()[server.url]['state'] == CLOSED
+
+
+def test_failed_probe_reopens_circuit(client, server):
+    for _ in range(3):
+        client.post(server.url + '/error')
+    time.sleep(0.2)
+    client.post(server.url + '/error')
+    assert client.stats()[server.url]['state'] == OPEN
+    with pytest.raises(CircuitOpen):
+        client.get(server.url + '/ok')
+
+
+def test_any_error_ends_probe(client, server):
+    for _ in range(3):
+        client.post(server.url + '/error')
+    time.sleep(0.2)
+    host = client.hosts[server.url]
+    with patch.object(host.session, 'request',
+                      side_effect=requests.TooManyRedirects):
+        with pytest.raises(requests.TooManyRedirects):
+            client.get(server.url + '/ok')
+    assert (host.state, host.probing) == (OPEN, False)
+    time.sleep(0.2)
+    assert client.get(server.url + '/ok').status_code == 200
+
+
+def test_importing_plugins_skips_clients():
+    """`requests`, `redis` and `sqlite3` are loaded once they're used"""
+    script = ('import sys, botbot_plugins.base; '
+              'print sorted(set(["requests", "redis", "sqlite3"]) & '
+              'set(sys.modules))')
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     env=dict(os.environ,
+                                              PYTHONPATH=os.pathsep.join(
+                                                  sys.path)))
+    assert output.strip() == '[]'
+
+
+def test_metrics(server):
+    sink = MemorySink()
+    app = DummyApp(test_plugin=BasePlugin())
+    other = DummyApp(test_plugin=BasePlugin())
+    app.instrument(sink)
+    # each app has its own sink, or none
+    other.instrument(None)
+    app.plugins[0].http.get(server.url + '/ok')
+    app.plugins[0].http.post(server.url + '/error')
+    other.plugins[0].http.get(server.url + '/ok')
+    BasePlugin.http.get(server.url + '/ok')
+    host = server.url.split('//')[1]
+    dump = sink.dump()
+    assert [(entry['name'], entry['tags'], entry['value'])
+            for entry in dump['counters']] == \
+        [('http.errors', {'host': host}, 1)]
+    assert [(entry['name'], entry['tags'], entry['count'])
+            for entry in dump['histograms']] == \
+        [('http.time', {'host': host}, 2)]
@@ -0,0 +1,131 @@
+import json
+import time
+
+import pytest
+from mock import patch
+from botbot_plugins.base import DummyApp, MultiChannelApp
+from botbot_plugins.http import CircuitOpen, HttpClient
+from botbot_plugins.plugins import images
+
+
+class FakeResponse(object):
+    """Dummy response from Google Images"""
+    status_code = 200
+
+    def __init__(self, *urls):
+        self.urls = urls
+
+    def json(self):
+        return {'responseData': {'results': [{'unescapedUrl': url}
+                                             for url in self.urls]}}
+
+
+@pytest.fixture
+def app():
+    dummy_app = DummyApp(test_plugin=images.Plugin())
+    return dummy_app
+
+
+def test_image(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse('http://a/cat.jpg')
+        responses = app.respond(u'@image me cats')
+        assert 'q=cats' in mock_get.call_args[0][0]
+    assert responses == [u'http://a/cat.jpg#.png']
+
+
+def test_rotates_through_cached_results(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse('http://a/1.jpg', 'http://a/2.jpg')
+        responses = [app.respond(text)[0] for text in
+                     [u'@image me cats', u'@img  Cats', u'@image me cats']]
+        assert mock_get.call_count == 1
+    assert responses == [u'http://a/1.jpg#.png', u'http://a/2.jpg#.png',
+                         u'http://a/1.jpg#.png']
+
+
+def test_animated_results_are_cached_apart(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse('http://a/cat.jpg')
+        app.respond(u'@image me cats')
+        mock_get.return_value = FakeResponse('http://a/cat.gif')
+        assert app.respond(u'@animate me cats') == [u'http://a/cat.gif#.png']
+        assert 'as_filetype=gif' in mock_get.call_args[0][0]
+        assert mock_get.call_count == 2
+
+
+def test_no_results_are_not_cached(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse()
+        app.respond(u'@image me nothing')
+        app.respond(u'@image me nothing')
+        assert mock_get.call_count == 2
+
+
+def test_turns_expire(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse('http://a/cat.jpg')
+        app.respond(u'@image me cats')
+    key = [k for k in app.storage.keys() if k.endswith(':turn')][0]
+    assert 0 < app.storage.ttl(key) <= images.Plugin.cache_ttl
+
+
+def test_search_off_dispatch_thread(app):
+    def slow_get(url):
+        time.sleep(0.2)
+        return FakeResponse('http://a/cat.jpg')
+
+    app.use_thread_pool()
+    with patch.object(HttpClient, 'get', side_effect=slow_get):
+        started = time.time()
+        responses = app.respond(u'@image me cats')
+        assert time.time() - started < 0.1
+        assert app.executor.join(5)
+    assert responses == [u'http://a/cat.jpg#.png']
+
+
+def check_refresh(app, **kwargs):
+    plugin = app.plugins[0]
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse('http://a/old.jpg')
+        app.respond(u'@image me cats', **kwargs)
+        key = [k for k in app.storage.keys() if 'results' in k
+               and not k.endswith('turn')][0]
+        entry = json.loads(app.storage.get(key))
+        entry['fetched'] -= plugin.refresh_after
+        app.storage.set(key, json.dumps(entry))
+
+        mock_get.return_value = FakeResponse('http://a/new.jpg')
+        # the stale result is answered while the new one is fetched
+        assert app.respond(u'@image me cats', **kwargs) == \
+            [u'http://a/old.jpg#.png']
+        deadline = time.time() + 1
+        while plugin._refreshing and time.time() < deadline:
+            time.sleep(0.01)
+        assert app.respond(u'@image me cats', **kwargs) == \
+            [u'http://a/new.jpg#.png']
+        assert mock_get.call_count == 2
+    return key
+
+
+def test_stale_results_are_refreshed(app):
+    check_refresh(app)
+
+
+def test_channel_results_are_refreshed():
+    app = MultiChannelApp(test_plugin=images.Plugin())
+    key = check_refresh(app, Channel='#c')
+    assert key.startswith('#c:images:results:')
+    assert all(k.startswith('#c:') for k in app.storage.keys())
+
+
+def test_mustache_url(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        responses = app.respond(u'@mustache me http://a/queen.jpg')
+        assert not mock_get.called
+    assert responses[0].endswith('?src=http://a/queen.jpg')
+
+
+def test_google_down(app):
+    with patch.object(HttpClient, 'get', side_effect=CircuitOpen):
+        assert app.respond(u'@image me cats') == []
@@ -1,7 +1,7 @@
 import pytest
 from mock import patch, call
-import requests
 from botbot_plugins.base import DummyApp
+from botbot_plugins.http import CircuitOpen, HttpClient
 from botbot_plugins.plugins import jenkins
 
 
@@ -20,8 +20,8 @@ def app():
 
 
 def test_success_jenkins(app):
-    # patch requests.post so we don't need to make a real call to Jenkins
-    with patch.object(requests, 'post') as mock_post:
+    # patch the HTTP client so we don't need to make a real call to Jenkins
+    with patch.object(HttpClient, 'post') as mock_post:
         mock_post.return_value = FakeResponse()
         responses = app.respond("@jenkins build myproj")
         assert responses == [
@@ -31,8 +31,14 @@ def test_success_jenkins(app):
 
 
 def test_fail_jenkins(app):
-    # patch requests.post so we don't need to make a real call to Jenkins
-    with patch.object(requests, 'post') as mock_post:
+    # patch the HTTP client so we don't need to make a real call to Jenkins
+    with patch.object(HttpClient, 'post') as mock_post:
         mock_post.return_value = FakeResponse(status_code=405)
         responses = app.respond("@jenkins build myproj")
         assert responses == ["Error building myproj. Jenkins returned 405."]
+
+
+def test_jenkins_down(app):
+    with patch.object(HttpClient, 'post', side_effect=CircuitOpen):
+        responses = app.respond("@jenkins build myproj")
+    assert responses == ["Error building myproj. Jenkins couldn't be reached."]
@@ -1,8 +1,10 @@
 import pytest
 import json
-from mock import patch, call
-import requests
-from botbot_plugins.base import DummyApp
+import threading
+import time
+from mock import Mock, patch, call
+from botbot_plugins.base import DummyApp, MultiChannelApp
+from botbot_plugins.http import CircuitOpen, HttpClient
 from botbot_plugins.plugins import jira
 
 class FakeProjectResponse(object):
@@ -13,12 +15,27 @@ class FakeProjectResponse(object):
 class FakeUserResponse1(object):
     """Dummy response from JIRA"""
     status_code = 200
-    text = json.dumps({'key': 'TEST-123', 'fields': {'summary': "Testing JIRA plugin"}})    
+    text = json.dumps({'issues': [
+        {'key': 'TEST-123', 'fields': {'summary': "Testing JIRA plugin"}}]})
 
 class FakeUserResponse2(object):
     """Dummy response from JIRA"""
     status_code = 200
-    text = json.dumps({'key': 'TEST-234', 'fields': {'summary': "Testing JIRA plugin"}})    
+    text = json.dumps({'issues': [
+        {'key': 'TEST-234', 'fields': {'summary': "Testing JIRA plugin"}}]})
+
+class FakeSearchResponse(object):
+    """Dummy response from JIRA"""
+    status_code = 200
+    text = json.dumps({'issues': [
+        {'key': 'TEST-234', 'fields': {'summary': "Second issue"}},
+        {'key': 'TEST-345', 'fields': {'summary': "Third issue"}}]})
+
+def search_params(*keys):
+    return {'jql': 'key in ({})'.format(','.join(keys)),
+            'fields': 'summary',
+            'maxResults': len(keys),
+            'validateQuery': 'warn'}
 
 @pytest.fixture
 def app():
@@ -28,30 +45,156 @@ def app():
 
 
 def test_jira(app):
-    # patch requests.get so we don't need to make a real call to Jira
+    # patch the HTTP client so we don't need to make a real call to Jira
 
     # Test project retrival
-    with patch.object(requests, 'get') as mock_get:
+    with patch.object(HttpClient, 'get') as mock_get:
         mock_get.return_value = FakeProjectResponse()
         responses = app.respond("@UPDATE:JIRA")
         mock_get.assert_called_with(
             'https://tickets.test.org/rest/api/2/project')
         assert responses == ["Successfully updated projects list"]
 
-    # Test appropriate response       
-    with patch.object(requests, 'get') as mock_get:
+    # Test appropriate response
+    with patch.object(HttpClient, 'get') as mock_get:
         mock_get.return_value = FakeUserResponse1()
         responses = app.respond("I just assigned TEST-123 to testuser")
         mock_get.assert_called_with(
-            'https://tickets.test.org/rest/api/2/issue/TEST-123')
+            'https://tickets.test.org/rest/api/2/search',
+            params=search_params('TEST-123'))
         assert responses == ["TEST-123: Testing JIRA plugin https://tickets.test.org/browse/TEST-123"]
 
-    # Test response when issue is mentioned as part of url
-    with patch.object(requests, 'get') as mock_get:
-        mock_get.return_value = FakeUserResponse1()
+    # Test response when issue is mentioned as part of url, the summary
+    # is cached from the previous mention
+    with patch.object(HttpClient, 'get') as mock_get:
         responses = app.respond("Check out https://tickets.test.org/browse/TEST-123")
-        mock_get.assert_called_with(
-            'https://tickets.test.org/rest/api/2/issue/TEST-123')
+        assert not mock_get.called
         assert responses == ["TEST-123: Testing JIRA plugin"]
 
 
+def test_jira_batch_lookup(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeProjectResponse()
+        app.respond("@UPDATE:JIRA")
+    plugin = app.messages_router['jira'][0].func.im_self
+    plugin.summaries.set(('jira', 'TEST-123'), "First issue")
+
+    # only the uncached issues are searched for, in a single request
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeSearchResponse()
+        responses = app.respond("TEST-123 TEST-234 TEST-345 TEST-999 TEST-234")
+        mock_get.assert_called_once_with(
+            'https://tickets.test.org/rest/api/2/search',
+            params=search_params('TEST-234', 'TEST-345', 'TEST-999'))
+    assert responses == ["\n".join([
+        "TEST-123: First issue https://tickets.test.org/browse/TEST-123",
+        "TEST-234: Second issue https://tickets.test.org/browse/TEST-234",
+        "TEST-345: Third issue https://tickets.test.org/browse/TEST-345"])]
+    stats = plugin.summaries.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 3, 3)
+
+
+def test_jira_without_projects(app):
+    app.storage.delete('jira:projects')
+    with patch.object(HttpClient, 'get') as mock_get:
+        responses = app.respond("I just assigned TEST-123 to testuser")
+        assert not mock_get.called
+        assert responses == []
+
+
+def test_jira_project_index():
+    plugin = jira.Plugin()
+    app = DummyApp(test_plugin=plugin)
+    app.set_config('jira', {'jira_url': 'https://tickets.test.org', 'bot_name': 'testbot'})
+    plugin.store('projects', json.dumps(['TEST', 'TESTING']))
+    assert plugin.get_projects() == frozenset(['TEST', 'TESTING'])
+
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeUserResponse2()
+        app.respond("XTEST-1 and TESTING-9 and OTHER-2")
+        mock_get.assert_called_once_with(
+            'https://tickets.test.org/rest/api/2/search',
+            params=search_params('TESTING-9'))
+
+    # UPDATE:JIRA replaces the index
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeProjectResponse()
+        app.respond("@UPDATE:JIRA")
+    assert plugin.get_projects() == frozenset(['TEST'])
+
+
+def test_jira_starts_one_refresher(app):
+    plugin = app.plugins[0]
+    started = []
+
+    class SlowThread(object):
+        """Takes a while to make, as lookups on other threads go on"""
+        def __init__(self, target):
+            time.sleep(0.01)
+            started.append(target)
+
+        def start(self):
+            pass
+
+    lookups = [threading.Thread(target=plugin._start_refresher)
+               for _ in range(5)]
+    with patch.object(jira, 'threading', Mock(Thread=SlowThread)):
+        for lookup in lookups:
+            lookup.start()
+        for lookup in lookups:
+            lookup.join()
+    assert len(started) == 1
+
+
+def test_jira_channels():
+    """Each channel has its own JIRA, projects and summaries"""
+    plugin = jira.Plugin()
+    app = MultiChannelApp(test_plugin=plugin)
+    app.set_config('jira', {'bot_name': 'testbot'})
+    app.set_config('jira', {'jira_url': 'https://a.test.org'}, channel='#a')
+    app.set_config('jira', {'jira_url': 'https://b.test.org'}, channel='#b')
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeProjectResponse()
+        app.respond("@UPDATE:JIRA", Channel='#a')
+        mock_get.assert_called_with('https://a.test.org/rest/api/2/project')
+    assert app.storage.keys('*projects') == ['#a:jira:projects']
+
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeUserResponse1()
+        assert app.respond("TEST-123", Channel='#a') == \
+            ["TEST-123: Testing JIRA plugin https://a.test.org/browse/TEST-123"]
+        # #b hasn't loaded its projects
+        assert app.respond("TEST-123", Channel='#b') == []
+        assert mock_get.call_count == 1
+
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeProjectResponse()
+        app.respond("@UPDATE:JIRA", Channel='#b')
+        mock_get.assert_called_with('https://b.test.org/rest/api/2/project')
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeUserResponse1()
+        app.respond("TEST-123", Channel='#b')
+        # the summary cached for #a isn't used
+        mock_get.assert_called_once_with(
+            'https://b.test.org/rest/api/2/search',
+            params=search_params('TEST-123'))
+
+    # the refresher fetches each channel's projects from its own JIRA
+    app.storage.flushdb()
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeProjectResponse()
+        for refresh in plugin._refreshes.values():
+            refresh()
+        assert sorted(args[0][0] for args in mock_get.call_args_list) == [
+            'https://a.test.org/rest/api/2/project',
+            'https://b.test.org/rest/api/2/project']
+    assert sorted(app.storage.keys('*projects')) == \
+        ['#a:jira:projects', '#b:jira:projects']
+
+
+def test_jira_down(app):
+    app.storage.set('jira:projects', json.dumps(['TEST']))
+    with patch.object(HttpClient, 'get', side_effect=CircuitOpen):
+        assert app.respond("TEST-123") == []
+        assert app.respond("@UPDATE:JIRA") == \
+            ["Could not update projects list"]
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+from botbot_plugins.base import DummyApp
+from botbot_plugins.plugins import last_seen
+
+
+@pytest.fixture
+def app():
+    app_instance = DummyApp(test_plugin=last_seen.Plugin())
+    app_instance.storage.flushdb()
+    return app_instance
+
+
+def test_last_seen(app):
+    app.respond(u'hello there', User='george')
+    responses = app.respond(u'@seen george')
+    assert responses[0].startswith(u'Yes, I saw george')
+    assert responses[0].endswith(u'george said: "hello there"')
+
+
+def test_not_seen(app):
+    responses = app.respond(u'@seen nobody')
+    assert responses == [u"Sorry, I haven't seen nobody."]
+
+
+def test_writes_are_coalesced(app):
+    plugin = app.plugins[0]
+    plugin.flush_size = 3
+    for i in range(10):
+        app.respond(u'message {0}'.format(i), User='george')
+        app.respond(u'message {0}'.format(i), User='ringo')
+    # only the latest message per nick is pending, nothing written yet
+    assert app.storage.get('last_seen:george') is None
+    assert len(plugin.buffer) == 2
+    responses = app.respond(u'@seen ringo', User='paul')
+    assert responses[0].endswith(u'ringo said: "message 9"')
+    # paul's line is the third pending nick
+    assert app.storage.get('last_seen:george').endswith('message 9')
+
+
+def test_flush(app):
+    app.respond(u'hello there', User='george')
+    app.flush()
+    assert app.storage.get('last_seen:george').endswith('hello there')
+
+
+def test_flushed_when_quiet(app):
+    plugin = app.plugins[0]
+    plugin.flush_interval = 0.05
+    app.respond(u'hello there', User='george')
+    assert app.storage.get('last_seen:george') is None
+    # no other line comes in to trigger the flush
+    time.sleep(0.2)
+    assert app.storage.get('last_seen:george').endswith('hello there')
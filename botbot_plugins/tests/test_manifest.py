@@ -0,0 +1,80 @@
+import json
+
+from mock import patch
+import pytest
+from botbot_plugins import manifest
+from botbot_plugins.base import DummyApp
+from botbot_plugins.manifest import (LazyPlugin, build_manifest,
+                                     describe_module, load_manifest,
+                                     plugin_for)
+
+
+@pytest.fixture
+def entries():
+    return dict((entry['slug'], entry) for entry in build_manifest())
+
+
+def test_manifest_describes_routes(entries):
+    ping = entries['ping']
+    assert ping['static']
+    assert ping['module'] == 'botbot_plugins.plugins.ping'
+    assert ping['config'] is None
+    assert [(route['name'], route['route_rule']) for route in ping['routes']] \
+        == [('respond_to_ping', ['mentions', u'^ping$'])]
+
+    routes = dict((route['name'], route)
+                  for route in entries['message_service']['routes'])
+    assert routes['find_message']['commands'] == ['JOIN']
+    assert routes['find_message']['route_rule'] == ['firehose', u'(.*)']
+
+
+def test_manifest_describes_io_bound_and_config(entries):
+    wolfram = entries['wolfram']
+    assert wolfram['routes'][0]['io_bound']
+    assert wolfram['config'] == {'app_id': None}
+
+
+def test_manifest_marks_dynamic_plugins():
+    entry = describe_module(
+        'RULE = "^x$"\n'
+        'class Plugin(BasePlugin):\n'
+        '    @listens_to_all(RULE)\n'
+        '    def handler(self, line):\n'
+        '        pass\n', 'plugins.dynamic')
+    assert not entry['static']
+
+
+def test_load_manifest_from_file(tmpdir, entries):
+    path = tmpdir.join('manifest.json')
+    path.write(json.dumps(build_manifest()))
+    loaded = dict((entry['slug'], entry) for entry in load_manifest(str(path)))
+    assert loaded == json.loads(json.dumps(entries))
+
+
+def test_lazy_plugin_imported_on_first_match(entries):
+    with patch.object(manifest, 'import_module',
+                      wraps=manifest.import_module) as import_module:
+        app = DummyApp(test_plugin=plugin_for(entries['ping']))
+        assert app.respond(u'@pong') == []
+        assert not import_module.called
+        assert app.respond(u'@ping') == \
+            [u'Are you in need of my services, repl_user?']
+        import_module.assert_called_once_with('botbot_plugins.plugins.ping')
+        # later lines go straight to the real plugin
+        app.respond(u'@ping')
+        assert import_module.call_count == 1
+
+    plugin = app.plugins[0]
+    assert not isinstance(plugin, LazyPlugin)
+    assert all(route.func.im_self is plugin
+               for _, _, route in app.routes())
+
+
+def test_lazy_plugin_keeps_config(entries):
+    app = DummyApp()
+    lazy = plugin_for(entries['wolfram'])
+    app.register(lazy)
+    app.set_config('wolfram', {'app_id': 'abc'})
+    plugin = lazy.load()
+    assert plugin.config['app_id'] == 'abc'
+    assert isinstance(app.plugin_configs['wolfram'], plugin.config_class)
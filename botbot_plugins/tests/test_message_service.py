@@ -2,6 +2,8 @@
 """
 Message service tests
 """
+import json
+
 import pytest
 from botbot_plugins.base import DummyApp
 from botbot_plugins.plugins import message_service
@@ -9,7 +11,8 @@ from botbot_plugins.plugins import message_service
 
 @pytest.fixture
 def app():
-    return DummyApp(test_plugin=message_service.Plugin())
+    app_instance = DummyApp(test_plugin=message_service.Plugin())
+    return app_instance
 
 
 def test_remember(app):
@@ -42,6 +45,39 @@ def test_multiple_reminders(app):
     responses = app.respond('george joined the channel', **{
         'Command': 'JOIN',
         'User': 'george'})
-    assert responses == ["Beep BEEP! You received the following messages in #dummy-channel when you were offline.\nFrom repl_user 'I think I will be going.'\nFrom repl_user 'Are you going to the meeting?'"]
+    assert responses == ["Beep BEEP! You received the following messages in #dummy-channel when you were offline.\nFrom repl_user 'Are you going to the meeting?'\nFrom repl_user 'I think I will be going.'"]
+
+    # the messages are only delivered once
+    responses = app.respond('george joined the channel', **{
+        'Command': 'JOIN',
+        'User': 'george'})
+    assert responses == []
 
 
+def test_message_cap(app):
+    """
+    Only the newest messages are kept for a user.
+    """
+    app.plugins[0].max_messages = 2
+    for i in range(4):
+        app.respond(r'@message george Reminder {0}'.format(i))
+
+    responses = app.respond('george joined the channel', **{
+        'Command': 'JOIN',
+        'User': 'george'})
+    assert responses == ["Beep BEEP! You received the following messages in #dummy-channel when you were offline.\nFrom repl_user 'Reminder 2'\nFrom repl_user 'Reminder 3'"]
+
+
+def test_legacy_messages(app):
+    """
+    Messages stored as a JSON list before inboxes are delivered once.
+    """
+    app.storage.set('message_service:george',
+                    json.dumps(["From repl_user 'Old news'"]))
+    app.respond(r'@message george New news')
+
+    responses = app.respond('george joined the channel', **{
+        'Command': 'JOIN',
+        'User': 'george'})
+    assert responses == ["Beep BEEP! You received the following messages in #dummy-channel when you were offline.\nFrom repl_user 'Old news'\nFrom repl_user 'New news'"]
+    assert app.storage.keys() == []
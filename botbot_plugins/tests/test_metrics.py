@@ -0,0 +1,117 @@
+import socket
+
+import pytest
+from botbot_plugins.base import BasePlugin, DummyApp
+from botbot_plugins.decorators import listens_to_all
+from botbot_plugins.metrics import MemorySink, PrometheusSink, StatsdSink
+from botbot_plugins.plugins import brain
+
+
+class Broken(BasePlugin):
+
+    def __init__(self):
+        super(Broken, self).__init__()
+        self.slug = 'broken'
+
+    @listens_to_all(ur'^break$')
+    def explode(self, line):
+        raise ValueError('broken')
+
+
+@pytest.fixture
+def app():
+    app_instance = DummyApp(test_plugin=brain.Plugin())
+    app_instance.storage.flushdb()
+    return app_instance
+
+
+def metric(dump, kind, name, **tags):
+    for entry in dump[kind]:
+        if entry['name'] == name and entry['tags'] == tags:
+            return entry
+    return None
+
+
+def test_disabled_by_default(app):
+    assert app.metrics is None
+    assert app.respond(u'@color=blue') == \
+        [u'I will remember "color" for you repl_user.']
+
+
+def test_memory_sink(app):
+    sink = MemorySink()
+    app.instrument(sink)
+    app.respond(u'@color=blue')
+    app.respond(u'@color?')
+    app.respond(u'nothing')
+    dump = sink.dump()
+
+    # the mention routes are only checked against the first two lines
+    match = metric(dump, 'histograms', 'route.match',
+                   plugin='brain', handler='recall')
+    assert match['count'] == 2
+    handler = metric(dump, 'histograms', 'handler.time',
+                     plugin='brain', handler='remember')
+    assert handler['count'] == 1
+    assert handler['buckets'][-1] == (float('inf'), 1)
+    assert metric(dump, 'counters', 'storage.ops',
+                  plugin='brain', op='set')['value'] == 1
+    assert metric(dump, 'histograms', 'storage.time',
+                  plugin='brain', op='get')['count'] == 1
+
+
+def test_pipelined_storage_ops(app):
+    sink = MemorySink()
+    app.instrument(sink)
+    plugin = app.plugins[0]
+    with plugin.pipeline():
+        plugin.store('a', 1)
+        plugin.store('b', 2)
+    dump = sink.dump()
+    assert metric(dump, 'counters', 'storage.ops',
+                  plugin='brain', op='set')['value'] == 2
+    assert metric(dump, 'histograms', 'storage.time',
+                  plugin='brain', op='pipeline')['count'] == 1
+    assert metric(dump, 'histograms', 'storage.time',
+                  plugin='brain', op='set') is None
+
+
+def test_handler_errors(app):
+    sink = MemorySink()
+    app.register(Broken())
+    app.instrument(sink)
+    with pytest.raises(ValueError):
+        app.respond(u'break')
+    dump = sink.dump()
+    assert metric(dump, 'counters', 'handler.errors',
+                  plugin='broken', handler='explode')['value'] == 1
+    assert metric(dump, 'histograms', 'handler.time',
+                  plugin='broken', handler='explode')['count'] == 1
+
+
+def test_prometheus_format():
+    sink = PrometheusSink()
+    sink.incr('handler.errors', plugin='brain', handler='recall')
+    sink.timing('handler.time', 0.002, plugin='brain', handler='say "hi"')
+    lines = sink.render().splitlines()
+    assert '# TYPE botbot_handler_errors_total counter' in lines
+    assert ('botbot_handler_errors_total{handler="recall",plugin="brain"} 1'
+            in lines)
+    assert '# TYPE botbot_handler_time_seconds histogram' in lines
+    assert ('botbot_handler_time_seconds_bucket'
+            '{handler="say \\"hi\\"",plugin="brain",le="0.001"} 0' in lines)
+    assert ('botbot_handler_time_seconds_bucket'
+            '{handler="say \\"hi\\"",plugin="brain",le="+Inf"} 1' in lines)
+    assert ('botbot_handler_time_seconds_count'
+            '{handler="say \\"hi\\"",plugin="brain"} 1' in lines)
+
+
+def test_statsd_sink():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(5)
+    sink = StatsdSink(port=server.getsockname()[1])
+    sink.incr('storage.ops', plugin='brain', op='get')
+    sink.timing('handler.time', 0.0125, plugin='brain', handler='recall')
+    assert server.recv(512) == 'botbot.storage.ops.get.brain:1|c'
+    assert server.recv(512) == 'botbot.handler.time.recall.brain:12.500|ms'
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from botbot_plugins.base import BasePlugin, DummyApp
+from botbot_plugins.decorators import listens_to_all
+from botbot_plugins.metrics import MemorySink
+from botbot_plugins.plugins import brain, ping
+
+
+class Busy(BasePlugin):
+
+    def __init__(self):
+        super(Busy, self).__init__()
+        self.slug = 'busy'
+
+    @listens_to_all(ur'^spin$')
+    def spin(self, line):
+        return spin_for(0.02)
+
+
+def spin_for(seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        pass
+    return u'done'
+
+
+@pytest.fixture
+def app():
+    app_instance = DummyApp(test_plugin=ping.Plugin())
+    app_instance.register(brain.Plugin())
+    app_instance.register(Busy())
+    app_instance.storage.flushdb()
+    return app_instance
+
+
+def test_cprofile(app):
+    profile = app.profile([u'@ping', u'@a=b', u'@a?', u'spin', u'spin'])
+    handlers = profile.handlers()
+    assert handlers[0][0] == 'busy.spin'
+    assert handlers[0][2] == 2
+    assert set(key for key, _, _ in handlers) == set(
+        ['busy.spin', 'ping.respond_to_ping', 'brain.remember',
+         'brain.recall'])
+    assert any('spin_for' in name
+               for name, _, _ in profile.hot_functions('busy.spin'))
+    # every route rule was tried against each of the lines
+    assert dict((key, lines) for key, _, lines in profile.routes())[
+        'busy.spin'] == 5
+
+    report = profile.report()
+    assert report.startswith('Handlers by total time')
+    assert 'Hot functions in busy.spin' in report
+    for line in profile.collapsed():
+        stack, count = line.rsplit(' ', 1)
+        assert stack.split(';')[0] in dict(
+            (key, None) for key, _, _ in handlers)
+        assert int(count) > 0
+
+
+def test_sample(app):
+    profile = app.profile([u'spin'] * 5, mode='sample', interval=0.001)
+    stacks = list(profile.collapsed())
+    assert stacks
+    assert all(line.startswith('dispatch;') for line in stacks)
+    assert any(';busy.spin;' in line and 'spin_for' in line
+               for line in stacks)
+    assert any('spin_for' in name
+               for name, _, _ in profile.hot_functions('busy.spin'))
+
+
+def test_profile_restores_app(app, tmpdir):
+    sink = MemorySink()
+    app.instrument(sink)
+    profile = app.profile([u'@ping'])
+    assert app.metrics is sink
+    assert 'dispatch' not in app.__dict__
+    assert 'call_handler' not in app.__dict__
+    assert sink.dump()['histograms'] == []
+    assert app.respond(u'@ping') == \
+        [u'Are you in need of my services, repl_user?']
+
+    path = tmpdir.join('out.collapsed')
+    profile.write_collapsed(str(path))
+    assert path.read().splitlines() == list(profile.collapsed())
+
+
+def test_unknown_mode(app):
+    with pytest.raises(ValueError):
+        app.profile([u'@ping'], mode='perf')
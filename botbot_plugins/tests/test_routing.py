@@ -0,0 +1,101 @@
+import pytest
+from botbot_plugins.base import BasePlugin, DummyApp
+from botbot_plugins.decorators import listens_to_command
+from botbot_plugins.plugins import bangmotivate, jenkins, message_service, ping
+from botbot_plugins.routing import Route, literal_prefix
+
+
+@pytest.mark.parametrize(('rule', 'prefix'), [
+    (ur'^ping$', 'ping'),
+    (ur'^\!m (?P<nick>.+?)$', '!m '),
+    (ur'jenkins build (?P<job>[\w\-\_]+)', 'jenkins build '),
+    (ur'UPDATE:JIRA', 'update:jira'),
+    (ur'(.*)\bUPDATE:JIRA', ''),
+    (ur'(W|w)(hat|here|ho|hy|hen) .*?\?', ''),
+    (ur'(?x) a b', 'ab'),
+])
+def test_literal_prefix(rule, prefix):
+    assert literal_prefix(rule) == prefix
+
+
+def test_route_matches_case_insensitively():
+    route = Route(ur'^ping$', None)
+    assert route.match(u'PING', u'ping')
+    assert route.match(u'pong', u'pong') is None
+
+
+def test_routes_compiled_on_register():
+    app = DummyApp(test_plugin=ping.Plugin())
+    route = app.mentions_router['ping'][0]
+    assert route.pattern.pattern == ur'^ping$'
+    rule, func = route
+    assert func.__name__ == 'respond_to_ping'
+
+
+def test_prefix_mismatch_skips_handler():
+    app = DummyApp(test_plugin=jenkins.Plugin())
+    app.register(bangmotivate.Plugin())
+    assert app.respond(u'@Jenkins builds nothing') == []
+    assert app.respond(u'!M BotBot') == [u"You're doing good work, BotBot!"]
+
+
+@pytest.mark.parametrize(('rule', 'literals'), [
+    (ur'(?:.*)\b(?:GH|gh):(?P<repo>[\w\-\_]+)#?(?P<issues>\d+(?:,\d+)*)\b(?:.*)',
+     ('gh:',)),
+    (ur'(?:.*)\b(?:GH|gh)#?(?P<issues>\d+(?:,\d+)*)\b(?:.*)', ('gh',)),
+    (ur'(?:.*)\b(\w+-\d+)\b(?:.*)', ('-',)),
+    (ur'(.*)\bUPDATE:JIRA', ('update:jira',)),
+    (ur'seen\s*(?P<nick>[\w-]*)', ()),
+    (ur'(?P<key>.+?)=\s*(?P<value>.*)', ('=',)),
+    (ur'(image|img)( me)? (?P<image>.*)', ('im', ' ')),
+    (ur'(?:ab)+c', ('ab', 'c')),
+    (ur'(.*)', ()),
+])
+def test_required_literals(rule, literals):
+    assert Route(rule, None).literals == literals
+
+
+def test_route_stats():
+    app = DummyApp(test_plugin=ping.Plugin())
+    app.respond(u'@ping')
+    app.respond(u'@pingpong')
+    app.respond(u'@pong')
+    assert app.route_stats() == [{
+        'router': 'mentions',
+        'plugin': 'ping',
+        'rule': ur'^ping$',
+        'handler': 'respond_to_ping',
+        'skips': 1,
+        'misses': 1,
+        'hits': 1,
+    }]
+
+
+class Greeter(BasePlugin):
+    @listens_to_command(('join', 'NICK'))
+    def greet(self, line):
+        return u'Welcome {0}'.format(line.user)
+
+    @listens_to_command('PART', ur'^bye (?P<reason>.*)$')
+    def farewell(self, line, reason):
+        return u'Bye {0}, {1}'.format(line.user, reason)
+
+
+def test_command_routes():
+    app = DummyApp(test_plugin=Greeter())
+    assert app.firehose_router == {}
+    assert sorted(app.command_routers) == ['JOIN', 'NICK', 'PART']
+    assert app.respond(u'hello', User='george') == []
+    assert app.respond(u'joined', User='george', Command='JOIN') == [
+        u'Welcome george']
+    assert app.respond(u'bye for now', User='george', Command='PART') == [
+        u'Bye george, for now']
+
+
+def test_command_routes_skip_other_traffic():
+    app = DummyApp(test_plugin=message_service.Plugin())
+    app.respond(u'just chatting')
+    stats = app.route_stats()
+    assert [stat['router'] for stat in stats] == ['mentions', 'firehose:JOIN']
+    # the JOIN handler's regex didn't even run for the PRIVMSG
+    assert stats[1]['misses'] + stats[1]['hits'] + stats[1]['skips'] == 0
@@ -0,0 +1,70 @@
+import functools
+import os
+import signal
+
+import pytest
+from botbot_plugins.sharding import ShardedRunner, plugin_app
+
+
+@pytest.fixture
+def runner(request):
+    runner_instance = ShardedRunner(
+        functools.partial(plugin_app, ['brain', 'ping']),
+        processes=2, batch_size=3)
+    runner_instance.start()
+    request.addfinalizer(runner_instance.stop)
+    return runner_instance
+
+
+def channel_log(channels=4, lines=5):
+    for i in range(lines):
+        for channel in range(channels):
+            channel_name = '#channel{0}'.format(channel)
+            yield {'text': u'@count={0}'.format(i), 'Channel': channel_name}
+            yield {'text': u'@count?', 'Channel': channel_name}
+
+
+def recalled(results):
+    """The values recalled per channel, in the order they came back"""
+    values = {}
+    for packet, responses in results:
+        if packet['text'] == u'@count?':
+            values.setdefault(packet['Channel'], []).extend(responses)
+    return values
+
+
+def test_sharded_runner_keeps_channel_order(runner):
+    results = list(runner.respond_many(channel_log()))
+    assert len(results) == 40
+    assert recalled(results) == dict(
+        ('#channel{0}'.format(channel), [u'0', u'1', u'2', u'3', u'4'])
+        for channel in range(4))
+    assert set(runner.shard_for('#channel{0}'.format(channel))
+               for channel in range(4)) == set([0, 1])
+
+
+def test_sharded_runner_strings(runner):
+    results = list(runner.respond_many([u'@ping', u'nothing']))
+    assert results == [
+        ({'text': u'@ping'}, [u'Are you in need of my services, repl_user?']),
+        ({'text': u'nothing'}, []),
+    ]
+
+
+def test_sharded_runner_restarts_dead_worker(runner):
+    os.kill(runner.workers[0].pid, signal.SIGKILL)
+    runner.workers[0].join()
+    results = list(runner.respond_many(channel_log()))
+    assert runner.restarts == 1
+    assert len(results) == 40
+    assert all(len(values) == 5 for values in recalled(results).values())
+
+
+def test_sharded_runner_graceful_restart(runner):
+    for packet in channel_log(lines=2):
+        runner.submit(packet)
+    runner.restart(1)
+    assert runner.restarts == 1
+    assert runner.workers[1].is_alive()
+    results = list(runner.drain())
+    assert len(results) == 16
@@ -1,4 +1,9 @@
+import pytest
+from botbot_plugins import config
 from botbot_plugins.base import BasePlugin, DummyApp
+from botbot_plugins.engines import MemoryEngine
+from botbot_plugins.plugins import brain
+from botbot_plugins.storage import WriteBuffer
 
 
 bp = BasePlugin()
@@ -26,3 +31,180 @@ def test_incr():
     assert(bp.incr('counter') == 1)
     #incr key with current value of 1
     assert(bp.incr('counter') == 2)
+
+
+def test_store_many_and_retrieve_many():
+    "test storing and retrieving several values at once"
+    bp.store_many({'first': 'one', 'second': u'tw\xf6'})
+    assert(bp.retrieve_many(['second', 'missing', 'first']) ==
+           [u'tw\xf6', None, 'one'])
+    assert(bp.app.storage.get('base:first') == 'one')
+
+
+def test_pipeline():
+    "test that calls in a pipeline block are sent when it exits"
+    with bp.pipeline() as results:
+        bp.store('piped', 'value')
+        bp.incr('piped_counter')
+        assert(bp.app.storage.get('base:piped') is None)
+    assert(results == [True, 1])
+    assert(bp.retrieve('piped') == 'value')
+
+
+def test_pipeline_discarded_on_error():
+    "test that nothing is sent if the pipeline block raises"
+    try:
+        with bp.pipeline():
+            bp.store('never', 'stored')
+            raise ValueError()
+    except ValueError:
+        pass
+    assert(bp.retrieve('never') is None)
+    # the plugin talks to storage directly again
+    bp.store('after', 'stored')
+    assert(bp.retrieve('after') == 'stored')
+
+
+def test_retrieve_in_pipeline():
+    "test that reading in a pipeline is an error"
+    bp = BasePlugin()
+    bp.app = DummyApp()
+    bp.store('a', 'one')
+    with pytest.raises(ValueError):
+        with bp.pipeline():
+            bp.store('b', 'two')
+            bp.retrieve('a')
+    with pytest.raises(ValueError):
+        with bp.pipeline():
+            bp.retrieve_many(['a'])
+    # the pipeline was discarded
+    assert(bp.retrieve('b') is None)
+
+
+class CachingPlugin(BasePlugin):
+    read_cache_size = 10
+
+
+def caching_plugin():
+    plugin = CachingPlugin()
+    plugin.app = DummyApp()
+    return plugin
+
+
+def test_read_cache():
+    "test that retrieved values are served from memory until written"
+    plugin = caching_plugin()
+    plugin.store('fact', u'caf\xe9')
+    assert(plugin.retrieve('fact') == u'caf\xe9')
+    plugin.app.storage.set('base:fact', 'changed elsewhere')
+    assert(plugin.retrieve('fact') == u'caf\xe9')
+    assert(plugin.retrieve('missing') is None)
+    assert(plugin.retrieve('missing') is None)
+    stats = plugin.read_cache.stats()
+    assert((stats['hits'], stats['misses']) == (2, 2))
+    assert(plugin.app.cache_stats() == {})
+
+    plugin.store('fact', 'new')
+    assert(plugin.retrieve('fact') == 'new')
+    plugin.delete('fact')
+    assert(plugin.retrieve('fact') is None)
+    plugin.incr('count')
+    assert(plugin.retrieve('count') == '1')
+    plugin.incr('count')
+    assert(plugin.retrieve('count') == '2')
+
+
+def test_read_cache_many():
+    "test that retrieve_many only asks storage for the keys not cached"
+    plugin = caching_plugin()
+    plugin.store_many({'a': 'one', 'b': 'two'})
+    assert(plugin.retrieve('a') == 'one')
+    plugin.app.storage.set('base:a', 'changed elsewhere')
+    assert(plugin.retrieve_many(['b', 'a', 'c']) == ['two', 'one', None])
+    plugin.store_many({'a': 'three'})
+    assert(plugin.retrieve_many(['a', 'b']) == ['three', 'two'])
+
+
+def test_read_cache_pipeline():
+    "test that writes in a pipeline invalidate once they are sent"
+    plugin = caching_plugin()
+    plugin.store('a', 'one')
+    assert(plugin.retrieve('a') == 'one')
+    with plugin.pipeline():
+        plugin.store('a', 'two')
+    assert(plugin.retrieve('a') == 'two')
+
+
+class SlowEngine(MemoryEngine):
+    """Lets a read in while a write is on its way to storage"""
+    def set(self, name, value, ex=None):
+        self.during_write()
+        return MemoryEngine.set(self, name, value, ex=ex)
+
+
+def test_read_cache_racing_write():
+    "test that a read made during a write doesn't cache the old value"
+    plugin = CachingPlugin()
+    plugin.app = DummyApp(storage=SlowEngine())
+    plugin.app.storage.during_write = lambda: None
+    plugin.store('a', 'one')
+    plugin.app.storage.during_write = lambda: plugin.retrieve('a')
+    plugin.store('a', 'two')
+    assert(plugin.retrieve('a') == 'two')
+
+
+def test_cache_stats():
+    "test that the app reports the caches of its plugins"
+    app = DummyApp(test_plugin=brain.Plugin())
+    app.respond(u'@bacon=yes')
+    app.respond(u'@bacon?')
+    app.respond(u'@bacon?')
+    stats = app.cache_stats()['brain']
+    assert((stats['hits'], stats['misses']) == (1, 1))
+    assert(stats['hit_ratio'] == 0.5)
+
+
+class ExpiringConfig(config.BaseConfig):
+    storage_ttl = 60
+
+
+class ExpiringPlugin(BasePlugin):
+    config_class = ExpiringConfig
+
+
+def test_store_ttl():
+    "test that stored keys expire after the given or default ttl"
+    plugin = BasePlugin()
+    plugin.app = DummyApp()
+    plugin.store('forever', 'value')
+    plugin.store('brief', 'value', ttl=10)
+    assert(plugin.app.storage.ttl('base:forever') is None)
+    assert(plugin.app.storage.ttl('base:brief') == 10)
+    with pytest.raises(ValueError):
+        plugin.touch('forever')
+
+    plugin = ExpiringPlugin()
+    plugin.app = DummyApp()
+    plugin.store('default', 'value')
+    plugin.store('forever', 'value', ttl=0)
+    plugin.store_many({'a': 1, 'b': 2})
+    plugin.push('queue', 'item')
+    storage = plugin.app.storage
+    assert([storage.ttl(plugin._unique_key(key)) for key in
+            ['default', 'a', 'b', 'queue']] == [60, 60, 60, 60])
+    assert(storage.ttl(plugin._unique_key('forever')) is None)
+    assert(plugin.touch('forever') is True)
+    assert(storage.ttl(plugin._unique_key('forever')) == 60)
+    assert(plugin.touch('missing', 5) is False)
+
+
+def test_write_buffer_ttl():
+    "test that buffered writes keep their ttl"
+    storage = MemoryEngine()
+    buffered = WriteBuffer(storage)
+    buffered.set('a', 'one', ex=30)
+    buffered.set('b', 'two')
+    assert(buffered.get('a') == 'one')
+    buffered.flush()
+    assert(storage.ttl('a') == 30)
+    assert(storage.ttl('b') is None)
@@ -1,7 +1,7 @@
 import pytest
 from mock import patch
-import requests
 from botbot_plugins.base import DummyApp
+from botbot_plugins.http import CircuitOpen, HttpClient
 from botbot_plugins.plugins import wolfram
 
 
@@ -80,6 +80,22 @@ text='City data' />
 """
 
 
+class FakeUnknownResponse(object):
+    """Dummy response from Wolfram|Alpha to a question it can't answer"""
+    status_code = 200
+    content = "<queryresult success='false' error='false' numpods='0' />"
+
+
+class FakeInputOnlyResponse(object):
+    """Dummy response from Wolfram|Alpha with no pods but the question"""
+    status_code = 200
+    content = """<queryresult success='true' error='false' numpods='1'>
+<pod title='Input interpretation' id='Input'>
+  <subpod title=''><plaintext>gyre</plaintext></subpod>
+</pod>
+</queryresult>"""
+
+
 @pytest.fixture
 def app():
     app = DummyApp(test_plugin=wolfram.Plugin())
@@ -88,8 +104,8 @@ def app():
 
 
 def test_github(app):
-    # patch requests.get so we don't need to make a real call to GitHub
-    with patch.object(requests, 'get') as mock_get:
+    # patch the HTTP client so we don't need to make a real call to GitHub
+    with patch.object(HttpClient, 'get') as mock_get:
         mock_get.return_value = FakeResponse()
         responses = app.respond("@What is 9 am PST in UTC ?")
         mock_get.assert_called_with('http://api.wolframalpha.com/v2/query?',
@@ -98,3 +114,62 @@ def test_github(app):
                                         'appid': 'secret-appid'})
         expected = u'Q: convert 9:00 am PST | 11/03/2013 to UTC\nA: 4:00:00 pm GMT  |  Monday, March 11, 2013'
         assert responses == [expected]
+
+
+def test_cached_answer(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeResponse()
+        first = app.respond("@What is 9 am PST in UTC ?")
+        second = app.respond("@what   is 9 am pst in UTC?!")
+        assert mock_get.call_count == 1
+        assert first == second
+        assert first[0].startswith(u'Q: convert 9:00 am PST')
+
+
+def test_cached_unknown(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeUnknownResponse()
+        assert app.respond("@What is a gyre?") == [u"I don't know"]
+        assert app.respond("@what is a gyre?") == [u"I don't know"]
+        assert mock_get.call_count == 1
+
+
+def test_errors_not_cached(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value.content = 'not xml'
+        app.respond("@What is a gyre?")
+        app.respond("@What is a gyre?")
+        assert mock_get.call_count == 2
+
+
+def test_no_answer_not_cached(app):
+    with patch.object(HttpClient, 'get') as mock_get:
+        mock_get.return_value = FakeInputOnlyResponse()
+        assert app.respond("@What is a gyre?") == []
+        assert app.respond("@What is a gyre?") == []
+        assert mock_get.call_count == 2
+    assert not [key for key in app.storage.keys() if 'answer' in key]
+
+
+def test_cache_size(app):
+    with patch.object(wolfram.Plugin, 'cache_size', 2):
+        with patch.object(HttpClient, 'get') as mock_get:
+            mock_get.return_value = FakeUnknownResponse()
+            for question in ("@What is a?", "@What is b?", "@What is c?",
+                             "@What is b?", "@What is a?"):
+                app.respond(question)
+            # a was evicted to make room for c
+            assert mock_get.call_count == 4
+
+
+def test_normalize():
+    assert wolfram.normalize(u"  What's  $3.50 in GBP?! ") == \
+        u"what s $3.50 in gbp"
+
+
+def test_wolfram_down(app):
+    with patch.object(HttpClient, 'get', side_effect=CircuitOpen) as mock_get:
+        assert app.respond("@What is a gyre?") == \
+            ["Error reaching wolframalpha.com."]
+        app.respond("@What is a gyre?")
+        assert mock_get.call_count == 2
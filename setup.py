@@ -12,9 +12,9 @@ setup(
     install_requires=(
         'pytest==2.3.5',
         'mock==1.0.1',
-        'requests==1.2.3',
+        'requests==2.4.3',
         'defusedxml==0.4.1',
-        'fakeredis==0.3.1',
+        'redis==2.10.6',
     ),
     scripts=['bin/botbot-shell'],
 )